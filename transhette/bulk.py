@@ -0,0 +1,252 @@
+import os
+import re
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import threading
+import cPickle as pickle
+import multiprocessing
+
+from transhette import polib, journal, pocache, locking
+from transhette.pocache import get_signature, invalidate
+from transhette.poutil import find_pos, MergePlan
+from transhette.moutil import save_catalog
+from transhette.locking import get_lock
+from transhette.forms import _get_path_file, _get_lang_by_file
+from transhette.export import get_archive_name
+from transhette.utils import get_setting
+
+PLAN_FILENAME = 'plan.pickle'
+
+rx_catalog_path = re.compile(r'(^|/)locale/([^/]+)/LC_MESSAGES/[^/]+\.po$')
+
+
+def extract_catalogs(archive, directory):
+    """
+    Extracts the .po files of archive (a zip file or a tarball, file name or
+    file object) into directory. Returns their names in the archive.
+    """
+    names = []
+    if zipfile.is_zipfile(archive):
+        zf = zipfile.ZipFile(archive)
+        try:
+            for name in zf.namelist():
+                if _is_catalog_name(name):
+                    _write_member(directory, name, zf.read(name))
+                    names.append(name)
+        finally:
+            zf.close()
+        return names
+    if hasattr(archive, 'seek'):
+        archive.seek(0)
+    try:
+        if hasattr(archive, 'read'):
+            tf = tarfile.open(fileobj=archive, mode='r:*')
+        else:
+            tf = tarfile.open(archive, mode='r:*')
+    except tarfile.TarError:
+        raise ValueError('Not a zip file or a tarball')
+    try:
+        for member in tf:
+            if member.isfile() and _is_catalog_name(member.name):
+                _write_member(directory, member.name, tf.extractfile(member).read())
+                names.append(member.name)
+    finally:
+        tf.close()
+    return names
+
+
+def _is_catalog_name(name):
+    parts = name.split('/')
+    return name.endswith('.po') and '..' not in parts and not name.startswith('/')
+
+
+def _write_member(directory, name, data):
+    # member names are only trusted as relative paths, see _is_catalog_name()
+    fpath = os.path.join(directory, *name.split('/'))
+    if not os.path.isdir(os.path.dirname(fpath)):
+        os.makedirs(os.path.dirname(fpath))
+    fhandle = open(fpath, 'wb')
+    try:
+        fhandle.write(data)
+    finally:
+        fhandle.close()
+
+
+def resolve_destination(name, source_path, lang=None, include_djangos=False, include_transhette=False):
+    """
+    Catalog of the project that the uploaded catalog name (its path in the
+    archive, extracted to source_path) updates, None if there is none. The
+    include flags are the find_pos() ones the archive was downloaded with.
+    Archives made by the download views hold the catalog paths (see
+    export.get_archive_names()), that match the end of a single catalog
+    path; otherwise the destination comes from the metadata of the catalog,
+    see forms._get_path_file().
+    """
+    parts = name.split('/')
+    match = rx_catalog_path.search(name)
+    if match:
+        matches = [candidate for candidate in find_pos(match.group(2), include_djangos, include_transhette)
+                   if get_archive_name(candidate, len(parts)) == name]
+        if len(matches) == 1:
+            return matches[0]
+    # only the metadata is parsed
+    entries = polib.iter_pofile(source_path)
+    try:
+        path_file = _get_path_file(entries, parts[-1], lang)
+    finally:
+        entries.close()
+    if path_file in find_pos(_get_lang_by_file(path_file), include_djangos, include_transhette):
+        return path_file
+    return None
+
+
+def plan_catalog_merge(task):
+    """
+    The MergePlan of the catalog source_path into the catalog destination,
+    as {'name': name in the archive, 'fpath': destination, 'merge': plan}.
+    Runs in the processes of the pool, both catalogs are parsed once. The
+    destination is read like get_pofile() does, without its (forked) lock.
+    """
+    name, source_path, destination, priority = task
+    po = polib.pofile(destination)
+    journal.replay(po, journal.read(destination, get_signature(destination))[0])
+    merge = MergePlan(polib.pofile(source_path), po, priority)
+    return {'name': name, 'fpath': destination, 'merge': merge}
+
+
+def apply_catalog_merge(merge, fpath):
+    """
+    Applies the MergePlan merge to the catalog fpath as it is now, and saves
+    it, holding its lock. The merge is made on a copy of the catalog, the
+    cached one is shared with the requests being served and is parsed again
+    from the saved file. Returns the entries that changed.
+    """
+    lock = get_lock(fpath)
+    lock.acquire()
+    try:
+        po = polib.pofile(fpath)
+        records, po.journal_offset = journal.read(fpath, get_signature(fpath))
+        replayed = journal.replay(po, records)
+        entries = merge.apply(po)
+        if entries:
+            try:
+                save_catalog(po, replayed + entries)
+            finally:
+                invalidate(fpath)
+    finally:
+        lock.release()
+    return entries
+
+
+def store_merge_plan(merge):
+    """
+    Keeps the MergePlan merge in a temporary file until it is applied or
+    discarded, see get_merge_plan(). Returns the path of the file.
+    """
+    fd, fpath = tempfile.mkstemp(prefix='transhette-merge-', suffix='.pickle')
+    fhandle = os.fdopen(fd, 'wb')
+    try:
+        pickle.dump(merge, fhandle, pickle.HIGHEST_PROTOCOL)
+    finally:
+        fhandle.close()
+    return fpath
+
+
+def get_merge_plan(fpath):
+    """ The MergePlan kept by store_merge_plan(), None if it is gone """
+    try:
+        fhandle = open(fpath, 'rb')
+    except IOError:
+        return None
+    try:
+        return pickle.load(fhandle)
+    finally:
+        fhandle.close()
+
+
+def discard_merge_plan(fpath):
+    try:
+        os.remove(fpath)
+    except OSError:
+        pass
+
+
+def plan_bulk_update(archive, priority=False, lang=None, include_djangos=False, include_transhette=False):
+    """
+    Extracts the catalogs of archive into a temporary directory and plans
+    their merge into the project catalogs in a pool of processes (see
+    BULK_UPDATE_PROCESSES), the ones find_pos() returns with the include
+    flags. Returns the directory, where the plan is kept
+    until apply_bulk_update() or discard_bulk_update().
+    """
+    directory = tempfile.mkdtemp(prefix='transhette-update-')
+    try:
+        tasks = []
+        skipped = []
+        for name in extract_catalogs(archive, directory):
+            source_path = os.path.join(directory, *name.split('/'))
+            destination = resolve_destination(name, source_path, lang, include_djangos, include_transhette)
+            if destination is None:
+                skipped.append(name)
+            else:
+                tasks.append((name, source_path, destination, priority))
+        plans = _map(plan_catalog_merge, tasks)
+        fhandle = open(os.path.join(directory, PLAN_FILENAME), 'wb')
+        try:
+            pickle.dump({'plans': plans, 'skipped': skipped}, fhandle, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fhandle.close()
+    except:
+        shutil.rmtree(directory, True)
+        raise
+    return directory
+
+
+def get_bulk_update(directory):
+    """ {'plans': [plan, ...], 'skipped': [name, ...]} as planned by plan_bulk_update() """
+    fhandle = open(os.path.join(directory, PLAN_FILENAME), 'rb')
+    try:
+        return pickle.load(fhandle)
+    finally:
+        fhandle.close()
+
+
+def apply_bulk_update(directory):
+    """ Applies the plans kept in directory and discards them """
+    try:
+        for plan in get_bulk_update(directory)['plans']:
+            apply_catalog_merge(plan['merge'], plan['fpath'])
+    finally:
+        discard_bulk_update(directory)
+
+
+def discard_bulk_update(directory):
+    shutil.rmtree(directory, True)
+
+
+def _map(func, tasks):
+    processes = get_setting('BULK_UPDATE_PROCESSES') or multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+    if processes <= 1:
+        return map(func, tasks)
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        results = pool.map(func, tasks)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return results
+
+
+def _init_worker():
+    """
+    The pool is forked from a threaded process: locks held by other threads
+    at that moment would never be released in the workers.
+    """
+    pocache._lock = threading.RLock()
+    locking._lock = threading.Lock()
+    locking._locks = {}
@@ -0,0 +1,161 @@
+import os
+import threading
+
+from django.conf import settings
+from django.utils.encoding import smart_unicode
+from django.utils.translation import to_locale
+
+from transhette import polib
+from transhette.pocache import get_pofile, get_signature, replay_listeners
+from transhette.utils import get_setting
+
+
+def get_catalog_path(lang):
+    """
+    Path of the project catalog of lang, the one where conflicts are looked
+    for. Its directory can be named after the language code (pt-br), its
+    locale name (pt_BR) or the base language (pt).
+    """
+    names = [lang, to_locale(lang), lang.split('-')[0]]
+    for name in names:
+        fpath = os.path.join(settings.BASEDIR, 'locale', name, 'LC_MESSAGES', 'django.po')
+        if os.path.isfile(fpath):
+            return fpath
+    return os.path.join(settings.BASEDIR, 'locale', names[1], 'LC_MESSAGES', 'django.po')
+
+
+def get_reference_language():
+    """
+    The language of settings.LANGUAGES whose conflicts are shown by default:
+    CONFLICTS_REFERENCE_LANGUAGE or LANGUAGE_CODE (or their base language),
+    else the first one with a project catalog.
+    """
+    lang = get_setting('CONFLICTS_REFERENCE_LANGUAGE') or settings.LANGUAGE_CODE
+    codes = [code for code, _name in settings.LANGUAGES]
+    for code in [lang, lang.split('-')[0]] + codes:
+        if code in codes and os.path.isfile(get_catalog_path(code)):
+            return code
+    return lang
+
+
+def get_conflict_key(entry):
+    """ The msgstr that entry competes for, None for entries that can't conflict """
+    if entry.translated() and not entry.msgid_plural:
+        # edited entries hold unicode, parsed ones encoded strings
+        return smart_unicode(entry.msgstr, entry.encoding, errors='replace')
+    return None
+
+
+class ConflictIndex(object):
+    """
+    Groups the msgids of a catalog by their translation: msgids translated
+    into the same msgstr are conflicts, Django can't tell them apart when
+    the translation is used as a key (e.g. database values).
+    """
+
+    def __init__(self, po, signature):
+        self.signature = signature
+        # msgid -> msgstr and msgstr -> [msgid, ...]
+        self.msgstrs = {}
+        self.groups = {}
+        for entry in po:
+            self.set(entry.msgid, get_conflict_key(entry))
+
+    def set(self, msgid, msgstr):
+        old = self.msgstrs.get(msgid)
+        if old == msgstr:
+            return
+        if old is not None:
+            group = self.groups[old]
+            group.remove(msgid)
+            if not group:
+                del self.groups[old]
+        if msgstr is None:
+            self.msgstrs.pop(msgid, None)
+        else:
+            self.msgstrs[msgid] = msgstr
+            self.groups.setdefault(msgstr, []).append(msgid)
+
+    def update(self, po):
+        """ Regroups the entries of po that changed, see WorkingCopy.changed_ids for a working copy """
+        changed_ids = getattr(po, 'changed_ids', None)
+        if changed_ids is not None:
+            entries = [po[id] for id in changed_ids]
+        else:
+            entries = po
+            msgids = set([entry.msgid for entry in po])
+            for msgid in self.msgstrs.keys():
+                if msgid not in msgids:
+                    self.set(msgid, None)
+        for entry in entries:
+            self.set(entry.msgid, get_conflict_key(entry))
+
+    def get_conflicts(self):
+        """ [(msgstr, [msgid, ...]), ...] for every msgstr shared by several msgids """
+        return sorted([(msgstr, list(msgids)) for msgstr, msgids in self.groups.items() if len(msgids) > 1])
+
+
+_lock = threading.Lock()
+# absolute path -> ConflictIndex
+_indexes = {}
+
+
+def get_conflict_index(fpath):
+    """ Returns the ConflictIndex of the catalog fpath as it is on disk """
+    fpath = os.path.abspath(fpath)
+    signature = get_signature(fpath)
+    index = _indexes.get(fpath)
+    if index is None or index.signature != signature:
+        index = ConflictIndex(get_pofile(fpath), signature)
+        _lock.acquire()
+        try:
+            _indexes[fpath] = index
+        finally:
+            _lock.release()
+    return index
+
+
+def get_translation_conflicts(lang=None):
+    """
+    Conflicts of the project catalog of lang (the reference language by
+    default), with the translations of each msgid into every language of
+    settings.LANGUAGES and its occurrences.
+    """
+    lang = lang or get_reference_language()
+    main_po = get_pofile(get_catalog_path(lang))
+    po_list = []
+    for code, _name in settings.LANGUAGES:
+        fpath = get_catalog_path(code)
+        if os.path.isfile(fpath):
+            po_list.append((code, get_pofile(fpath)))
+
+    conflicts = []
+    for msgstr, msgids in get_conflict_index(main_po.fpath).get_conflicts():
+        conflict = {'msgstr': msgstr, 'conflict_list': []}
+        for msgid in msgids:
+            item = {'msgid': msgid, 'entries': [], 'occurrences': []}
+            for code, po in po_list:
+                entry = po.find(msgid)
+                if entry is not None and entry.translated():
+                    item['entries'].append({'lang': code, 'entry': entry})
+            for filename, line in main_po.find(msgid).occurrences:
+                item['occurrences'].append({'file': filename, 'line': line})
+            conflict['conflict_list'].append(item)
+        conflicts.append(conflict)
+    return conflicts
+
+
+def _on_save(po, fpath):
+    """ Keeps the index of a catalog saved (or replayed on, see pocache) by this process up to date """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        index = _indexes.get(fpath)
+        if index is not None:
+            index.update(po)
+            index.signature = get_signature(fpath)
+    finally:
+        _lock.release()
+
+polib.save_listeners.append(_on_save)
+replay_listeners.append(_on_save)
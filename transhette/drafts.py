@@ -0,0 +1,191 @@
+import os
+import copy
+
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
+from django.utils.encoding import smart_str
+
+from transhette import polib
+from transhette.pocache import get_pofile, get_signature
+from transhette.utils import get_setting
+from transhette.locking import get_lock
+from transhette.moutil import save_catalog
+
+
+class WorkingCopy(polib.POFile):
+    """
+    A translator's view of a catalog: it shares the entries of the cached
+    catalog except for the ones that have been edited, which are copied the
+    first time edit() is called for them.
+    """
+
+    def __init__(self, po):
+        super(WorkingCopy, self).__init__(fpath=po.fpath, wrapwidth=po.wrapwidth,
+                                          encoding=po.encoding)
+        self.header = po.header
+        self.metadata = po.metadata.copy()
+        self.metadata_is_fuzzy = po.metadata_is_fuzzy
+        self.signature = get_signature(po.fpath)
+        self.journal_offset = getattr(po, 'journal_offset', 0)
+        self.edited_ids = set()
+        # ids of the entries that save_catalog() replayed journal records on
+        self.replayed_ids = set()
+        # id -> version of the entry before it was edited
+        self.versions = {}
+        # msgids of the edits that could not be applied, see apply_edits()
+        self.conflicts = []
+        self.po = po
+        list.extend(self, po)
+        # msgid -> id, built on first use
+        self._ids = None
+
+    def changed_ids(self):
+        """ ids of the entries that differ from the catalog this working copy was made from """
+        return self.edited_ids | self.replayed_ids
+    changed_ids = property(changed_ids)
+
+    def get_id(self, msgid):
+        """ Position of the entry for msgid in this working copy, None if there is none """
+        if self._ids is None:
+            # the first entry of repeated msgids, like find()
+            self._ids = dict([(entry.msgid, id) for id, entry in reversed(list(enumerate(self)))])
+        return self._ids.get(msgid)
+
+    def find(self, st, by='msgid'):
+        # by msgid through get_id(): an index would make the entries shared
+        # with the cached catalog notify this working copy of their changes
+        if by == 'msgid':
+            id = self.get_id(st)
+            if id is None:
+                return None
+            return self[id]
+        return super(WorkingCopy, self).find(st, by)
+
+    def edit(self, id):
+        """ Returns entry id ready to be modified """
+        if id not in self.edited_ids:
+            self.versions[id] = get_entry_version(self[id])
+            entry = copy_entry(self[id])
+            self[id] = entry
+            self.edited_ids.add(id)
+        return self[id]
+
+    def get_edits(self):
+        """ [(msgid, version before the edit, state), ...] of the edited entries """
+        return [(self[id].msgid, self.versions[id], get_entry_state(self[id]))
+                for id in sorted(self.edited_ids)]
+
+    def apply_edits(self, edits):
+        """
+        Applies edits (see get_edits()) made on another version of the
+        catalog. Returns the msgids of the ones in conflict: entries that
+        changed since they were edited, into something else than the edit,
+        or that are gone. Those are not applied.
+        """
+        conflicts = []
+        for msgid, version, state in edits:
+            id = self.get_id(msgid)
+            if id is None:
+                conflicts.append(msgid)
+                continue
+            current_version = get_entry_version(self[id])
+            if current_version != version and current_version != get_state_version(state):
+                conflicts.append(msgid)
+                continue
+            set_entry_state(self.edit(id), state)
+            self.versions[id] = version
+        self.conflicts.extend(conflicts)
+        return conflicts
+
+    def rebase(self):
+        """
+        Returns (working copy, conflicts): the edits of this working copy on
+        the catalog as it is now on disk (see apply_edits()).
+        """
+        working_copy = get_working_copy(None, self.fpath)
+        working_copy.metadata = self.metadata.copy()
+        return working_copy, working_copy.apply_edits(self.get_edits())
+
+
+def copy_entry(entry):
+    new_entry = copy.copy(entry)
+    new_entry.occurrences = entry.occurrences[:]
+    new_entry.flags = entry.flags[:]
+    new_entry.msgstr_plural = entry.msgstr_plural.copy()
+    return new_entry
+
+
+def get_entry_version(entry):
+    """ Stamp of the translation of entry, that tells whether it changed """
+    return get_state_version(get_entry_state(entry))
+
+
+def get_state_version(state):
+    plurals = [(str(key), smart_str(msgstr)) for key, msgstr in state['msgstr_plural'].items()]
+    return md5_constructor(repr((smart_str(state['msgstr']), sorted(plurals)))).hexdigest()[:16]
+
+
+def get_entry_state(entry):
+    return {'msgstr': entry.msgstr,
+            'msgstr_plural': entry.msgstr_plural.copy(),
+            'flags': entry.flags[:]}
+
+
+def set_entry_state(entry, state):
+    entry.msgstr = state['msgstr']
+    entry.msgstr_plural = state['msgstr_plural'].copy()
+    entry.flags = state['flags'][:]
+
+
+def get_working_copy(user, fpath):
+    """
+    Returns the catalog of fpath with the unsaved edits of user (if any)
+    applied. Edits of entries that someone else changed in the meantime are
+    left out, in working_copy.conflicts.
+    """
+    po = get_pofile(fpath)
+    if len(po) and getattr(po[-1], 'id', None) != len(po) - 1:
+        for i in xrange(len(po)):
+            po[i].id = i
+    working_copy = WorkingCopy(po)
+    if user is not None:
+        draft = cache.get(_get_draft_key(user, fpath))
+        if draft is not None and working_copy.apply_edits(draft.get('edits', ())):
+            # the conflicts are reported once
+            save_draft(user, working_copy)
+    return working_copy
+
+
+def save_working_copy(working_copy):
+    """
+    Saves the edits of working_copy, with its .mo, holding the lock of the
+    catalog: they are moved onto the catalog as it is at that moment (see
+    WorkingCopy.rebase()), so edits of other entries made by someone else in
+    the meantime are kept. Returns the saved working copy, whose conflicts
+    are the edits that were not saved.
+    """
+    lock = get_lock(working_copy.fpath)
+    lock.acquire()
+    try:
+        working_copy = working_copy.rebase()[0]
+        save_catalog(working_copy, [working_copy[id] for id in working_copy.edited_ids])
+    finally:
+        lock.release()
+    return working_copy
+
+
+def save_draft(user, working_copy):
+    """ Keeps the edits of working_copy that could not be written to disk """
+    if working_copy.edited_ids:
+        cache.set(_get_draft_key(user, working_copy.fpath), {'edits': working_copy.get_edits()},
+                  get_setting('DRAFTS_TIMEOUT'))
+    else:
+        delete_draft(user, working_copy.fpath)
+
+
+def delete_draft(user, fpath):
+    cache.delete(_get_draft_key(user, fpath))
+
+
+def _get_draft_key(user, fpath):
+    return 'transhette_draft_%s_%s' % (user.pk, md5_constructor(os.path.abspath(fpath)).hexdigest())
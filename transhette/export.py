@@ -0,0 +1,98 @@
+import os
+import time
+import zipfile
+
+from transhette.pocache import get_pofile
+from transhette.moutil import MOWriter, get_mo_path
+
+
+class ZipStream(object):
+    """
+    Write-only file for zipfile.ZipFile that keeps what is written until it
+    is taken with pop(), so the archive can be sent while it is built.
+    ZipFile.writestr() needs no seeking, only tell().
+    """
+
+    def __init__(self):
+        self.data = []
+        self.offset = 0
+
+    def write(self, data):
+        self.data.append(data)
+        self.offset += len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = ''.join(self.data)
+        self.data = []
+        return data
+
+
+def iter_zip(members):
+    """
+    Yields the chunks of a zip archive of members, (name, contents) pairs
+    that are only asked for as the archive is sent.
+    """
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+    date_time = time.localtime()[:6]
+    for name, contents in members:
+        info = zipfile.ZipInfo(name, date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0644 << 16
+        archive.writestr(info, contents)
+        yield stream.pop()
+    archive.close()
+    yield stream.pop()
+
+
+def get_archive_name(fpath, depth=5):
+    """ The last depth components of the path of a catalog, e.g. app/locale/es/LC_MESSAGES/django.po """
+    return '/'.join(fpath.split(os.sep)[-depth:]).lstrip('/')
+
+
+def get_archive_names(fpaths):
+    """
+    {fpath: archive name} for the catalogs fpaths: get_archive_name(), with
+    as many more leading directories as needed to tell apart catalogs of
+    apps with the same name (e.g. a/shop/locale/... and b/shop/locale/...)
+    """
+    names = {}
+    pending = list(set(fpaths))
+    depth = 5
+    while pending:
+        by_name = {}
+        for fpath in pending:
+            by_name.setdefault(get_archive_name(fpath, depth), []).append(fpath)
+        pending = []
+        for name, paths in by_name.items():
+            if len(paths) == 1 or depth >= max([len(path.split(os.sep)) for path in paths]):
+                for path in paths:
+                    names[path] = name
+            else:
+                pending.extend(paths)
+        depth += 1
+    return names
+
+
+def iter_catalog_members(po, name):
+    """ The .po and the compiled .mo of po, compiled in memory, as zip members under name """
+    yield str(name), str(po)
+    yield str(get_mo_path(name)), MOWriter().compile(po)
+
+
+def iter_catalogs_members(fpaths):
+    """
+    Members of the catalogs fpaths, with their pending journaled edits.
+    Catalogs that are not already cached are not kept in memory.
+    """
+    names = get_archive_names(fpaths)
+    for fpath in fpaths:
+        po = get_pofile(fpath, cache=False)
+        for member in iter_catalog_members(po, names[fpath]):
+            yield member
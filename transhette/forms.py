@@ -1,3 +1,5 @@
+import tarfile
+import zipfile
 import tempfile
 from os import path, sep
 
@@ -6,7 +8,8 @@ from django.forms.util import ErrorList
 from django.conf import settings
 from django.template.loader import render_to_string
 
-from transhette import polib, poutil
+from transhette import poutil
+from transhette.pocache import get_pofile
 
 
 PO_PROJECT_BASE = 'po_project_base'
@@ -26,12 +29,13 @@ class UpdatePoForm(FormAdminDjango):
     priority = forms.BooleanField(required=False)
     file = forms.FileField()
 
-    def __init__(self, pofile, *args, **kwargs):
+    def __init__(self, po_path, *args, **kwargs):
+        """ po_path is the catalog to update, found from the uploaded one when None """
         super(UpdatePoForm, self).__init__(*args, **kwargs)
         self.fields['priority'].is_checkbox = True
         self.data_file = None
-        self.pofile = pofile
-        if not pofile:
+        self.po_path = po_path
+        if not po_path:
             application_choices = self._get_application_choices()
             self.fields['application'] = forms.ChoiceField(choices=application_choices, required=False)
 
@@ -44,9 +48,9 @@ class UpdatePoForm(FormAdminDjango):
 
     def clean(self):
         cleaned_data = super(UpdatePoForm, self).clean()
-        if not self.errors and not self.pofile:
+        if not self.errors and not self.po_path:
             try:
-                tmp_file, po_tmp, po_dest_file = self._get_files_to_merge()
+                tmp_file, po_tmp, po_dest_path = self._get_files_to_merge()
                 tmp_file.close()
             except IOError:
                 file_error = self._errors.get('file', ErrorList([]))
@@ -56,9 +60,9 @@ class UpdatePoForm(FormAdminDjango):
         return cleaned_data
 
     def save_temporal_file(self):
-        tmp_file, po_tmp, po_dest_file = self._get_files_to_merge()
+        tmp_file, po_tmp, po_dest_path = self._get_files_to_merge()
         tmp_file.flush()
-        return po_tmp, po_dest_file, self.cleaned_data['priority']
+        return po_tmp, po_dest_path, self.cleaned_data['priority']
 
     def _get_files_to_merge(self):
         # Escribo el archivo que ha mandado el usuario en un archivo temporal
@@ -69,17 +73,18 @@ class UpdatePoForm(FormAdminDjango):
             self.data_file = self.cleaned_data['file'].read()
         tmp_file.write(self.data_file)
         tmp_file.flush()
-        po_tmp = polib.pofile(temporal_filepath)
+        po_tmp = get_pofile(temporal_filepath, cache=False)
 
-        if not self.pofile:
-            # Consigo la ruta del archivo con el cual voy a hacer un merge, creo un pofile
-            path_file = _get_path_file(po_tmp, self.cleaned_data['file'].name,
+        if not self.po_path:
+            # Consigo la ruta del archivo con el cual voy a hacer un merge
+            po_dest_path = _get_path_file(po_tmp, self.cleaned_data['file'].name,
                         self.cleaned_data.get('language', None),
                         self.cleaned_data.get('application', None))
-            po_dest_file = polib.pofile(path_file)
+            if not path.isfile(po_dest_path):
+                raise IOError('No catalog at %s' % po_dest_path)
         else:
-            po_dest_file = self.pofile
-        return (tmp_file, po_tmp, po_dest_file)
+            po_dest_path = self.po_path
+        return (tmp_file, po_tmp, po_dest_path)
 
     def _get_application_choices(self):
         l = []
@@ -101,6 +106,32 @@ class UpdatePoForm(FormAdminDjango):
         return choices
 
 
+class BulkUpdatePoForm(FormAdminDjango):
+    language = forms.ChoiceField(required=False)
+    priority = forms.BooleanField(required=False)
+    file = forms.FileField()
+
+    def __init__(self, *args, **kwargs):
+        super(BulkUpdatePoForm, self).__init__(*args, **kwargs)
+        self.fields['priority'].is_checkbox = True
+        language_choices = [('', '-----')]
+        if hasattr(settings, 'LANGUAGES'):
+            language_choices.extend([(key, "%s (%s)" % (value, key)) \
+                                    for key, value in dict(settings.LANGUAGES).items()])
+        self.fields['language'].choices = language_choices
+
+    def clean_file(self):
+        archive = self.cleaned_data['file']
+        if not zipfile.is_zipfile(archive):
+            archive.seek(0)
+            try:
+                tarfile.open(fileobj=archive, mode='r:*').close()
+            except tarfile.TarError:
+                raise forms.ValidationError(u'Upload a zip file or a tarball of catalogs')
+        archive.seek(0)
+        return archive
+
+
 def _get_lang(lang, lang_cleaned_data=None):
     if lang_cleaned_data:
         return lang_cleaned_data
@@ -0,0 +1,223 @@
+import os
+import datetime
+
+from django.utils import simplejson
+from django.utils.encoding import smart_str, smart_unicode
+
+from transhette import polib
+from transhette.utils import get_setting, get_signature
+from transhette.locking import get_lock
+
+JOURNAL_SUFFIX = '.journal'
+HISTORY_SUFFIX = '.history'
+
+
+def get_journal_path(fpath):
+    return os.path.abspath(fpath) + JOURNAL_SUFFIX
+
+
+def get_history_path(fpath):
+    return os.path.abspath(fpath) + HISTORY_SUFFIX
+
+
+def make_record(entry, user):
+    """ Journal record that gives an entry the translation and flags of entry """
+    record = {'msgid': smart_unicode(entry.msgid, entry.encoding),
+              'flags': entry.flags[:],
+              'user': user,
+              'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+    if entry.msgid_plural:
+        record['msgstr_plural'] = dict([(str(key), smart_unicode(msgstr, entry.encoding))
+                                        for key, msgstr in entry.msgstr_plural.items()])
+    else:
+        record['msgstr'] = smart_unicode(entry.msgstr, entry.encoding)
+    return record
+
+
+def apply_record(entry, record):
+    if 'msgstr_plural' in record:
+        entry.msgstr_plural = dict([(str(key), msgstr) for key, msgstr in record['msgstr_plural'].items()])
+    else:
+        entry.msgstr = record['msgstr']
+    entry.flags = [str(flag) for flag in record['flags']]
+
+
+def replay(po, records):
+    """ Applies records to the entries of po, returns the entries that changed """
+    entries = []
+    for record in records:
+        entry = po.find(smart_str(record['msgid'], po.encoding))
+        if entry is None:
+            # gone from the catalog since the record was written
+            continue
+        apply_record(entry, record)
+        if not [e for e in entries if e is entry]:
+            entries.append(entry)
+    return entries
+
+
+def replay_stream(entries, records):
+    """ Yields the entries (e.g. a POFileIterator) with records applied """
+    if not records:
+        for entry in entries:
+            yield entry
+        return
+    last_records = {}
+    for record in records:
+        last_records[record['msgid']] = record
+    for entry in entries:
+        record = last_records.get(smart_unicode(entry.msgid, entry.encoding))
+        if record is not None:
+            apply_record(entry, record)
+        yield entry
+
+
+def _make_header(signature):
+    return simplejson.dumps({'signature': list(signature)}) + '\n'
+
+
+def append(fpath, records, signature, fsync=False):
+    """
+    Appends records to the journal of the catalog fpath, whose file has
+    signature (see pocache.get_signature()). A journal written for another
+    version of the catalog is retired first. The caller should hold the lock
+    of the catalog since it got signature.
+    """
+    path = get_journal_path(fpath)
+    header = _make_header(signature)
+    data = ''.join([simplejson.dumps(record) + '\n' for record in records])
+    lock = get_lock(fpath)
+    lock.acquire()
+    try:
+        _append(fpath, path, header, data, signature, fsync)
+    finally:
+        lock.release()
+
+
+def _append(fpath, path, header, data, signature, fsync):
+    current_header = _read_header(path)
+    if current_header is not None and current_header != header:
+        _retire(fpath, signature)
+        current_header = None
+    if current_header is None:
+        data = header + data
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0666)
+    try:
+        os.write(fd, data)
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def get_size(fpath):
+    try:
+        return os.stat(get_journal_path(fpath)).st_size
+    except OSError:
+        return 0
+
+
+def read(fpath, signature, offset=0):
+    """
+    Returns the records of the journal of fpath that follow offset, and the
+    offset where they end. No records are returned when the journal was
+    written for another version of the catalog than signature.
+    """
+    path = get_journal_path(fpath)
+    try:
+        fhandle = open(path, 'rb')
+    except IOError:
+        return [], 0
+    try:
+        header = fhandle.readline()
+        if header != _make_header(signature):
+            return [], 0
+        if offset:
+            fhandle.seek(offset)
+        data = fhandle.read()
+    finally:
+        fhandle.close()
+    offset = max(offset, len(header))
+    records = []
+    for line in data.splitlines(True):
+        if not line.endswith('\n'):
+            # still being written
+            break
+        records.append(simplejson.loads(line))
+        offset += len(line)
+    return records, offset
+
+
+def _read_header(path):
+    try:
+        fhandle = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        return fhandle.readline()
+    finally:
+        fhandle.close()
+
+
+def retire(fpath, signature=None, offset=None):
+    """
+    Removes the journal of fpath, or only if it was written for another
+    version of the catalog than signature, keeping its records in the
+    history file of the catalog when JOURNAL_HISTORY is set. With an offset
+    only the records before it are retired, the ones that follow are kept
+    in the journal of signature.
+    """
+    lock = get_lock(fpath)
+    lock.acquire()
+    try:
+        _retire(fpath, signature, offset)
+    finally:
+        lock.release()
+
+
+def _retire(fpath, signature, offset=None):
+    path = get_journal_path(fpath)
+    header = _read_header(path)
+    if header is None or signature is not None and header == _make_header(signature):
+        return
+    retired_path = '%s.%d' % (path, os.getpid())
+    try:
+        os.rename(path, retired_path)
+    except OSError:
+        # retired by someone else
+        return
+    fhandle = open(retired_path, 'rb')
+    try:
+        fhandle.readline()
+        data = fhandle.read()
+    finally:
+        fhandle.close()
+    if offset is not None:
+        position = max(offset - len(header), 0)
+        data, pending = data[:position], data[position:]
+        if pending:
+            _append(fpath, path, _make_header(signature), pending, signature, False)
+    if get_setting('JOURNAL_HISTORY') and data:
+        history = open(get_history_path(fpath), 'ab')
+        try:
+            history.write(data)
+        finally:
+            history.close()
+    os.remove(retired_path)
+
+
+def _on_save(po, fpath):
+    """
+    The records of the journal replayed on po (up to po.journal_offset, see
+    pocache.get_pofile()) are in the saved catalog, the ones that follow are
+    still to be replayed on the new version.
+    """
+    signature = get_signature(fpath)
+    header = _read_header(get_journal_path(fpath))
+    if header == _make_header(signature):
+        return
+    if header is not None:
+        retire(fpath, signature, getattr(po, 'journal_offset', 0))
+    po.journal_offset = 0
+
+polib.save_listeners.append(_on_save)
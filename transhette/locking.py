@@ -0,0 +1,70 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locks: only the threads of a process are serialized
+    fcntl = None
+
+LOCK_SUFFIX = '.lock'
+
+
+class CatalogLock(object):
+    """
+    Exclusive lock on a catalog, held while it is read, modified and written
+    back (its journal included). Threads are serialized with a reentrant
+    lock and processes with an fcntl advisory lock on <catalog>.lock, taken
+    by the outermost acquire() of the process.
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.lock_path = fpath + LOCK_SUFFIX
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0666)
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX)
+                except:
+                    os.close(fd)
+                    raise
+            except:
+                self.thread_lock.release()
+                raise
+            self.fd = fd
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self.fd)
+                self.fd = None
+        self.thread_lock.release()
+
+
+_lock = threading.Lock()
+# absolute path -> CatalogLock
+_locks = {}
+
+
+def get_lock(fpath):
+    """ Returns the CatalogLock of the catalog fpath, the same one for every thread """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        lock = _locks.get(fpath)
+        if lock is None:
+            lock = _locks[fpath] = CatalogLock(fpath)
+        return lock
+    finally:
+        _lock.release()
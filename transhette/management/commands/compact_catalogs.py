@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from transhette import journal
+from transhette.poutil import find_pos
+from transhette.writebehind import compact
+
+
+class Command(BaseCommand):
+    args = '[catalog catalog ...]'
+    help = ('Writes the edit journals of the given catalogs (every catalog of the project '
+            'languages by default) to their .po and .mo files.')
+
+    def handle(self, *fpaths, **options):
+        if not fpaths:
+            fpaths = []
+            for lang, _name in settings.LANGUAGES:
+                fpaths.extend(find_pos(lang, include_djangos=True, include_transhette=True))
+        for fpath in fpaths:
+            if journal.get_size(fpath):
+                compact(fpath)
+                self.stdout.write('%s\n' % fpath)
@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import smart_str
+
+from transhette.conflicts import get_translation_conflicts, get_reference_language, get_catalog_path
+
+
+class Command(BaseCommand):
+    args = '[lang lang ...]'
+    help = ('Lists the msgids of the project catalogs translated into the same msgstr. '
+            'Uses the reference language (CONFLICTS_REFERENCE_LANGUAGE) when no language is given.')
+
+    def handle(self, *langs, **options):
+        codes = [code for code, _name in settings.LANGUAGES]
+        for lang in langs or (get_reference_language(), ):
+            if lang not in codes:
+                raise CommandError('Unknown language: %s' % lang)
+            if not os.path.isfile(get_catalog_path(lang)):
+                raise CommandError('No catalog for %s: %s' % (lang, get_catalog_path(lang)))
+            conflicts = get_translation_conflicts(lang)
+            self.stdout.write('%s: %d conflicts\n' % (lang, len(conflicts)))
+            for conflict in conflicts:
+                self.stdout.write('  "%s"\n' % smart_str(conflict['msgstr']))
+                for item in conflict['conflict_list']:
+                    occurrences = ', '.join(['%s:%s' % (smart_str(o['file']), o['line']) for o in item['occurrences']])
+                    self.stdout.write('    "%s" %s\n' % (smart_str(item['msgid']), occurrences))
@@ -1,2 +1,5 @@
 from django.db import models
 # Create your models here.
+
+# connects the signals that keep the cached permissions up to date
+import transhette.permissions
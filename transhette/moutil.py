@@ -0,0 +1,513 @@
+import os
+import re
+import mmap
+import array
+import threading
+
+from transhette import polib, journal
+from transhette.pocache import get_signature
+from transhette.locking import get_lock
+from transhette.utils import get_setting
+
+MAGIC = 0x950412de
+# magic, revision, number of strings, offset of the key index, offset of the
+# value index, size of the hash table, offset of the hash table
+HEADER_SIZE = 7 * 4
+
+
+def hashpjw(st):
+    """ The hash function used by GNU gettext for the hash table of .mo files """
+    hval = 0
+    for c in st:
+        if c == '\0':
+            break
+        hval = (hval << 4) + ord(c)
+        g = hval & 0xf0000000
+        if g:
+            hval ^= g >> 24
+            hval ^= g
+    return hval
+
+
+def next_prime(n):
+    n |= 1
+    while True:
+        divisor = 3
+        while divisor * divisor <= n and n % divisor:
+            divisor += 2
+        if divisor * divisor > n:
+            return n
+        n += 2
+
+
+def get_hash_table_size(nstrings):
+    # same sizing as msgfmt
+    return max(next_prime(nstrings * 4 / 3), 3)
+
+
+def get_entry_key(entry):
+    key = entry._decode(entry.msgid)
+    if entry.msgid_plural:
+        key += '\0' + entry._decode(entry.msgid_plural)
+    return key
+
+
+def get_entry_value(entry):
+    if entry.msgid_plural and entry.msgstr_plural:
+        plurals = entry.msgstr_plural
+        indexes = sorted(plurals.keys(), key=int)
+        return '\0'.join([entry._decode(plurals[index]) for index in indexes])
+    return entry._decode(entry.msgstr)
+
+
+def get_metadata_value(po):
+    mentry = po.metadata_as_entry()
+    return mentry._decode(mentry.msgstr.replace('\\n', '').lstrip() + '\n')
+
+
+class MOWriter(object):
+    """
+    Compiles catalogs into .mo files. The sorted key table, the key strings and
+    the hash table of the last compilation are kept, so compiling the catalog
+    again after changing some translations only rebuilds the value offsets
+    that follow the first changed message.
+
+    Values are laid out in key order, except the metadata that goes last:
+    being rewritten on every save it would otherwise move every offset.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.values = []
+        self.positions = {}
+        self.hashes = {}
+        # key index, hash table and key strings: valid while the keys don't change
+        self.key_index = ''
+        self.key_data = ''
+        # length and absolute offset of the values, in layout order
+        self.value_lengths = array.array('I')
+        self.value_offsets = array.array('I')
+
+    def compile(self, po, entries=None):
+        """
+        Returns the .mo representation of po. If only some entries changed
+        since the last compilation they can be given to avoid walking po.
+        """
+        if entries is None or not self.keys:
+            messages = {'': get_metadata_value(po)}
+            for entry in po.translated_entries():
+                messages[get_entry_key(entry)] = get_entry_value(entry)
+            positions = self.positions
+            if len(messages) != len(self.keys) or [key for key in messages if key not in positions]:
+                self.rebuild(messages)
+                return self.get_binary()
+            changes = messages.iteritems()
+        else:
+            changes = [('', get_metadata_value(po))]
+            for entry in entries:
+                key = get_entry_key(entry)
+                if entry.translated() != (key in self.positions):
+                    # a message appears or disappears
+                    return self.compile(po)
+                if key in self.positions:
+                    changes.append((key, get_entry_value(entry)))
+        self.update_values(changes)
+        return self.get_binary()
+
+    def _get_layout_index(self, position):
+        if position == 0:
+            return len(self.keys) - 1
+        return position - 1
+
+    def rebuild(self, messages):
+        self.keys = sorted(messages.keys())
+        self.values = [messages[key] for key in self.keys]
+        self.positions = dict([(key, position) for position, key in enumerate(self.keys)])
+        nstrings = len(self.keys)
+        hash_size = get_hash_table_size(nstrings)
+
+        key_index = array.array('I')
+        offset = HEADER_SIZE + 16 * nstrings + 4 * hash_size
+        for key in self.keys:
+            key_index.append(len(key))
+            key_index.append(offset)
+            offset += len(key) + 1
+
+        hashes = {}
+        hash_table = array.array('I', [0] * hash_size)
+        for position, key in enumerate(self.keys):
+            hash_value = self.hashes.get(key)
+            if hash_value is None:
+                hash_value = hashpjw(key)
+            hashes[key] = hash_value
+            index = hash_value % hash_size
+            increment = 1 + hash_value % (hash_size - 2)
+            while hash_table[index]:
+                if index >= hash_size - increment:
+                    index -= hash_size - increment
+                else:
+                    index += increment
+            hash_table[index] = position + 1
+        self.hashes = hashes
+
+        self.key_index = key_index.tostring()
+        self.key_data = ''.join([hash_table.tostring(), '\0'.join(self.keys), '\0'])
+        self.values_start = offset
+        layout = self.values[1:] + self.values[:1]
+        self.value_lengths = array.array('I', [len(value) for value in layout])
+        self.value_offsets = array.array('I', [0] * nstrings)
+        self.update_value_offsets(0)
+
+    def update_values(self, changes):
+        first_change = None
+        for key, value in changes:
+            position = self.positions[key]
+            if self.values[position] != value:
+                self.values[position] = value
+                layout_index = self._get_layout_index(position)
+                self.value_lengths[layout_index] = len(value)
+                if first_change is None or layout_index < first_change:
+                    first_change = layout_index
+        if first_change is not None:
+            self.update_value_offsets(first_change)
+
+    def update_value_offsets(self, first):
+        offsets = self.value_offsets
+        lengths = self.value_lengths
+        if first == 0:
+            offset = self.values_start
+        else:
+            offset = offsets[first - 1] + lengths[first - 1] + 1
+        for layout_index in xrange(first, len(offsets)):
+            offsets[layout_index] = offset
+            offset += lengths[layout_index] + 1
+
+    def get_binary(self):
+        nstrings = len(self.keys)
+        value_index = array.array('I', [0] * (2 * nstrings))
+        # back from layout order to key order
+        value_index[0::2] = self.value_lengths[-1:] + self.value_lengths[:-1]
+        value_index[1::2] = self.value_offsets[-1:] + self.value_offsets[:-1]
+        header = array.array('I', [MAGIC, 0, nstrings, HEADER_SIZE, HEADER_SIZE + 8 * nstrings,
+                                   get_hash_table_size(nstrings), HEADER_SIZE + 16 * nstrings])
+        # values in layout order, each one followed by its NUL
+        layout = self.values[1:] + self.values[:1]
+        return ''.join([header.tostring(), self.key_index, value_index.tostring(), self.key_data,
+                        '\0'.join(layout), '\0'])
+
+
+# .mo path -> [MOWriter, signature of the file it wrote last]
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _get_signature(fpath):
+    """ get_signature() of fpath, None if it does not exist """
+    try:
+        return get_signature(fpath)
+    except OSError:
+        return None
+
+
+def _compile(po, fpath, entries):
+    """ Compiles po for fpath with the writer of the last compilation to it, if still valid """
+    writer, signature = _writers.get(fpath, (None, None))
+    if writer is None or signature != _get_signature(fpath):
+        writer = MOWriter()
+        entries = None
+    # the writer is only kept once its output is on disk
+    _writers.pop(fpath, None)
+    return writer, writer.compile(po, entries)
+
+
+def save_as_mofile(po, fpath, entries=None, fsync=False):
+    """
+    Compiles po into fpath, reusing the state of the last compilation to fpath
+    made by this process. entries are the ones changed since then, if known;
+    they are ignored when fpath was written by someone else in the meantime.
+    """
+    fpath = os.path.abspath(fpath)
+    _writers_lock.acquire()
+    try:
+        writer, contents = _compile(po, fpath, entries)
+        polib.write_file(fpath, contents, fsync)
+        _writers[fpath] = (writer, _get_signature(fpath))
+    finally:
+        _writers_lock.release()
+
+
+def get_mo_path(po_path):
+    return os.path.splitext(po_path)[0] + '.mo'
+
+
+def save_catalog(po, entries=None, fsync=None):
+    """
+    Saves po and its compiled .mo next to it as a pair: both files are
+    rendered to temporary files before any of them is replaced, and are
+    then renamed over the catalog files one right after the other. Files
+    whose contents do not change are not rewritten. entries are the ones
+    changed since the last save, see save_as_mofile(). fsync defaults to
+    the CATALOG_FSYNC setting.
+    """
+    if fsync is None:
+        fsync = get_setting('CATALOG_FSYNC')
+    po_path = os.path.abspath(po.fpath)
+    lock = get_lock(po_path)
+    lock.acquire()
+    try:
+        # records journaled since po was read are saved with it, the journal
+        # is retired up to them (see journal._on_save())
+        records, po.journal_offset = journal.read(po_path, get_signature(po_path),
+                                                  getattr(po, 'journal_offset', 0))
+        replayed = journal.replay(po, records)
+        if replayed and hasattr(po, 'replayed_ids'):
+            # a working copy, for the save listeners (see WorkingCopy.changed_ids)
+            po.replayed_ids.update([po.get_id(entry.msgid) for entry in replayed])
+        if entries is not None:
+            entries = list(entries) + replayed
+        mo_path = get_mo_path(po_path)
+        _writers_lock.acquire()
+        try:
+            writer, mo_contents = _compile(po, mo_path, entries)
+            po_tmp_path = polib.prepare_file(po_path, str(po), fsync)
+            try:
+                mo_tmp_path = polib.prepare_file(mo_path, mo_contents, fsync)
+            except:
+                if po_tmp_path is not None:
+                    os.remove(po_tmp_path)
+                raise
+            # the .po goes last: it is what tells the caches the catalog changed
+            if mo_tmp_path is not None:
+                polib.commit_file(mo_tmp_path, mo_path, fsync)
+            if po_tmp_path is not None:
+                polib.commit_file(po_tmp_path, po_path, fsync)
+            _writers[mo_path] = (writer, _get_signature(mo_path))
+        finally:
+            _writers_lock.release()
+        # retires the journal too
+        polib.notify_save_listeners(po, po_path)
+    finally:
+        lock.release()
+
+
+rx_charset = re.compile(r'charset=([\w_\-:\.]+)')
+
+
+class MappedMOFile(polib.MOFile):
+    """
+    Read-only MOFile backed by a memory map of the .mo file: the index tables
+    are decoded in bulk when the file is opened and entries are only built when
+    they are accessed, without being kept. find() by msgid uses the hash table
+    of the file and, when it has none or it misses, a binary search over the
+    sorted keys.
+    """
+
+    def __init__(self, fpath, wrapwidth=78):
+        super(MappedMOFile, self).__init__(fpath=fpath, wrapwidth=wrapwidth)
+        fhandle = open(fpath, 'rb')
+        try:
+            self.data = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            fhandle.close()
+        self.magic_number = self.data[:4]
+        if self.magic_number == array.array('I', [MAGIC]).tostring():
+            swap = False
+        elif self.magic_number == array.array('I', [MAGIC]).tostring()[::-1]:
+            swap = True
+        else:
+            self.data.close()
+            raise IOError('Invalid mo file, magic number is incorrect !')
+
+        def unpack(offset, count):
+            table = array.array('I')
+            table.fromstring(self.data[offset:offset + 4 * count])
+            if swap:
+                table.byteswap()
+            return table
+        header = unpack(0, 7)
+        self.version, self.nstrings = header[1], header[2]
+        self.key_index = unpack(header[3], 2 * self.nstrings)
+        self.value_index = unpack(header[4], 2 * self.nstrings)
+        self.hash_table = unpack(header[6], header[5])
+
+        # the first message is the metadata if its key is empty
+        if self.nstrings and self.key_index[0] == 0:
+            self.first = 1
+            self.metadata = self._parse_metadata(self.get_value(0))
+        else:
+            self.first = 0
+        match = rx_charset.search(self.metadata.get('Content-Type', ''))
+        if match:
+            self.encoding = match.group(1)
+
+    def close(self):
+        self.data.close()
+
+    def get_key(self, position):
+        length, offset = self.key_index[2 * position], self.key_index[2 * position + 1]
+        return self.data[offset:offset + length]
+
+    def get_value(self, position):
+        length, offset = self.value_index[2 * position], self.value_index[2 * position + 1]
+        return self.data[offset:offset + length]
+
+    def get_position(self, msgid):
+        """
+        Returns the position of the message for msgid, or None. Plural
+        messages are found by their msgid or by their whole key
+        (msgid\0msgid_plural, the msgid of polib.MOFile entries).
+        """
+        if len(self.hash_table) > 2:
+            hash_size = len(self.hash_table)
+            hash_value = hashpjw(msgid)
+            index = hash_value % hash_size
+            increment = 1 + hash_value % (hash_size - 2)
+            while self.hash_table[index]:
+                position = self.hash_table[index] - 1
+                if self._matches(position, msgid):
+                    return position
+                if index >= hash_size - increment:
+                    index -= hash_size - increment
+                else:
+                    index += increment
+            # compilers may hash plural keys differently, the keys are sorted anyway
+        low, high = 0, self.nstrings
+        while low < high:
+            middle = (low + high) / 2
+            if self.get_key(middle) < msgid:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.nstrings and self._matches(low, msgid):
+            return low
+        return None
+
+    def _matches(self, position, msgid):
+        key = self.get_key(position)
+        return key == msgid or key.split('\0', 1)[0] == msgid
+
+    def gettext(self, msgid):
+        """ Returns the raw translation of msgid, or None """
+        position = self.get_position(msgid)
+        if position is None:
+            return None
+        return self.get_value(position)
+
+    def find(self, st, by='msgid'):
+        if by == 'msgid':
+            position = self.get_position(st)
+            if position is None or position < self.first:
+                return None
+            return self._get_entry(position)
+        for entry in self:
+            if getattr(entry, by) == st:
+                return entry
+        return None
+
+    def _get_entry(self, position):
+        return polib.MOEntry(msgid=self.get_key(position), msgstr=self.get_value(position))
+
+    def _parse_metadata(self, msgstr):
+        # same parsing as polib._MOFileParser
+        metadata = {}
+        for line in msgstr.split('\n'):
+            tokens = line.split(':', 1)
+            if tokens[0] != '':
+                try:
+                    metadata[tokens[0]] = tokens[1].strip()
+                except IndexError:
+                    metadata[tokens[0]] = ''
+        return metadata
+
+    def __len__(self):
+        return self.nstrings - self.first
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for position in xrange(self.first, self.nstrings):
+            yield self._get_entry(position)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('list index out of range')
+        return self._get_entry(index + self.first)
+
+    def __getslice__(self, i, j):
+        return self[max(0, i):max(0, j):]
+
+    def __contains__(self, entry):
+        for other in self:
+            if other == entry:
+                return True
+        return False
+
+    def __getstate__(self):
+        raise TypeError("MappedMOFile can't be pickled, load it with polib.mofile() instead")
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('MappedMOFile is read-only, load it with polib.mofile() to modify it')
+
+    append = extend = __iadd__ = insert = remove = pop = _read_only
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = sort = reverse = _read_only
+
+
+def map_mofile(fpath, **kwargs):
+    """
+    Lazy counterpart of polib.mofile(): returns a MappedMOFile for fpath.
+    Call close() on it to release the mapping.
+    """
+    return MappedMOFile(fpath, wrapwidth=kwargs.get('wrapwidth', 78))
+
+
+if __name__ == '__main__':
+    """
+    Compares MOWriter with POFile.to_binary(): python -m transhette.moutil
+    """
+    import sys
+    import time
+    import gettext
+    from StringIO import StringIO
+
+    def build_catalog(size):
+        po = polib.POFile()
+        po.metadata['Content-Type'] = 'text/plain; charset=UTF-8'
+        for i in xrange(size):
+            po.append(polib.POEntry(msgid='Message number %d of the catalog' % i,
+                                    msgstr='Mensaje numero %d del catalogo' % i))
+        return po
+
+    def timeit(function, repeat=3):
+        best = None
+        for i in xrange(repeat):
+            start = time.time()
+            function()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best * 1000
+
+    sizes = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+    print '%8s %14s %14s %14s %14s' % ('entries', 'to_binary ms', 'MOWriter ms',
+                                      'recompile ms', 'given entry ms')
+    for size in sizes:
+        po = build_catalog(size)
+        writer = MOWriter()
+        translations = gettext.GNUTranslations(StringIO(writer.compile(po)))
+        assert translations.ugettext(u'Message number 7 of the catalog') == u'Mensaje numero 7 del catalogo'
+        entry = po[size / 2]
+
+        def change_one(entries=None):
+            entry.msgstr = entry.msgstr == 'a' and 'b' or 'a'
+            writer.compile(po, entries)
+        print '%8d %14.1f %14.1f %14.1f %14.1f' % (size, timeit(po.to_binary),
+                                                   timeit(lambda: MOWriter().compile(po)),
+                                                   timeit(change_one),
+                                                   timeit(lambda: change_one([entry])))
+        translations = gettext.GNUTranslations(StringIO(writer.compile(po)))
+        assert translations.ugettext(entry.msgid) == entry.msgstr
@@ -0,0 +1,110 @@
+import os
+import threading
+
+from transhette import polib
+from transhette.pocache import get_pofile, get_signature
+from transhette.poutil import find_pos
+
+
+class OwnershipIndex(object):
+    """
+    msgid -> path of the first catalog of a language that has it, in the
+    priority order of get_orderer_path_list(). That catalog is the one whose
+    translation is used, the "owner" of the msgid.
+    """
+
+    def __init__(self, fpaths):
+        self.fpaths = fpaths
+        self.signatures = {}
+        self.msgids = {}
+        self.owners = {}
+        for fpath in reversed(fpaths):
+            self.msgids[fpath] = self.read_msgids(fpath)
+            for msgid in self.msgids[fpath]:
+                self.owners[msgid] = fpath
+
+    def read_msgids(self, fpath):
+        """ The msgids of fpath, read without keeping the catalog in memory """
+        self.signatures[fpath] = get_signature(fpath)
+        entries = polib.iter_pofile(fpath)
+        try:
+            return set([entry.msgid for entry in entries])
+        finally:
+            entries.close()
+
+    def is_stale(self, fpaths):
+        if fpaths != self.fpaths:
+            return True
+        for fpath in fpaths:
+            try:
+                if get_signature(fpath) != self.signatures[fpath]:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def update(self, fpath, msgids, signature):
+        """ Replaces the msgids of the catalog fpath, moving the owners of those added or removed """
+        old_msgids = self.msgids[fpath]
+        self.msgids[fpath] = msgids
+        self.signatures[fpath] = signature
+        for msgid in msgids.symmetric_difference(old_msgids):
+            self.owners.pop(msgid, None)
+            for path in self.fpaths:
+                if msgid in self.msgids[path]:
+                    self.owners[msgid] = path
+                    break
+
+    def get_owner(self, msgid):
+        return self.owners.get(msgid)
+
+
+_lock = threading.Lock()
+# (lang, include_djangos, include_transhette) -> OwnershipIndex
+_indexes = {}
+
+
+def get_ownership_index(lang, include_djangos=False, include_transhette=False):
+    """ Returns the OwnershipIndex of the catalogs of lang, rebuilding it when any of them changed """
+    key = (lang, include_djangos, include_transhette)
+    fpaths = [os.path.abspath(fpath) for fpath in find_pos(lang, include_djangos, include_transhette)]
+    index = _indexes.get(key)
+    if index is None or index.is_stale(fpaths):
+        index = OwnershipIndex(fpaths)
+        _lock.acquire()
+        try:
+            _indexes[key] = index
+        finally:
+            _lock.release()
+    return index
+
+
+def get_owner(po, msgid, index):
+    """
+    Returns the (is_valid, catalog, entry) triple for msgid of po: whether
+    po is the catalog whose translation is used and, when it is not, the
+    catalog with higher priority and its entry for msgid. index is the
+    OwnershipIndex of the language of po, see get_ownership_index().
+    """
+    owner = index.get_owner(msgid)
+    if owner is None or owner == os.path.abspath(po.fpath):
+        return True, po, None
+    catalog = get_pofile(owner)
+    return False, catalog, catalog.find(msgid)
+
+
+def _on_save(po, fpath):
+    """ Moves the msgids of a catalog saved by this process in the indexes that have it """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        indexes = [index for index in _indexes.values() if fpath in index.msgids]
+        if indexes:
+            msgids = set([entry.msgid for entry in po])
+            signature = get_signature(fpath)
+            for index in indexes:
+                index.update(fpath, msgids, signature)
+    finally:
+        _lock.release()
+
+polib.save_listeners.append(_on_save)
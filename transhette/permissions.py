@@ -0,0 +1,105 @@
+import threading
+
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+
+from transhette.utils import get_setting
+
+TRANSLATORS_GROUP = 'translators'
+
+_lock = threading.Lock()
+# [id of the translators group], resolved once per process
+_translators = []
+
+
+def get_translators_group_id():
+    """ Id of the translators group, None when there is no such group """
+    if not _translators:
+        try:
+            group_id = Group.objects.get(name=TRANSLATORS_GROUP).pk
+        except Group.DoesNotExist:
+            # not remembered: the group may be created later
+            return None
+        _lock.acquire()
+        try:
+            del _translators[:]
+            _translators.append(group_id)
+        finally:
+            _lock.release()
+    return _translators[0]
+
+
+def can_translate(user):
+    """
+    Staff and members of the translators group can translate. Membership is
+    remembered by user (for the rest of the request) and in the cache until
+    the group or the groups of the user change.
+    """
+    if not user.is_authenticated():
+        return False
+    elif user.is_superuser or user.is_staff:
+        return True
+    is_translator = getattr(user, '_transhette_can_translate', None)
+    if is_translator is None:
+        is_translator = is_translator_member(user.pk)
+        user._transhette_can_translate = is_translator
+    return is_translator
+
+
+def is_translator_member(user_id):
+    group_id = get_translators_group_id()
+    if group_id is None:
+        return False
+    key = _get_member_key(user_id)
+    is_translator = cache.get(key)
+    if is_translator is None:
+        is_translator = Group.objects.filter(pk=group_id, user__pk=user_id).exists()
+        cache.set(key, is_translator, get_setting('PERMISSIONS_CACHE_TIMEOUT'))
+    return is_translator
+
+
+def _get_member_key(user_id):
+    return 'transhette_translator_%s' % user_id
+
+
+def _forget_members(user_ids):
+    cache.delete_many([_get_member_key(user_id) for user_id in user_ids])
+
+
+def _forget_group(group):
+    """ group changed: its members and, for the translators group, its id are looked up again """
+    if group.pk is None:
+        return
+    if group.name == TRANSLATORS_GROUP or group.pk in _translators:
+        _lock.acquire()
+        try:
+            del _translators[:]
+        finally:
+            _lock.release()
+    _forget_members(group.user_set.values_list('pk', flat=True))
+
+
+def _on_group_save(sender, instance, **kwargs):
+    _forget_group(instance)
+
+
+def _on_group_delete(sender, instance, **kwargs):
+    _forget_group(instance)
+
+
+def _on_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups changed
+        _forget_members([instance.pk])
+    elif pk_set is not None:
+        # group.user_set changed
+        _forget_members(pk_set)
+    else:
+        _forget_members(instance.user_set.values_list('pk', flat=True))
+
+post_save.connect(_on_group_save, sender=Group)
+pre_delete.connect(_on_group_delete, sender=Group)
+m2m_changed.connect(_on_groups_changed, sender=User.groups.through)
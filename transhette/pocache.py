@@ -0,0 +1,122 @@
+import os
+import threading
+
+from transhette import polib, journal
+from transhette.utils import get_setting, get_signature
+
+
+_lock = threading.RLock()
+# absolute path -> [signature, pofile, last use tick]
+_catalogs = {}
+_tick = [0]
+
+# callables notified with (po, fpath) when journal records are replayed on the
+# cached catalog, which changes it without saving it (see polib.save_listeners)
+replay_listeners = []
+
+
+def get_pofile(fpath, cache=True):
+    """
+    Returns the parsed catalog of fpath, parsing it only when it is not cached
+    or it has changed on disk since it was parsed (it is not kept when cache
+    is False, e.g. for one-off reads of many catalogs). The records of its
+    edit journal are replayed on it, the ones appended since the last call
+    on the cached catalog (the replay listeners are notified of them), and
+    po.journal_offset is where they end.
+
+    The returned POFile is shared by every caller of the process: callers that
+    modify it must either save it or call invalidate() afterwards.
+    """
+    fpath = os.path.abspath(fpath)
+    try:
+        signature = get_signature(fpath)
+    except OSError, e:
+        # behave like polib.pofile() when the file can't be read
+        raise IOError(e.errno, e.strerror, fpath)
+    records = None
+    _lock.acquire()
+    try:
+        cached = _catalogs.get(fpath)
+        if cached is not None and cached[0] == signature:
+            _tick[0] += 1
+            cached[2] = _tick[0]
+            po = cached[1]
+            if journal.get_size(fpath) > po.journal_offset:
+                records, po.journal_offset = journal.read(fpath, signature, po.journal_offset)
+                journal.replay(po, records)
+    finally:
+        _lock.release()
+    if cached is not None and cached[0] == signature:
+        if records:
+            notify_replay_listeners(po, fpath)
+        return po
+
+    po = polib.pofile(fpath)
+    records, po.journal_offset = journal.read(fpath, signature)
+    journal.replay(po, records)
+    if not cache:
+        return po
+
+    _lock.acquire()
+    try:
+        _tick[0] += 1
+        _catalogs[fpath] = [signature, po, _tick[0]]
+        _evict()
+    finally:
+        _lock.release()
+    return po
+
+
+def notify_replay_listeners(po, fpath):
+    """ Calls the replay_listeners for po, the catalog of fpath with journal records replayed on it """
+    for listener in replay_listeners:
+        listener(po, fpath)
+
+
+def invalidate(fpath):
+    """ Forgets the cached catalog of fpath, if any """
+    _lock.acquire()
+    try:
+        _catalogs.pop(os.path.abspath(fpath), None)
+    finally:
+        _lock.release()
+
+
+def clear():
+    _lock.acquire()
+    try:
+        _catalogs.clear()
+    finally:
+        _lock.release()
+
+
+def _evict():
+    """ Drops the least recently used catalogs until the cache fits in CATALOG_CACHE_MAX_ENTRIES """
+    max_entries = get_setting('CATALOG_CACHE_MAX_ENTRIES')
+    total = sum([len(cached[1]) for cached in _catalogs.values()])
+    while total > max_entries and len(_catalogs) > 1:
+        fpath = min(_catalogs, key=lambda path: _catalogs[path][2])
+        total -= len(_catalogs.pop(fpath)[1])
+
+
+def _on_save(po, fpath):
+    """
+    Keeps the cache coherent with POFile.save(): when the cached instance is the
+    one being saved it stays cached under its new signature, otherwise the stale
+    entry is dropped.
+    """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        cached = _catalogs.get(fpath)
+        if cached is None:
+            return
+        if cached[1] is po:
+            # journal._on_save() moved po.journal_offset to the new journal
+            cached[0] = get_signature(fpath)
+        else:
+            del _catalogs[fpath]
+    finally:
+        _lock.release()
+
+polib.save_listeners.append(_on_save)
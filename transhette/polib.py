@@ -47,15 +47,18 @@ __version__   = '0.3.1'
 
 # dependencies {{{
 try:
+    import os
     import struct
+    import tempfile
     import textwrap
     import warnings
+    import weakref
 except ImportError, exc:
     raise ImportError('polib requires python 2.3 or later with the standard' \
         ' modules "struct", "textwrap" and "warnings" (details: %s)' % exc)
 # }}}
 
-__all__ = ['pofile', 'POFile', 'POEntry', 'mofile', 'MOFile', 'MOEntry',
+__all__ = ['pofile', 'iter_pofile', 'POFile', 'POFileIterator', 'POEntry', 'mofile', 'MOFile', 'MOEntry',
            'detect_encoding', 'quote', 'unquote']
 
 # shortcuts for performance improvement {{{
@@ -63,6 +66,8 @@ __all__ = ['pofile', 'POFile', 'POEntry', 'mofile', 'MOFile', 'MOEntry',
 _dictget    = dict.get
 _listappend = list.append
 _listpop    = list.pop
+_objsetattr = object.__setattr__
+_newpoentry = object.__new__
 _strjoin    = str.join
 _strsplit   = str.split
 _strstrip   = str.strip
@@ -72,6 +77,101 @@ _textwrap   = textwrap.wrap
 
 default_encoding = 'utf-8'
 
+# entry attributes that find() looks up through a hash index instead of
+# walking the whole file
+_indexed_fields = ('msgid', 'msgstr')
+
+# callables notified with (instance, fpath) each time the text representation
+# of a file is saved, used by applications that keep parsed files around
+save_listeners = []
+
+
+def notify_save_listeners(instance, fpath):
+    """
+    Calls the save_listeners for *instance*, saved to *fpath* by other means
+    than save() (e.g. together with other files).
+    """
+    for listener in save_listeners:
+        listener(instance, fpath)
+
+
+def prepare_file(fpath, contents, fsync=False):
+    """
+    Writes *contents* to a temporary file in the directory of *fpath*, with
+    the permissions of *fpath*, and returns its path for commit_file().
+    Returns None when *fpath* already holds *contents*.
+
+    **Keyword arguments**:
+      - *fpath*: string, full or relative path to the file.
+      - *contents*: string, the data to write.
+      - *fsync*: boolean, whether to flush the data to disk before returning.
+    """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        st = None
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0666 & ~umask
+    else:
+        mode = st.st_mode & 07777
+        if st.st_size == len(contents):
+            fhandle = open(fpath, 'rb')
+            try:
+                if fhandle.read() == contents:
+                    return None
+            finally:
+                fhandle.close()
+    dirname, basename = os.path.split(os.path.abspath(fpath))
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % basename, suffix='.tmp', dir=dirname)
+    try:
+        try:
+            os.write(fd, contents)
+            if fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.chmod(tmp_path, mode)
+    except:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def commit_file(tmp_path, fpath, fsync=False):
+    """
+    Replaces *fpath* with the temporary file *tmp_path* of prepare_file(),
+    readers see either the old or the new contents.
+    """
+    try:
+        os.rename(tmp_path, fpath)
+    except OSError:
+        if os.name != 'nt' or not os.path.exists(fpath):
+            os.remove(tmp_path)
+            raise
+        # windows can't rename over an existing file
+        os.remove(fpath)
+        os.rename(tmp_path, fpath)
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(fpath)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def write_file(fpath, contents, fsync=False):
+    """
+    Atomically replaces the contents of *fpath*: see prepare_file() and
+    commit_file(). Returns False when the file already held *contents*.
+    """
+    tmp_path = prepare_file(fpath, contents, fsync)
+    if tmp_path is None:
+        return False
+    commit_file(tmp_path, fpath, fsync)
+    return True
+
+
 def pofile(fpath, **kwargs):
     """
     Convenience function that parse the po/pot file *fpath* and return
@@ -85,6 +185,8 @@ def pofile(fpath, **kwargs):
         not try to detect the po file encoding (optional, default to True)
       - *encoding*: string, an encoding, only relevant if autodetect_encoding
         is set to False
+      - *parser*: string, 'fast' (the default) for the table driven lexer or
+        'fsm' for the finite state machine, both give the same result
 
     **Example**:
 
@@ -110,18 +212,69 @@ def pofile(fpath, **kwargs):
     ...         os.unlink(tmpf)
     """
     # pofile {{{
-    if _dictget(kwargs, 'autodetect_encoding', True) == True:
-        enc = detect_encoding(fpath)
-    else:
-        enc = _dictget(kwargs, 'encoding', default_encoding)
-    parser = _POFileParser(fpath)
+    parser = _get_po_parser(fpath, kwargs)
     instance = parser.parse()
     instance.wrapwidth = _dictget(kwargs, 'wrapwidth', 78)
-    instance.encoding  = enc
+    instance.encoding  = _metadata_encoding(instance.metadata, kwargs)
     return instance
     # }}}
 
 
+def iter_pofile(fpath, **kwargs):
+    """
+    Convenience function that parses the po/pot file *fpath* lazily and
+    returns a POFileIterator, that yields the POEntry instances as they are
+    parsed. Its header, metadata and encoding are available before the first
+    entry is requested.
+
+    Keyword arguments are the ones of pofile().
+
+    **Example**:
+
+    >>> import polib
+    >>> entries = polib.iter_pofile('tests/test_utf8.po')
+    >>> entries.encoding
+    'UTF-8'
+    >>> po = polib.pofile('tests/test_utf8.po')
+    >>> [e.msgid for e in entries] == [e.msgid for e in po]
+    True
+    """
+    # iter_pofile {{{
+    return POFileIterator(fpath, **kwargs)
+    # }}}
+
+
+def _get_po_parser(fpath, kwargs):
+    """
+    Return the po parser selected by the *parser* keyword argument.
+    """
+    # _get_po_parser {{{
+    parser = _dictget(kwargs, 'parser', 'fast')
+    if parser == 'fast':
+        return _FastPOFileParser(fpath)
+    elif parser == 'fsm':
+        return _POFileParser(fpath)
+    raise ValueError('Unknown po parser: %r' % parser)
+    # }}}
+
+
+def _metadata_encoding(metadata, kwargs):
+    """
+    Return the encoding declared in the *metadata* of a po file, honouring
+    the *autodetect_encoding* and *encoding* keyword arguments of pofile().
+    """
+    # _metadata_encoding {{{
+    if _dictget(kwargs, 'autodetect_encoding', True) == True:
+        import re
+        match = re.search(r'charset=([\w_\-:\.]+)',
+                          _dictget(metadata, 'Content-Type', ''))
+        if match:
+            return match.group(1)
+        return default_encoding
+    return _dictget(kwargs, 'encoding', default_encoding)
+    # }}}
+
+
 def mofile(fpath, **kwargs):
     """
     Convenience function that parse the mo file *fpath* and return
@@ -234,6 +387,8 @@ def unquote(st):
     '\\t and \\n and \\r and " and \\\\'
     """
     # unquote {{{
+    if '\\' not in st:
+        return st
     st = _strreplace(st, r'\"', '"')
     st = _strreplace(st, r'\n', '\n')
     st = _strreplace(st, r'\r', '\r')
@@ -250,6 +405,11 @@ class _BaseFile(list):
     """
     # class _BaseFile {{{
 
+    # find() indexes, {attribute: {value: first entry with that value}}.
+    # None until find() is used for the first time; from then on every entry
+    # of the file knows the file, so that changes of its indexed attributes
+    # keep the indexes up to date.
+    _indexes = None
 
     def __init__(self, fpath=None, wrapwidth=78, encoding=default_encoding):
         """
@@ -289,6 +449,157 @@ class _BaseFile(list):
         """Return the official string representation of the object."""
         return '<%s instance at %x>' % (self.__class__.__name__, id(self))
 
+    def __getstate__(self):
+        """Indexes are not pickled, they are rebuilt on demand."""
+        state = self.__dict__.copy()
+        state.pop('_indexes', None)
+        return state
+
+    # list methods overriden to keep find() indexes up to date {{{
+
+    def append(self, entry):
+        list.append(self, entry)
+        if self._indexes is not None:
+            self._index_added(entry, True)
+
+    def extend(self, entries):
+        entries = list(entries)
+        list.extend(self, entries)
+        if self._indexes is not None:
+            for entry in entries:
+                self._index_added(entry, True)
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+    def insert(self, pos, entry):
+        list.insert(self, pos, entry)
+        if self._indexes is not None:
+            self._index_added(entry, False)
+
+    def remove(self, entry):
+        list.remove(self, entry)
+        if self._indexes is not None:
+            self._index_removed(entry)
+
+    def pop(self, *args):
+        entry = list.pop(self, *args)
+        if self._indexes is not None:
+            self._index_removed(entry)
+        return entry
+
+    def __setitem__(self, pos, value):
+        if self._indexes is None:
+            return list.__setitem__(self, pos, value)
+        if isinstance(pos, slice):
+            old_entries = list.__getitem__(self, pos)
+            list.__setitem__(self, pos, value)
+            self._index_replaced(old_entries, list.__getitem__(self, pos))
+        else:
+            old_entry = list.__getitem__(self, pos)
+            list.__setitem__(self, pos, value)
+            self._index_removed(old_entry)
+            self._index_added(value, False)
+
+    def __delitem__(self, pos):
+        if self._indexes is None:
+            return list.__delitem__(self, pos)
+        old_entries = list.__getitem__(self, pos)
+        list.__delitem__(self, pos)
+        if isinstance(pos, slice):
+            self._index_replaced(old_entries, [])
+        else:
+            self._index_removed(old_entries)
+
+    def __setslice__(self, i, j, entries):
+        self.__setitem__(slice(max(i, 0), max(j, 0)), entries)
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(max(i, 0), max(j, 0)))
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        if self._indexes:
+            # the first entry of repeated values may have changed
+            self._indexes.clear()
+
+    def reverse(self):
+        list.reverse(self)
+        if self._indexes:
+            self._indexes.clear()
+
+    def _get_index(self, by):
+        """
+        Return the index of attribute *by*, building it if needed. Indexes
+        are (first entry by value, values shared by several entries) pairs.
+        """
+        if self._indexes is None:
+            self._indexes = {}
+            for entry in self:
+                entry._add_owner(self)
+        index = _dictget(self._indexes, by)
+        if index is None:
+            index = ({}, set())
+            entries, repeated = index
+            for entry in self:
+                value = getattr(entry, by)
+                if value in entries:
+                    repeated.add(value)
+                else:
+                    entries[value] = entry
+            self._indexes[by] = index
+        return index[0]
+
+    def _index_added(self, entry, last):
+        entry._add_owner(self)
+        for by in self._indexes.keys():
+            self._index_value_added(by, entry, getattr(entry, by), last)
+
+    def _index_removed(self, entry):
+        entry._remove_owner(self)
+        for by in self._indexes.keys():
+            self._index_value_removed(by, entry, getattr(entry, by))
+
+    def _index_replaced(self, old_entries, new_entries):
+        for entry in old_entries:
+            entry._remove_owner(self)
+        for entry in new_entries:
+            entry._add_owner(self)
+        # order related changes: let the indexes be rebuilt lazily
+        self._indexes.clear()
+
+    def _index_changed(self, entry, by, old_value, new_value):
+        """
+        Called by the entries of the file when attribute *by* changes.
+        """
+        if by in self._indexes:
+            self._index_value_removed(by, entry, old_value)
+        if by in self._indexes:
+            self._index_value_added(by, entry, new_value, False)
+
+    def _index_value_added(self, by, entry, value, last):
+        entries, repeated = self._indexes[by]
+        current = _dictget(entries, value)
+        if current is None:
+            entries[value] = entry
+        elif current is not entry:
+            repeated.add(value)
+            if not last:
+                # the new entry could be placed before the indexed one
+                del self._indexes[by]
+
+    def _index_value_removed(self, by, entry, value):
+        entries, repeated = self._indexes[by]
+        if _dictget(entries, value) is entry:
+            del entries[value]
+            if value in repeated:
+                for other in self:
+                    if other is not entry and getattr(other, by) == value:
+                        entries[value] = other
+                        break
+    # }}}
+
     def metadata_as_entry(self):
         """Return the metadata as an entry"""
         e = POEntry(msgid='')
@@ -303,33 +614,33 @@ class _BaseFile(list):
             e.msgstr = _strjoin('\n', strs) + '\n'
         return e
 
-    def save(self, fpath=None, repr_method='__str__'):
+    def save(self, fpath=None, repr_method='__str__', fsync=False):
         """
         Save the po file to file *fpath* if no file handle exists for
         the object. If there's already an open file and no fpath is
         provided, then the existing file is rewritten with the modified
-        data.
+        data. The file is replaced atomically (see write_file()) and left
+        untouched when its contents do not change.
 
         **Keyword arguments**:
           - *fpath*: string, full or relative path to the file.
           - *repr_method*: string, the method to use for output.
+          - *fsync*: boolean, whether to flush the file to disk.
         """
         if self.fpath is None and fpath is None:
             raise IOError('You must provide a file path to save() method')
         contents = getattr(self, repr_method)()
         if fpath is None:
             fpath = self.fpath
-        mode = 'w'
-        if repr_method == 'to_binary':
-            mode += 'b'
-        fhandle = open(fpath, mode)
-        fhandle.write(contents)
-        fhandle.close()
+        write_file(fpath, contents, fsync)
+        if repr_method == '__str__':
+            notify_save_listeners(self, fpath)
 
     def find(self, st, by='msgid'):
         """
         Find entry which msgid (or property identified by the *by*
-        attribute) matches the string *st*.
+        attribute) matches the string *st*. Lookups by msgid or msgstr
+        go through a hash index built on first use.
 
         **Keyword arguments**:
           - *st*: string, the string to search for
@@ -348,10 +659,12 @@ class _BaseFile(list):
         >>> entry.msgid
         'Thursday'
         """
-        try:
-            return [e for e in self if getattr(e, by) == st][0]
-        except IndexError:
-            return None
+        if by in _indexed_fields:
+            return _dictget(self._get_index(by), st)
+        for e in self:
+            if getattr(e, by) == st:
+                return e
+        return None
 
     def ordered_metadata(self):
         """
@@ -527,10 +840,14 @@ class POFile(_BaseFile):
         >>> po.percent_translated()
         100
         """
-        total = len([e for e in self if not e.obsolete])
+        total = translated = 0
+        for e in self:
+            if not e.obsolete:
+                total += 1
+                if e.translated():
+                    translated += 1
         if total == 0:
             return 100
-        translated = len(self.translated_entries())
         return int((100.00 / float(total)) * translated)
 
     def translated_entries(self):
@@ -633,6 +950,49 @@ class POFile(_BaseFile):
     # }}}
 
 
+class POFileIterator(object):
+    """
+    Iterator over the entries of a po file that are parsed as they are
+    requested, see iter_pofile(). The header, metadata, metadata_is_fuzzy,
+    encoding and wrapwidth attributes mirror the ones of POFile.
+    """
+    # class POFileIterator {{{
+
+    def __init__(self, fpath, **kwargs):
+        """
+        POFileIterator constructor, parses the file up to its first entry.
+        """
+        self.fpath = fpath
+        self._parser = _get_po_parser(fpath, kwargs)
+        self._entries = self._parser.iterentries()
+        try:
+            self._next_entries = [self._entries.next()]
+        except StopIteration:
+            self._next_entries = []
+        instance = self._parser.instance
+        self.header = instance.header
+        self.metadata = instance.metadata
+        self.metadata_is_fuzzy = instance.metadata_is_fuzzy
+        self.wrapwidth = _dictget(kwargs, 'wrapwidth', 78)
+        self.encoding = _metadata_encoding(self.metadata, kwargs)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._next_entries:
+            return self._next_entries.pop()
+        return self._entries.next()
+
+    def close(self):
+        """
+        Stop parsing and close the file.
+        """
+        self._next_entries = []
+        self._entries.close()
+    # }}}
+
+
 class MOFile(_BaseFile):
     '''
     Mo file reader/writer.
@@ -731,6 +1091,118 @@ class MOFile(_BaseFile):
     # }}}
 
 
+class _LazyList(list):
+    """
+    Empty list returned for an entry attribute that holds no list yet: it
+    becomes the value of the attribute the first time it is modified, so
+    entries don't need a list of their own while they have no items.
+    """
+    # class _LazyList {{{
+    __slots__ = ('_entry', '_slot')
+
+    def __init__(self, entry, slot):
+        list.__init__(self)
+        self._entry = entry
+        self._slot = slot
+
+    def _materialize(self):
+        entry = self._entry
+        if entry is not None:
+            self._entry = None
+            if getattr(entry, self._slot) is None:
+                _objsetattr(entry, self._slot, self)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def append(self, item):
+        self._materialize()
+        list.append(self, item)
+
+    def extend(self, items):
+        self._materialize()
+        list.extend(self, items)
+
+    def insert(self, pos, item):
+        self._materialize()
+        list.insert(self, pos, item)
+
+    def __iadd__(self, items):
+        self._materialize()
+        return list.__iadd__(self, items)
+
+    def __setitem__(self, pos, value):
+        self._materialize()
+        list.__setitem__(self, pos, value)
+
+    def __setslice__(self, i, j, items):
+        self._materialize()
+        list.__setslice__(self, i, j, items)
+    # }}}
+
+
+class _LazyDict(dict):
+    """
+    Dict counterpart of _LazyList.
+    """
+    # class _LazyDict {{{
+    __slots__ = ('_entry', '_slot')
+
+    def __init__(self, entry, slot):
+        dict.__init__(self)
+        self._entry = entry
+        self._slot = slot
+
+    _materialize = _LazyList._materialize.im_func
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        self._materialize()
+        dict.__setitem__(self, key, value)
+
+    def update(self, *args, **kwargs):
+        self._materialize()
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._materialize()
+        return dict.setdefault(self, key, default)
+    # }}}
+
+
+def _lazy_property(slot, lazy_class):
+    """
+    Property for the entry attribute stored in *slot*, that is None until a
+    value is assigned to it or the empty *lazy_class* instance it returns
+    is modified.
+    """
+    # _lazy_property {{{
+    def fget(self):
+        value = getattr(self, slot)
+        if value is None:
+            return lazy_class(self, slot)
+        return value
+
+    def fset(self, value):
+        setattr(self, slot, value)
+    return property(fget, fset)
+    # }}}
+
+
+def _get_slots(cls):
+    """
+    Return the names of the slots of the entry class *cls*.
+    """
+    # _get_slots {{{
+    slots = []
+    for klass in cls.__mro__:
+        slots.extend(klass.__dict__.get('__slots__', ()))
+    return slots
+    # }}}
+
+
 class _BaseEntry(object):
     """
     Base class for POEntry or MOEntry objects.
@@ -738,12 +1210,20 @@ class _BaseEntry(object):
     """
     # class _BaseEntry {{{
 
+    # _owners holds the files whose find() indexes contain the entry,
+    # {id(file): weak reference to file}, so that it doesn't keep them alive.
+    # Empty msgstr_plural, occurrences and flags are stored as None and read
+    # through _LazyDict/_LazyList, see _lazy_property().
+    __slots__ = ('msgid', 'msgstr', 'msgid_plural', '_msgstr_plural',
+                 'obsolete', 'encoding', '_owners')
+
     def __init__(self, *args, **kwargs):
         """Base Entry constructor."""
+        _objsetattr(self, '_owners', None)
         self.msgid = _dictget(kwargs, 'msgid', '')
         self.msgstr = _dictget(kwargs, 'msgstr', '')
         self.msgid_plural = _dictget(kwargs, 'msgid_plural', '')
-        self.msgstr_plural = _dictget(kwargs, 'msgstr_plural', {})
+        self._msgstr_plural = _dictget(kwargs, 'msgstr_plural')
         self.obsolete = _dictget(kwargs, 'obsolete', False)
         self.encoding = _dictget(kwargs, 'encoding', default_encoding)
 
@@ -751,6 +1231,46 @@ class _BaseEntry(object):
         """Return the official string representation of the object."""
         return '<%s instance at %x>' % (self.__class__.__name__, id(self))
 
+    def __setattr__(self, name, value):
+        """Notify the files indexing the entry of changes in its indexed
+        attributes."""
+        owners = name in _indexed_fields and self._owners
+        if owners:
+            old_value = getattr(self, name)
+            _objsetattr(self, name, value)
+            for key, ref in owners.items():
+                owner = ref()
+                if owner is None:
+                    del owners[key]
+                else:
+                    owner._index_changed(self, name, old_value, value)
+        else:
+            _objsetattr(self, name, value)
+
+    def __getstate__(self):
+        """Copies and pickles of the entry don't belong to any file."""
+        state = {}
+        for name in _get_slots(self.__class__):
+            if name != '_owners' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        _objsetattr(self, '_owners', None)
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _add_owner(self, owner):
+        owners = self._owners
+        if owners is None:
+            owners = {}
+            _objsetattr(self, '_owners', owners)
+        owners[id(owner)] = weakref.ref(owner)
+
+    def _remove_owner(self, owner):
+        if self._owners:
+            self._owners.pop(id(owner), None)
+
     def __str__(self, wrapwidth=78):
         """
         Common string representation of the POEntry and MOEntry
@@ -800,6 +1320,8 @@ class _BaseEntry(object):
         if isinstance(st, unicode):
             return st.encode(self.encoding)
         return st
+
+    msgstr_plural = _lazy_property('_msgstr_plural', _LazyDict)
     # }}}
 
 
@@ -836,13 +1358,19 @@ class POEntry(_BaseEntry):
     """
     # class POEntry {{{
 
+    # id is left to applications, to number the entries of a file
+    __slots__ = ('comment', 'tcomment', '_occurrences', '_flags', 'id')
+
     def __init__(self, *args, **kwargs):
         """POEntry constructor."""
         _BaseEntry.__init__(self, *args, **kwargs)
         self.comment = _dictget(kwargs, 'comment', '')
         self.tcomment = _dictget(kwargs, 'tcomment', '')
-        self.occurrences = _dictget(kwargs, 'occurrences', [])
-        self.flags = _dictget(kwargs, 'flags', [])
+        self._occurrences = _dictget(kwargs, 'occurrences')
+        self._flags = _dictget(kwargs, 'flags')
+
+    occurrences = _lazy_property('_occurrences', _LazyList)
+    flags = _lazy_property('_flags', _LazyList)
 
     def __str__(self, wrapwidth=78):
         """
@@ -1018,6 +1546,8 @@ class MOEntry(_BaseEntry):
     """
     # class MOEntry {{{
 
+    __slots__ = ()
+
     def __str__(self, wrapwidth=78):
         """
         Return the string representation of the entry.
@@ -1043,6 +1573,8 @@ class _POFileParser(object):
         self.instance = POFile(fpath=fpath)
         self.transitions = {}
         self.current_entry = POEntry()
+        # entries completed by the last processed line
+        self.finished_entries = []
         self.current_state = 'ST'
         self.current_token = None
         # two memo flags used in handlers
@@ -1075,74 +1607,98 @@ class _POFileParser(object):
         self.add('MC', ['MI', 'MP', 'MS', 'MX'],                         'MC')
 
     def parse(self):
+        """
+        Parse the whole file and return the POFile instance.
+        """
+        for entry in self.iterentries():
+            _listappend(self.instance, entry)
+        return self.instance
+
+    def iterentries(self):
         """
         Run the state machine, parse the file line by line and call process()
-        with the current matched symbol.
+        with the current matched symbol. Entries are yielded as soon as they
+        are complete, except the metadata entry that is stored in the
+        instance before the first entry is yielded.
         """
         i, lastlen = 1, 0
-        for line in self.fhandle:
-            line = _strstrip(line)
-            if line == '':
+        is_first = True
+        try:
+            for line in self.fhandle:
+                line = _strstrip(line)
+                if line == '':
+                    i = i+1
+                    continue
+                if line[:3] == '#~ ':
+                    line = line[3:]
+                    self.entry_obsolete = 1
+                else:
+                    self.entry_obsolete = 0
+                self.current_token = line
+                if line[:2] == '#:':
+                    # we are on a occurrences line
+                    self.process('OC', i)
+                elif line[:7] == 'msgid "':
+                    # we are on a msgid
+                    self.process('MI', i)
+                elif line[:8] == 'msgstr "':
+                    # we are on a msgstr
+                    self.process('MS', i)
+                elif line[:1] == '"':
+                    # we are on a continuation line or some metadata
+                    self.process('MC', i)
+                elif line[:14] == 'msgid_plural "':
+                    # we are on a msgid plural
+                    self.process('MP', i)
+                elif line[:7] == 'msgstr[':
+                    # we are on a msgstr plural
+                    self.process('MX', i)
+                elif line[:3] == '#, ':
+                    # we are on a flags line
+                    self.process('FL', i)
+                elif line[:2] == '# ' or line == '#':
+                    if line == '#': line = line + ' '
+                    # we are on a translator comment line
+                    self.process('TC', i)
+                elif line[:2] == '#.':
+                    # we are on a generated comment line
+                    self.process('GC', i)
                 i = i+1
-                continue
-            if line[:3] == '#~ ':
-                line = line[3:]
-                self.entry_obsolete = 1
-            else:
-                self.entry_obsolete = 0
-            self.current_token = line
-            if line[:2] == '#:':
-                # we are on a occurrences line
-                self.process('OC', i)
-            elif line[:7] == 'msgid "':
-                # we are on a msgid
-                self.process('MI', i)
-            elif line[:8] == 'msgstr "':
-                # we are on a msgstr
-                self.process('MS', i)
-            elif line[:1] == '"':
-                # we are on a continuation line or some metadata
-                self.process('MC', i)
-            elif line[:14] == 'msgid_plural "':
-                # we are on a msgid plural
-                self.process('MP', i)
-            elif line[:7] == 'msgstr[':
-                # we are on a msgstr plural
-                self.process('MX', i)
-            elif line[:3] == '#, ':
-                # we are on a flags line
-                self.process('FL', i)
-            elif line[:2] == '# ' or line == '#':
-                if line == '#': line = line + ' '
-                # we are on a translator comment line
-                self.process('TC', i)
-            elif line[:2] == '#.':
-                # we are on a generated comment line
-                self.process('GC', i)
-            i = i+1
-
-        if self.current_entry:
+                if self.finished_entries:
+                    entries, self.finished_entries = self.finished_entries, []
+                    if is_first:
+                        is_first = False
+                        if self.handle_metadata(entries[0]):
+                            entries = entries[1:]
+                    for entry in entries:
+                        yield entry
+
             # since entries are added when another entry is found, we must add
-            # the last entry here (only if there are lines)
-            _listappend(self.instance, self.current_entry)
-        # before returning the instance, check if there's metadata and if 
-        # so extract it in a dict
-        firstentry = self.instance[0]
-        if firstentry.msgid == '': # metadata found
-            # remove the entry
-            firstentry = _listpop(self.instance, 0)
-            self.instance.metadata_is_fuzzy = firstentry.flags
-            key = None
-            for msg in firstentry.msgstr.splitlines():
-                try:
-                    key, val = _strsplit(msg, ':', 1)
-                    self.instance.metadata[key] = _strstrip(val)
-                except:
-                    if key is not None:
-                        self.instance.metadata[key] += '\n'+_strstrip(msg)
-        # close opened file
-        self.fhandle.close()
-        return self.instance
+            # the last entry here
+            if is_first and self.handle_metadata(self.current_entry):
+                return
+            yield self.current_entry
+        finally:
+            # close opened file
+            self.fhandle.close()
+
+    def handle_metadata(self, firstentry):
+        """
+        If *firstentry* is the metadata entry extract it in the instance
+        metadata dict and return True.
+        """
+        if firstentry.msgid != '':
+            return False
+        self.instance.metadata_is_fuzzy = firstentry.flags
+        key = None
+        for msg in firstentry.msgstr.splitlines():
+            try:
+                key, val = _strsplit(msg, ':', 1)
+                self.instance.metadata[key] = _strstrip(val)
+            except:
+                if key is not None:
+                    self.instance.metadata[key] += '\n'+_strstrip(msg)
+        return True
 
     def add(self, symbol, states, next_state):
         """
@@ -1186,7 +1742,7 @@ class _POFileParser(object):
     def handle_tc(self):
         """Handle a translator comment."""
         if self.current_state in ['MC', 'MS', 'MX']:
-            _listappend(self.instance, self.current_entry)
+            _listappend(self.finished_entries, self.current_entry)
             self.current_entry = POEntry()
         if self.current_entry.tcomment != '':
             self.current_entry.tcomment += '\n'
@@ -1196,7 +1752,7 @@ class _POFileParser(object):
     def handle_gc(self):
         """Handle a generated comment."""
         if self.current_state in ['MC', 'MS', 'MX']:
-            _listappend(self.instance, self.current_entry)
+            _listappend(self.finished_entries, self.current_entry)
             self.current_entry = POEntry()
         if self.current_entry.comment != '':
             self.current_entry.comment += '\n'
@@ -1206,7 +1762,7 @@ class _POFileParser(object):
     def handle_oc(self):
         """Handle a file:num occurence."""
         if self.current_state in ['MC', 'MS', 'MX']:
-            _listappend(self.instance, self.current_entry)
+            _listappend(self.finished_entries, self.current_entry)
             self.current_entry = POEntry()
         occurrences = _strsplit(self.current_token[3:])
         for occurrence in occurrences:
@@ -1216,13 +1772,14 @@ class _POFileParser(object):
                     line = '???'
                 else:
                     fil, line = _strsplit(occurrence, ':')
-                _listappend(self.current_entry.occurrences, (fil, line))
+                # file names are shared by many entries
+                self.current_entry.occurrences.append((intern(fil), line))
         return True
 
     def handle_fl(self):
         """Handle a flags line."""
         if self.current_state in ['MC', 'MS', 'MX']:
-            _listappend(self.instance, self.current_entry)
+            _listappend(self.finished_entries, self.current_entry)
             self.current_entry = POEntry()
         self.current_entry.flags += _strsplit(self.current_token[3:], ', ')
         return True
@@ -1230,7 +1787,7 @@ class _POFileParser(object):
     def handle_mi(self):
         """Handle a msgid."""
         if self.current_state in ['MC', 'MS', 'MX']:
-            _listappend(self.instance, self.current_entry)
+            _listappend(self.finished_entries, self.current_entry)
             self.current_entry = POEntry()
         self.current_entry.obsolete = self.entry_obsolete
         self.current_entry.msgid = unquote(self.current_token[7:-1])
@@ -1271,6 +1828,165 @@ class _POFileParser(object):
     # }}}
 
 
+class _FastPOFileParser(_POFileParser):
+    """
+    Same parser as _POFileParser with the state machine unrolled: lines are
+    classified by their first character, transitions are looked up in a
+    plain dict and entries are filled without going through their
+    constructor and attribute hooks.
+    """
+    # class _FastPOFileParser {{{
+    def iterentries(self):
+        """
+        Parse the file line by line, yielding the entries as _POFileParser
+        does.
+        """
+        transitions = {}
+        for key, (action, next_state) in self.transitions.items():
+            transitions[key] = next_state
+        instance = self.instance
+        state = 'ST'
+        fields = _new_entry_fields()
+        msgstr_index = None
+        is_first = True
+        try:
+            for linenum, line in enumerate(self.fhandle):
+                line = _strstrip(line)
+                if not line:
+                    continue
+                if line[:3] == '#~ ':
+                    line = line[3:]
+                    obsolete = 1
+                else:
+                    obsolete = 0
+                first = line[:1]
+                if first == '"':
+                    symbol = 'MC'
+                elif first == '#':
+                    second = line[1:2]
+                    if second == ':':
+                        symbol = 'OC'
+                    elif line[:3] == '#, ':
+                        symbol = 'FL'
+                    elif second == ' ' or line == '#':
+                        symbol = 'TC'
+                    elif second == '.':
+                        symbol = 'GC'
+                    else:
+                        continue
+                elif first == 'm':
+                    if line[:7] == 'msgid "':
+                        symbol = 'MI'
+                    elif line[:8] == 'msgstr "':
+                        symbol = 'MS'
+                    elif line[:14] == 'msgid_plural "':
+                        symbol = 'MP'
+                    elif line[:7] == 'msgstr[':
+                        symbol = 'MX'
+                    else:
+                        continue
+                else:
+                    continue
+
+                finished = None
+                try:
+                    next_state = transitions[(symbol, state)]
+                    if symbol == 'MC':
+                        # a continuation line doesn't change the state
+                        value = unquote(line[1:-1])
+                        if state == 'MI':
+                            fields['msgid'] += value
+                        elif state == 'MP':
+                            fields['msgid_plural'] += value
+                        elif state == 'MS':
+                            fields['msgstr'] += value
+                        elif state == 'MX':
+                            fields['_msgstr_plural'][msgstr_index] += value
+                        continue
+                    if next_state == 'HE':
+                        if instance.header != '':
+                            instance.header += '\n'
+                        instance.header += line[2:]
+                        state = next_state
+                        continue
+                    if symbol in ('TC', 'GC', 'OC', 'FL', 'MI') and state in ('MS', 'MX'):
+                        finished = fields
+                        fields = _new_entry_fields()
+                    if symbol == 'MI':
+                        fields['obsolete'] = obsolete
+                        fields['msgid'] = unquote(line[7:-1])
+                    elif symbol == 'MS':
+                        fields['msgstr'] = unquote(line[8:-1])
+                    elif symbol == 'MX':
+                        msgstr_index = line[7]
+                        if fields['_msgstr_plural'] is None:
+                            fields['_msgstr_plural'] = {}
+                        fields['_msgstr_plural'][msgstr_index] = unquote(line[11:-1])
+                    elif symbol == 'OC':
+                        occurrences = fields['_occurrences']
+                        if occurrences is None:
+                            occurrences = fields['_occurrences'] = []
+                        for occurrence in _strsplit(line[3:]):
+                            if ':' not in occurrence:
+                                _listappend(occurrences, (intern(occurrence), '???'))
+                            else:
+                                fil, lineno = _strsplit(occurrence, ':')
+                                _listappend(occurrences, (intern(fil), lineno))
+                    elif symbol == 'MP':
+                        fields['msgid_plural'] = unquote(line[14:-1])
+                    elif symbol == 'FL':
+                        if fields['_flags'] is None:
+                            fields['_flags'] = []
+                        fields['_flags'] += _strsplit(line[3:], ', ')
+                    elif symbol == 'TC':
+                        if fields['tcomment'] != '':
+                            fields['tcomment'] += '\n'
+                        fields['tcomment'] += line[2:]
+                    elif symbol == 'GC':
+                        if fields['comment'] != '':
+                            fields['comment'] += '\n'
+                        fields['comment'] += line[3:]
+                    state = next_state
+                except Exception, e:
+                    raise IOError('Syntax error in po file (line %s): %s' % \
+                        (linenum + 1, e))
+
+                if finished is not None:
+                    entry = _make_poentry(finished)
+                    if is_first:
+                        is_first = False
+                        if self.handle_metadata(entry):
+                            continue
+                    yield entry
+
+            # the last entry is added as _POFileParser does
+            entry = _make_poentry(fields)
+            if is_first and self.handle_metadata(entry):
+                return
+            yield entry
+        finally:
+            # close opened file
+            self.fhandle.close()
+    # }}}
+
+
+def _new_entry_fields():
+    return {'msgid': '', 'msgstr': '', 'msgid_plural': '', '_msgstr_plural': None,
+            'obsolete': False, 'encoding': default_encoding, '_owners': None,
+            'comment': '', 'tcomment': '', '_occurrences': None, '_flags': None}
+
+
+def _make_poentry(fields):
+    """
+    Build a POEntry from the dict of its slot values, without calling its
+    constructor.
+    """
+    entry = _newpoentry(POEntry)
+    for name, value in fields.iteritems():
+        _objsetattr(entry, name, value)
+    return entry
+
+
 class _MOFileParser(object):
     """
     A class to parse binary mo files.
@@ -1285,9 +2001,13 @@ class _MOFileParser(object):
         """
         Parse the magic number and raise an exception if not valid.
         """
-        magic_number = self._readbinary(fmt='4s')
+        magic_number = self.fhandle.read(4)
         # magic number must be 0xde120495 or 0x950412de
-        if magic_number not in ['\xde\x12\x04\x95', '\x95\x04\x12\xde']:
+        if magic_number == '\xde\x12\x04\x95':
+            self.byteorder = '<'
+        elif magic_number == '\x95\x04\x12\xde':
+            self.byteorder = '>'
+        else:
             raise IOError('Invalid mo file, magic number is incorrect !')
         self.instance.magic_number = magic_number
 
@@ -1304,17 +2024,13 @@ class _MOFileParser(object):
         # original strings hash table offset
         msgids_hash_offset = self._readbinary('L')
         # translation strings hash table offset
-        msgstrs_hash_offset = self._readbinary('P')
+        msgstrs_hash_offset = self._readbinary('L')
         # move to msgid hash table and read length and offset of msgids
         self.fhandle.seek(msgids_hash_offset)
-        msgids_index = []
-        for i in range(numofstrings):
-            _listappend(msgids_index, self._readbinary('LL'))
+        msgids_index = self._readtable(numofstrings)
         # move to msgstr hash table and read length and offset of msgstrs
         self.fhandle.seek(msgstrs_hash_offset)
-        msgstrs_index = []
-        for i in range(numofstrings):
-            _listappend(msgstrs_index, self._readbinary('LL'))
+        msgstrs_index = self._readtable(numofstrings)
         # build entries
         for i in range(numofstrings):
             self.fhandle.seek(msgids_index[i][1])
@@ -1343,12 +2059,21 @@ class _MOFileParser(object):
         Private method that unpack n bytes of data using format <fmt>.
         It returns a tuple or a mixed value if the tuple length is 1.
         """
+        fmt = self.byteorder + fmt
         numbytes = struct.calcsize(fmt)
         bytes = self.fhandle.read(numbytes)
         tup = struct.unpack(fmt, bytes)
         if len(tup) == 1:
             return tup[0]
         return tup
+
+    def _readtable(self, numofstrings):
+        """
+        Private method that unpacks a table of *numofstrings* (length, offset)
+        pairs at once.
+        """
+        values = self._readbinary('%dL' % (2 * numofstrings))
+        return zip(values[::2], values[1::2])
     # }}}
 
 
@@ -1,10 +1,13 @@
-import re
 import sys
 import os
+import time
+import threading
 
 from django import VERSION as django_version
 from django.conf import settings
+from django.utils.encoding import smart_str, smart_unicode
 from transhette import polib
+from transhette.utils import get_setting
 try:
     set
 except NameError:
@@ -80,32 +83,128 @@ def get_orderer_path_list(include_djangos, include_transhette):
     return paths
 
 
-def find_pos(lang, include_djangos=False, include_transhette=False):
+class CatalogRegistry(object):
+    """
+    The gettext catalogs found in the locale paths of the project, by
+    language directory. It is checked against the locale directories at most
+    every CATALOG_DISCOVERY_INTERVAL seconds, see get_catalog_registry().
     """
-    scans a couple possible repositories of gettext catalogs for the given
-    language code
 
+    def __init__(self, include_djangos, include_transhette):
+        self.include_djangos = include_djangos
+        self.include_transhette = include_transhette
+        self.paths = get_orderer_path_list(include_djangos, include_transhette)
+        # one {language directory: [catalog paths]} dict per locale path
+        self.catalogs = []
+        self.snapshot = {}
+        for path in self.paths:
+            catalogs = {}
+            self.snapshot[path] = _get_mtime(path)
+            try:
+                names = os.listdir(path)
+            except OSError:
+                names = []
+            for name in names:
+                dirname = os.path.join(path, name, 'LC_MESSAGES')
+                mtime = _get_mtime(dirname)
+                if mtime is None:
+                    continue
+                self.snapshot[dirname] = mtime
+                found = [os.path.abspath(os.path.join(dirname, fn)) for fn in ('django.po', 'djangojs.po')
+                         if os.path.isfile(os.path.join(dirname, fn))]
+                if found:
+                    catalogs[name] = found
+            self.catalogs.append(catalogs)
+        self.checked = time.time()
+        self.found = {}
+
+    def is_stale(self):
+        """ Tells whether a catalog or a language was added or removed since the registry was built """
+        if self.paths != get_orderer_path_list(self.include_djangos, self.include_transhette):
+            return True
+        for dirname, mtime in self.snapshot.items():
+            if _get_mtime(dirname) != mtime:
+                return True
+        for path in self.paths:
+            try:
+                names = os.listdir(path)
+            except OSError:
+                # removed locale directory
+                return True
+            for name in names:
+                dirname = os.path.join(path, name, 'LC_MESSAGES')
+                if dirname not in self.snapshot and os.path.isdir(dirname):
+                    return True
+        return False
+
+    def find(self, lang):
+        ret = self.found.get(lang)
+        if ret is None:
+            langs = (lang, )
+            if u'-' in lang:
+                _l, _c = map(lambda x: x.lower(), lang.split(u'-'))
+                langs += (u'%s_%s' % (_l, _c), u'%s_%s' % (_l, _c.upper()), )
+            elif u'_' in lang:
+                _l, _c = map(lambda x: x.lower(), lang.split(u'_'))
+                langs += (u'%s-%s' % (_l, _c), u'%s-%s' % (_l, _c.upper()), )
+            ret = []
+            for catalogs in self.catalogs:
+                for lang_ in langs:
+                    for fn in catalogs.get(lang_, ()):
+                        if fn not in ret:
+                            ret.append(fn)
+            self.found[lang] = ret
+        return ret
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_catalog_registry(include_djangos=False, include_transhette=False):
+    """
+    Returns the CatalogRegistry for the given options, building it the
+    first time and when the locale directories changed.
     """
+    key = (bool(include_djangos), bool(include_transhette))
+    registry = _registries.get(key)
+    if registry is not None and time.time() - registry.checked < get_setting('CATALOG_DISCOVERY_INTERVAL'):
+        return registry
+    _registries_lock.acquire()
+    try:
+        registry = _registries.get(key)
+        if registry is None or registry.is_stale():
+            registry = _registries[key] = CatalogRegistry(*key)
+        else:
+            registry.checked = time.time()
+        return registry
+    finally:
+        _registries_lock.release()
 
-    paths = get_orderer_path_list(include_djangos, include_transhette)
 
-    ret = []
-    rx = re.compile(r'(\w+)/../\1')
-    langs = (lang, )
-    if u'-' in lang:
-        _l, _c = map(lambda x: x.lower(), lang.split(u'-'))
-        langs += (u'%s_%s' % (_l, _c), u'%s_%s' % (_l, _c.upper()), )
-    elif u'_' in lang:
-        _l, _c = map(lambda x: x.lower(), lang.split(u'_'))
-        langs += (u'%s-%s' % (_l, _c), u'%s-%s' % (_l, _c.upper()), )
+def refresh_catalogs():
+    """ Forgets the catalogs found so far, to be called after adding or removing catalogs """
+    _registries_lock.acquire()
+    try:
+        _registries.clear()
+    finally:
+        _registries_lock.release()
 
-    for path in paths:
-        for lang_ in langs:
-            dirname = rx.sub(r'\1', '%s/%s/LC_MESSAGES/' % (path, lang_))
-            for fn in ('django.po', 'djangojs.po', ):
-                if os.path.isfile(dirname + fn) and os.path.abspath((dirname + fn)) not in ret:
-                    ret.append(os.path.abspath(dirname + fn))
-    return ret
+
+def find_pos(lang, include_djangos=False, include_transhette=False):
+    """
+    scans a couple possible repositories of gettext catalogs for the given
+    language code
+
+    """
+    return list(get_catalog_registry(include_djangos, include_transhette).find(lang))
 
 
 def pagination_range(first, last, current):
@@ -145,45 +244,121 @@ def pagination_range(first, last, current):
 FUZZY = 'fuzzy'
 
 
+def get_merge_key(entry):
+    """ What entries of two catalogs are joined by (this polib has no msgctxt, it is None) """
+    return (getattr(entry, 'msgctxt', None), entry.msgid)
+
+
+class MergePlan(object):
+    """
+    Changes that merging po_source into po_destination makes, computed in a
+    single pass over both catalogs joined by get_merge_key(). Translated
+    messages of po_source only replace untranslated ones, or any of them
+    with priority; messages missing from po_destination are added. The plan
+    can be shown and applied later, to the destination as it is by then.
+    """
+
+    def __init__(self, po_source, po_destination, priority=False):
+        self.priority = priority
+        self.source_encoding = po_source.encoding
+        self.destination_encoding = po_destination.encoding
+        # entries of po_source missing from po_destination
+        self.news = []
+        # {'entry': entry of po_source, 'entry_destination': msgstr it replaces,
+        #  'fields': names of the fields that change (msgstr, occurrences, comment, flags)}
+        self.changes = []
+        # msgids of the entries of both catalogs that the merge leaves as they are
+        self.unchanged = []
+        # msgids of the entries of po_destination missing from po_source
+        self.obsolete = []
+
+        index = dict([(get_merge_key(entry), entry) for entry in po_destination])
+        for entry in po_source:
+            destination = index.pop(self.get_key(entry), None)
+            if destination is None:
+                self.news.append(entry)
+            elif self.is_change(entry, destination):
+                self.changes.append({'entry': entry,
+                                     'entry_destination': destination.msgstr,
+                                     'fields': self.get_changed_fields(entry, destination)})
+            else:
+                self.unchanged.append(destination.msgid)
+        self.obsolete = [entry.msgid for entry in po_destination if get_merge_key(entry) in index]
+
+    def convert(self, value):
+        """ A string of po_source encoded as po_destination """
+        if self.source_encoding == self.destination_encoding:
+            return value
+        return smart_str(smart_unicode(value, self.source_encoding), self.destination_encoding)
+
+    def get_key(self, entry):
+        """ get_merge_key() of an entry of po_source in po_destination """
+        msgctxt, msgid = get_merge_key(entry)
+        if msgctxt is not None:
+            msgctxt = self.convert(msgctxt)
+        return (msgctxt, self.convert(msgid))
+
+    def is_change(self, entry, destination):
+        if not entry.translated() or (destination.translated() and not self.priority):
+            return False
+        return bool(self.get_changed_fields(entry, destination))
+
+    def get_changed_fields(self, entry, destination):
+        """ Fields of destination that merging entry changes """
+        fields = []
+        if destination.msgstr != self.convert(entry.msgstr):
+            fields.append('msgstr')
+        if destination.occurrences != entry.occurrences:
+            fields.append('occurrences')
+        if destination.comment != self.convert(entry.comment):
+            fields.append('comment')
+        if FUZZY in destination.flags:
+            fields.append('flags')
+        return fields
+
+    def translation_changes(self):
+        """ The changes that replace a translation """
+        return [change for change in self.changes if 'msgstr' in change['fields']]
+
+    def other_changes(self):
+        """ The changes that keep the translation, only its references, comment or fuzzy flag change """
+        return [change for change in self.changes if 'msgstr' not in change['fields']]
+
+    def apply(self, po_destination):
+        """
+        Merges into po_destination, leaving out changes that no longer apply
+        (e.g. messages translated in the meantime). Returns the entries of
+        po_destination that changed, it is not saved.
+        """
+        index = dict([(get_merge_key(entry), entry) for entry in po_destination])
+        entries = []
+        for entry in self.news + [change['entry'] for change in self.changes]:
+            destination = index.get(self.get_key(entry))
+            if destination is None:
+                destination = polib.POEntry(msgid=self.convert(entry.msgid),
+                                            occurrences=entry.occurrences,
+                                            comment=self.convert(entry.comment),
+                                            msgstr=self.convert(entry.msgstr))
+                po_destination.append(destination)
+                index[get_merge_key(destination)] = destination
+            elif self.is_change(entry, destination):
+                destination.occurrences = entry.occurrences
+                destination.comment = self.convert(entry.comment)
+                destination.msgstr = self.convert(entry.msgstr)
+                if FUZZY in destination.flags:
+                    destination.flags.remove(FUZZY)
+            else:
+                continue
+            entries.append(destination)
+        return entries
+
+
 def priority_merge(po_destination, po_source, priority=False):
-    for entry in po_source:
-        e = po_destination.find(entry.msgid)
-
-        if e:
-            if (not e.translated() or priority) and entry.translated():
-                # entry found, we update if it isn't translated
-                e.occurrences = entry.occurrences
-                e.comment = entry.comment
-                e.msgstr = entry.msgstr
-                if FUZZY in e.flags:
-                    e.flags.remove(FUZZY)
-        else:
-            # entry is not in the po file, we must add it
-            # entry is created with msgid, occurrences and comment
-            new_entry = polib.POEntry(msgid=entry.msgid,
-                                      occurrences=entry.occurrences,
-                                      comment=entry.comment,
-                                      msgstr=entry.msgstr)
-            po_destination.append(new_entry)
+    MergePlan(po_source, po_destination, priority).apply(po_destination)
     po_destination.save()
 
 
 def get_changes(po_source, po_destination, priority):
-    l_changes = []
-    l_news = []
-    for entry_source in po_source:
-        entry_destination = po_destination.find(entry_source.msgid)
-        item = {}
-        if entry_destination:
-            if entry_source.translated() and not entry_destination.translated():
-                item['entry'] = entry_source
-                item['entry_destination'] = ""
-            elif priority:
-                item['entry'] = entry_source
-                item['entry_destination'] = entry_destination.msgstr
-                if item:
-                    l_changes.append(item)
-        else:
-            item['entry'] = entry_source
-            l_news.append(item)
-    return l_changes, l_news
+    """ (translation changes, news) of MergePlan, news as [{'entry': entry}, ...] """
+    plan = MergePlan(po_source, po_destination, priority)
+    return plan.translation_changes(), [{'entry': entry} for entry in plan.news]
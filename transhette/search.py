@@ -0,0 +1,177 @@
+import os
+import bisect
+import threading
+
+from django.utils.encoding import smart_unicode
+
+from transhette import polib
+from transhette.pocache import get_pofile, get_signature, replay_listeners
+
+# separates the entries and the fields of an entry in the indexed text
+ENTRY_SEPARATOR = u'\0'
+FIELD_SEPARATOR = u'\x01'
+PATH_PREFIX = u'path:'
+
+# ranks of a match
+EXACT, WORD, SUBSTRING = 3, 2, 1
+
+
+class SearchIndex(object):
+    """
+    Lowercased text of the entries of a catalog, joined in one string per kind
+    of field so that a search is a few str.find() calls (or one regex scan for
+    word queries) followed by a bisection in the table of entry offsets.
+    """
+
+    def __init__(self, po, signature):
+        self.signature = signature
+        self.keys = [get_entry_key(entry) for entry in po]
+        self.texts = [get_entry_text(entry) for entry in po]
+        self.paths = [get_entry_paths(entry) for entry in po]
+        self.join()
+
+    def join(self):
+        self.text, self.text_offsets = _join(self.texts)
+        self.path_text, self.path_offsets = _join(self.paths)
+
+    def update(self, po, signature):
+        """ Reindexes the entries of po that changed. Returns False if po has other entries """
+        if len(po) != len(self.keys):
+            return False
+        for i, entry in enumerate(po):
+            key = get_entry_key(entry)
+            if key != self.keys[i]:
+                self.keys[i] = key
+                self.texts[i] = get_entry_text(entry)
+                self.paths[i] = get_entry_paths(entry)
+        self.signature = signature
+        self.join()
+        return True
+
+    def search(self, query, occurrences=False):
+        """
+        Returns {position: rank} for the entries matching query. Queries are
+        case insensitive substrings, or whole words when quoted ("word").
+        Queries starting with "path:" look for the files of the occurrences.
+        """
+        query = smart_unicode(query).replace(ENTRY_SEPARATOR, u'').replace(FIELD_SEPARATOR, u'').strip().lower()
+        if query.startswith(PATH_PREFIX):
+            return _find(self.path_text, self.path_offsets, self.paths, query[len(PATH_PREFIX):].strip())
+        if len(query) > 1 and query[0] == query[-1] == u'"':
+            return _find(self.text, self.text_offsets, self.texts, query[1:-1], words_only=True)
+        matches = _find(self.text, self.text_offsets, self.texts, query)
+        if occurrences:
+            for position in _find(self.path_text, self.path_offsets, self.paths, query):
+                matches.setdefault(position, SUBSTRING)
+        return matches
+
+
+def get_entry_key(entry):
+    """ What the indexed text of entry depends on """
+    return (entry.msgid, entry.msgstr, entry.msgid_plural,
+            tuple(sorted(entry.msgstr_plural.items())), tuple(entry.occurrences))
+
+
+def get_entry_text(entry):
+    fields = [entry.msgid, entry.msgstr, entry.msgid_plural] + entry.msgstr_plural.values()
+    return FIELD_SEPARATOR.join([smart_unicode(field, errors='replace') for field in fields if field]).lower()
+
+
+def get_entry_paths(entry):
+    return FIELD_SEPARATOR.join([smart_unicode(path, errors='replace') for path, line in entry.occurrences]).lower()
+
+
+def rank_match(text, query):
+    """ Rank of the best match of query in the indexed text of an entry """
+    rank = SUBSTRING
+    start = text.find(query)
+    while start != -1:
+        before = text[start - 1:start]
+        after = text[start + len(query):start + len(query) + 1]
+        if before in (u'', FIELD_SEPARATOR) and after in (u'', FIELD_SEPARATOR):
+            return EXACT
+        if not (before.isalnum() or before == u'_' or after.isalnum() or after == u'_'):
+            rank = WORD
+        start = text.find(query, start + 1)
+    return rank
+
+
+def _join(texts):
+    offsets = []
+    offset = 0
+    for text in texts:
+        offsets.append(offset)
+        offset += len(text) + 1
+    return ENTRY_SEPARATOR.join(texts), offsets
+
+
+def _find(text, offsets, texts, query, words_only=False):
+    """ {position: rank} of the entries whose text contains query """
+    matches = {}
+    if not query:
+        return matches
+    start = text.find(query)
+    position = 0
+    while start != -1:
+        position = bisect.bisect_right(offsets, start, position) - 1
+        rank = rank_match(texts[position], query)
+        if rank > SUBSTRING or not words_only:
+            matches[position] = rank
+        if position + 1 == len(offsets):
+            break
+        start = text.find(query, offsets[position + 1])
+    return matches
+
+
+_lock = threading.Lock()
+# absolute path -> SearchIndex
+_indexes = {}
+
+
+def get_index(fpath):
+    """ Returns the SearchIndex of the catalog fpath as it is on disk, building it if needed """
+    fpath = os.path.abspath(fpath)
+    signature = get_signature(fpath)
+    index = _indexes.get(fpath)
+    if index is None or index.signature != signature:
+        index = SearchIndex(get_pofile(fpath), signature)
+        _lock.acquire()
+        try:
+            _indexes[fpath] = index
+        finally:
+            _lock.release()
+    return index
+
+
+def search_catalog(po, query, occurrences=False):
+    """
+    Returns the positions in po of the entries matching query (see
+    SearchIndex.search), best ranked first. Entries being edited in a
+    working copy (its edited_ids) are matched with their current text.
+    """
+    index = get_index(po.fpath)
+    matches = index.search(query, occurrences)
+    edited_ids = getattr(po, 'edited_ids', ())
+    if edited_ids:
+        edited = SearchIndex([po[id] for id in sorted(edited_ids)], None)
+        edited_matches = edited.search(query, occurrences)
+        for i, id in enumerate(sorted(edited_ids)):
+            matches.pop(id, None)
+            if i in edited_matches:
+                matches[id] = edited_matches[i]
+    return sorted(matches.keys(), key=lambda position: (-matches[position], position))
+
+
+def _on_save(po, fpath):
+    """ Keeps the index of a catalog saved (or replayed on, see pocache) by this process up to date """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        index = _indexes.get(fpath)
+        if index is not None and not index.update(po, get_signature(fpath)):
+            del _indexes[fpath]
+    finally:
+        _lock.release()
+
+polib.save_listeners.append(_on_save)
+replay_listeners.append(_on_save)
@@ -51,3 +51,46 @@ FORCE_NATIVE_LANGUAGE_TO = 'en'
 # List django and rosetta catalogs
 INCLUDE_DJANGOS = False
 INCLUDE_TRANSHETTE = True
+
+# Maximum number of entries (summed over every catalog) kept parsed in memory
+# by each process. Least recently used catalogs are dropped first.
+CATALOG_CACHE_MAX_ENTRIES = 200000
+
+# Seconds that edits which could not be written to a catalog (read-only file,
+# format errors) are kept for the translator. They are stored with Django's
+# cache framework, so multi-process deployments need a shared cache backend.
+DRAFTS_TIMEOUT = 60 * 60 * 24 * 7
+
+# Seconds that the statistics shown in the language list are cached. They are
+# recomputed anyway as soon as their catalog changes on disk.
+CATALOG_STATS_TIMEOUT = 60 * 60 * 24 * 30
+
+# Seconds between checks of the locale directories for added or removed
+# catalogs. poutil.refresh_catalogs() forces the check.
+CATALOG_DISCOVERY_INTERVAL = 30
+
+# Language whose project catalog (BASEDIR/locale) is checked for msgids
+# translated into the same msgstr. Defaults to LANGUAGE_CODE.
+CONFLICTS_REFERENCE_LANGUAGE = None
+
+# Flush catalogs to disk (fsync) before they replace the previous version.
+# Slower saves, but a crash can't leave a catalog half written.
+CATALOG_FSYNC = True
+
+# Inline (AJAX) translations are journaled and saved in batches: a catalog is
+# saved this many seconds after its first pending edit, or as soon as it has
+# WRITE_BEHIND_MAX_EDITS of them.
+WRITE_BEHIND_DELAY = 5
+WRITE_BEHIND_MAX_EDITS = 20
+
+# Keep the records of the edit journals, once they are written to their
+# catalog, in a <catalog>.history file next to it (who changed what, when).
+JOURNAL_HISTORY = True
+
+# Seconds that the membership of a user in the translators group is cached.
+# It is forgotten anyway as soon as the group or the groups of the user change.
+PERMISSIONS_CACHE_TIMEOUT = 60 * 60
+
+# Processes that compare the catalogs of a bulk update (a zip file or a
+# tarball of catalogs) with the project ones. Defaults to the number of CPUs.
+BULK_UPDATE_PROCESSES = None
@@ -0,0 +1,79 @@
+import os
+
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
+
+from transhette import polib, journal
+from transhette.pocache import get_signature
+from transhette.utils import get_setting
+
+
+def get_catalog_stats(fpath):
+    """ Returns the statistics of the catalog fpath, see get_catalogs_stats() """
+    return get_catalogs_stats([fpath])[fpath]
+
+
+def get_catalogs_stats(fpaths):
+    """
+    Returns {fpath: statistics} for the given catalogs. Statistics are dicts
+    with the number of entries, translated, fuzzy and obsolete entries and the
+    translated percent. They are kept in the cache while the catalog doesn't
+    change on disk, so catalogs are only parsed the first time.
+    """
+    keys = dict([(fpath, _get_stats_key(fpath)) for fpath in fpaths])
+    cached = cache.get_many(keys.values())
+    result = {}
+    for fpath in fpaths:
+        signature = _get_stats_signature(fpath)
+        stored = cached.get(keys[fpath])
+        if stored is not None and stored['signature'] == signature:
+            result[fpath] = stored['stats']
+        else:
+            records = journal.read(fpath, signature[:2])[0]
+            result[fpath] = compute_stats(journal.replay_stream(polib.iter_pofile(fpath), records))
+            _store_stats(fpath, signature, result[fpath])
+    return result
+
+
+def compute_stats(entries):
+    """ Counts the entries of a POFile, or of the POFileIterator of a catalog """
+    total = translated = fuzzy = obsolete = 0
+    for entry in entries:
+        total += 1
+        if entry.obsolete:
+            obsolete += 1
+        elif entry.translated():
+            translated += 1
+        if 'fuzzy' in entry.flags:
+            fuzzy += 1
+    # same figure as POFile.percent_translated()
+    if total == obsolete:
+        percent = 100
+    else:
+        percent = int((100.00 / float(total - obsolete)) * translated)
+    return {'entries': total,
+            'translated': translated,
+            'fuzzy': fuzzy,
+            'obsolete': obsolete,
+            'percent': percent}
+
+
+def _get_stats_signature(fpath):
+    """ Signature of the catalog file and the size of its journal """
+    return get_signature(fpath) + (journal.get_size(fpath), )
+
+
+def _store_stats(fpath, signature, stats):
+    cache.set(_get_stats_key(fpath), {'signature': signature, 'stats': stats},
+              get_setting('CATALOG_STATS_TIMEOUT'))
+
+
+def _get_stats_key(fpath):
+    return 'transhette_stats_%s' % md5_constructor(os.path.abspath(fpath)).hexdigest()
+
+
+def _on_save(po, fpath):
+    """ Refreshes the statistics of catalogs saved by this process """
+    _store_stats(fpath, _get_stats_signature(fpath), compute_stats(po))
+
+polib.save_listeners.append(_on_save)
@@ -0,0 +1,119 @@
+import os
+import array
+import bisect
+import threading
+
+from transhette import polib
+from transhette.pocache import get_pofile, get_signature, replay_listeners
+
+BOTH = 'both'
+TRANSLATED = 'translated'
+UNTRANSLATED = 'untranslated'
+FUZZY = 'fuzzy'
+FILTERS = (BOTH, TRANSLATED, UNTRANSLATED, FUZZY)
+
+
+def get_entry_filters(entry):
+    """ The filters of the translation view that show entry """
+    filters = [BOTH]
+    if not entry.obsolete:
+        if entry.translated():
+            filters.append(TRANSLATED)
+        else:
+            filters.append(UNTRANSLATED)
+    if 'fuzzy' in entry.flags:
+        filters.append(FUZZY)
+    return filters
+
+
+class StatusIndex(object):
+    """
+    Sorted arrays with the positions of the entries of a catalog shown by each
+    filter, same entries as POFile.translated_entries(), untranslated_entries()
+    and fuzzy_entries().
+    """
+
+    def __init__(self, po, signature):
+        self.signature = signature
+        self.ids = dict([(filter_, array.array('I')) for filter_ in FILTERS])
+        for i, entry in enumerate(po):
+            for filter_ in get_entry_filters(entry):
+                self.ids[filter_].append(i)
+
+    def update(self, po, ids):
+        """ Moves the entries ids of po to the arrays of their current filters """
+        _update_ids(self.ids, po, ids)
+
+    def get_ids(self, filter_, po=None):
+        """
+        Returns the array of the positions shown by filter_. If po is a working
+        copy its edited entries are classified with their current values.
+        """
+        edited_ids = getattr(po, 'edited_ids', None)
+        if not edited_ids:
+            return self.ids[filter_]
+        ids = self.ids[filter_][:]
+        _update_ids({filter_: ids}, po, edited_ids)
+        return ids
+
+
+def _update_ids(ids_by_filter, po, ids):
+    for id in ids:
+        filters = get_entry_filters(po[id])
+        for filter_, filter_ids in ids_by_filter.items():
+            position = bisect.bisect_left(filter_ids, id)
+            present = position < len(filter_ids) and filter_ids[position] == id
+            if filter_ in filters and not present:
+                filter_ids.insert(position, id)
+            elif filter_ not in filters and present:
+                del filter_ids[position]
+
+
+_lock = threading.Lock()
+# absolute path -> StatusIndex
+_indexes = {}
+
+
+def get_status_index(fpath):
+    """ Returns the StatusIndex of the catalog fpath as it is on disk """
+    fpath = os.path.abspath(fpath)
+    signature = get_signature(fpath)
+    index = _indexes.get(fpath)
+    if index is None or index.signature != signature:
+        index = StatusIndex(get_pofile(fpath), signature)
+        _lock.acquire()
+        try:
+            _indexes[fpath] = index
+        finally:
+            _lock.release()
+    return index
+
+
+def get_filtered_ids(po, filter_):
+    """ Positions in po of the entries shown by filter_ """
+    return get_status_index(po.fpath).get_ids(filter_, po)
+
+
+def _on_save(po, fpath):
+    """
+    Keeps the index of a catalog saved (or replayed on, see pocache) by this
+    process up to date: only the changed entries are reclassified when po is
+    a working copy, see WorkingCopy.changed_ids.
+    """
+    fpath = os.path.abspath(fpath)
+    _lock.acquire()
+    try:
+        index = _indexes.get(fpath)
+        if index is None:
+            return
+        changed_ids = getattr(po, 'changed_ids', None)
+        if changed_ids is not None and len(po) == len(index.ids[BOTH]):
+            index.update(po, changed_ids)
+            index.signature = get_signature(fpath)
+        else:
+            _indexes[fpath] = StatusIndex(po, get_signature(fpath))
+    finally:
+        _lock.release()
+
+polib.save_listeners.append(_on_save)
+replay_listeners.append(_on_save)
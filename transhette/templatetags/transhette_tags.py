@@ -2,13 +2,14 @@ import copy
 
 from django import template
 from django.conf import settings
-from django.template.loader import render_to_string
 from django.template import TemplateSyntaxError, TokenParser
 from django.templatetags.i18n import TranslateNode
+from django.utils.encoding import force_unicode
+from django.utils.html import conditional_escape
 from django.utils.translation import get_language
 from django.utils.translation.trans_real import catalog
 
-from transhette.views import can_translate
+from transhette.permissions import can_translate
 
 register = template.Library()
 
@@ -19,36 +20,72 @@ def get_language_name(lang):
             return lang_name
 
 
-class NotTranslated(object):
-
-    @staticmethod
-    def ugettext(cadena):
-        raise ValueError("not translated")
-
-    @staticmethod
-    def add_fallback(func):
-        return
+# same markup as transhette/transhette_trans.html, without a template render per tag
+TRANSLATABLE_FRAGMENT = u'<span rel="%s" class="translatable%s">%s</span>'
+
+
+class TranslatedLookup(object):
+    """
+    Translations of a catalog and of its fallbacks (e.g. the default
+    language), looked up in their dicts in the order ugettext() would.
+    """
+
+    def __init__(self, cat):
+        self.catalog = cat
+        self.catalogs = []
+        while cat is not None and hasattr(cat, '_catalog'):
+            self.catalogs.append(cat._catalog)
+            cat = getattr(cat, '_fallback', None)
+
+    def get(self, msgid):
+        """ The translation of msgid, None when it isn't translated """
+        for messages in self.catalogs:
+            msgstr = messages.get(msgid)
+            if msgstr is not None:
+                return msgstr
+        return None
+
+
+def get_translated_lookup(context):
+    """
+    The TranslatedLookup of the active catalog, built once per request (per
+    render when there is no request in context) and language.
+    """
+    cat = catalog()
+    holder = context.get('request', None)
+    if holder is None:
+        holder = context.render_context
+        lookups = holder.get('transhette_lookups', None)
+        if lookups is None:
+            lookups = holder['transhette_lookups'] = {}
+    else:
+        lookups = getattr(holder, 'transhette_lookups', None)
+        if lookups is None:
+            lookups = holder.transhette_lookups = {}
+    lookup = lookups.get(get_language())
+    if lookup is None or lookup.catalog is not cat:
+        lookup = lookups[get_language()] = TranslatedLookup(cat)
+    return lookup
 
 
 class TranshetteTranslateNode(TranslateNode):
 
+    def __init__(self, filter_expression, noop):
+        super(TranshetteTranslateNode, self).__init__(filter_expression, noop)
+        # resolves the msgid itself: render() toggles translate on the shared one
+        self.msgid_expression = copy.copy(self.filter_expression)
+        self.msgid_expression.var = copy.copy(self.filter_expression.var)
+        self.msgid_expression.var.translate = False
+
     def render(self, context):
         if not ('user' in context and context['user'].is_staff):
             return super(TranshetteTranslateNode, self).render(context)
 
-        msgid = self.value.resolve(context)
-        cat = copy.copy(catalog())
-        cat.add_fallback(NotTranslated)
-        styles = ['translatable']
-        try:
-            msgstr = cat.ugettext(msgid)
-        except ValueError:
-            styles.append("untranslated")
-            msgstr = msgid
-        return render_to_string('transhette/transhette_trans.html',
-                                {'msgid': msgid,
-                                 'styles': ' '.join(styles),
-                                 'value': msgstr})
+        msgid = force_unicode(self.msgid_expression.resolve(context))
+        msgstr = get_translated_lookup(context).get(msgid)
+        if msgstr is None:
+            return TRANSLATABLE_FRAGMENT % (conditional_escape(msgid), u' untranslated', conditional_escape(msgid))
+        return TRANSLATABLE_FRAGMENT % (conditional_escape(msgid), u'', conditional_escape(msgstr))
 
 
 def transhette_trans(parser, token):
@@ -67,7 +104,7 @@ def transhette_trans(parser, token):
             return (value, noop)
     value, noop = TranslateParser(token.contents).top()
 
-    return TranshetteTranslateNode(value, noop)
+    return TranshetteTranslateNode(parser.compile_filter(value), noop)
 
 register.tag('transhette_trans', transhette_trans)
 
@@ -0,0 +1,1329 @@
+# -*- coding: utf-8 -*-
+import gc
+import os
+import sys
+import copy
+import pickle
+import shutil
+import struct
+import gettext
+import weakref
+import threading
+import time
+import tempfile
+import subprocess
+import zipfile
+import tarfile
+from cStringIO import StringIO
+from distutils.spawn import find_executable
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group, AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import unittest
+from django.utils import translation
+from django.template import Template, Context
+
+from transhette import polib, journal, pocache, writebehind, permissions
+from transhette.pocache import get_pofile, get_signature
+from transhette.moutil import MOWriter, map_mofile, save_catalog, get_mo_path
+from transhette.poutil import (MergePlan, priority_merge, FUZZY, get_catalog_registry, refresh_catalogs,
+                              find_pos)
+from transhette.drafts import get_working_copy, save_working_copy, save_draft, delete_draft, copy_entry
+from transhette.locking import get_lock, fcntl
+from transhette.writebehind import queue_edit, apply_translation
+from transhette.conflicts import ConflictIndex, get_conflict_index
+from transhette.search import search_catalog, get_index, EXACT, WORD, SUBSTRING
+from transhette.ownership import get_owner, get_ownership_index
+from transhette.templatetags.transhette_tags import TranslatedLookup
+from transhette.permissions import can_translate, TRANSLATORS_GROUP
+from transhette.export import iter_zip, iter_catalogs_members, get_archive_name, get_archive_names
+from transhette.bulk import (extract_catalogs, resolve_destination, plan_bulk_update, get_bulk_update,
+                             apply_bulk_update)
+from transhette.status import StatusIndex, get_status_index, get_filtered_ids
+from transhette.validation import validate_entries
+from transhette.stats import get_catalog_stats, get_catalogs_stats
+
+
+CATALOG = r'''msgid ""
+msgstr ""
+"Project-Id-Version: transhette tests\n"
+"Language-Team: es\n"
+"MIME-Version: 1.0\n"
+"Content-Type: text/plain; charset=UTF-8\n"
+"Content-Transfer-Encoding: 8bit\n"
+"Plural-Forms: nplurals=2; plural=(n != 1);\n"
+
+#: views.py:1
+msgid "Hello"
+msgstr "Hola"
+
+#: views.py:2
+msgid "Bye"
+msgstr ""
+
+#: views.py:3
+#, fuzzy
+msgid "Yes"
+msgstr "Sí"
+
+#: views.py:4
+msgid "Translation"
+msgstr "Traducción"
+
+#: views.py:5
+msgid "one file"
+msgid_plural "%(count)s files"
+msgstr[0] "un fichero"
+msgstr[1] "%(count)s ficheros"
+
+#: views.py:6
+msgid "Line\n"
+"break"
+msgstr "Salto\n"
+"de línea"
+'''
+
+SOURCE_CATALOG = r'''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\n"
+
+#: new/views.py:1
+msgid "Hello"
+msgstr "Buenas"
+
+#: new/views.py:2
+msgid "Bye"
+msgstr "Adiós"
+
+#: new/views.py:3
+msgid "Yes"
+msgstr "Sí"
+
+#: new/views.py:4
+msgid "Translation"
+msgstr ""
+
+#: new/views.py:7
+msgid "New message"
+msgstr "Mensaje nuevo"
+'''
+
+
+PARSER_CATALOG = r"""# Translator comment
+#, fuzzy
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\n"
+"Plural-Forms: nplurals=2; plural=(n != 1);\n"
+
+# A translator comment
+#. An extracted comment
+#: views.py:1 views.py:2
+#: models.py:10
+#, python-format, fuzzy
+msgid "Quotes \"%s\"\t"
+msgstr "Comillas «%s»\t"
+
+msgid ""
+"Multi "
+"line"
+msgstr ""
+"Varias "
+"líneas"
+
+msgid "one"
+msgid_plural "many"
+msgstr[0] "uno"
+msgstr[1] "muchos"
+
+#~ msgid "Old"
+#~ msgstr "Viejo"
+"""
+
+
+def old_priority_merge(po_destination, po_source, priority=False):
+    """ priority_merge() as it was before MergePlan, the reference of its results """
+    for entry in po_source:
+        e = po_destination.find(entry.msgid)
+        if e:
+            if (not e.translated() or priority) and entry.translated():
+                e.occurrences = entry.occurrences
+                e.comment = entry.comment
+                e.msgstr = entry.msgstr
+                if FUZZY in e.flags:
+                    e.flags.remove(FUZZY)
+        else:
+            po_destination.append(polib.POEntry(msgid=entry.msgid,
+                                                occurrences=entry.occurrences,
+                                                comment=entry.comment,
+                                                msgstr=entry.msgstr))
+    po_destination.save()
+
+
+class CatalogTestCase(unittest.TestCase):
+
+    settings = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='transhette-tests-')
+        self.old_settings = {}
+        for name, value in self.settings.items():
+            self.old_settings[name] = getattr(settings, name, self)
+            setattr(settings, name, value)
+        pocache.clear()
+
+    def tearDown(self):
+        pocache.clear()
+        for name, value in self.old_settings.items():
+            if value is self:
+                delattr(settings, name)
+            else:
+                setattr(settings, name, value)
+        shutil.rmtree(self.directory, True)
+
+    def write_catalog(self, contents=CATALOG, name='django.po'):
+        fpath = os.path.join(self.directory, name)
+        fhandle = open(fpath, 'wb')
+        try:
+            fhandle.write(contents)
+        finally:
+            fhandle.close()
+        return fpath
+
+    def journal_edit(self, fpath, msgid, msgstr):
+        """ An edit journaled by another process """
+        entry = polib.POEntry(msgid=msgid, msgstr=msgstr)
+        journal.append(fpath, [journal.make_record(entry, u'tests')], get_signature(fpath))
+
+    def write_mofile(self, po, name='django.mo'):
+        fpath = os.path.join(self.directory, name)
+        polib.write_file(fpath, MOWriter().compile(po))
+        return fpath
+
+
+class FindIndexTest(CatalogTestCase):
+
+    def setUp(self):
+        super(FindIndexTest, self).setUp()
+        self.po = polib.pofile(self.write_catalog())
+        # builds the indexes
+        self.po.find('Hello')
+        self.po.find('Hola', 'msgstr')
+
+    def assertIndexed(self, po):
+        for by in ('msgid', 'msgstr'):
+            for entry in po:
+                first = [other for other in po if getattr(other, by) == getattr(entry, by)][0]
+                self.failUnless(po.find(getattr(entry, by), by) is first, (by, getattr(entry, by)))
+
+    def test_mutations(self):
+        po = self.po
+        po.find('Bye').msgstr = 'Adiós'
+        self.assertEqual(po.find('Adiós', 'msgstr').msgid, 'Bye')
+        po.find('Hello').msgid = 'Hi'
+        self.assertEqual(po.find('Hello'), None)
+        self.assertEqual(po.find('Hi').msgstr, 'Hola')
+        po.append(polib.POEntry(msgid='Appended', msgstr='Hola'))
+        po.insert(0, polib.POEntry(msgid='Inserted', msgstr='Hola'))
+        self.assertEqual(po.find('Hola', 'msgstr').msgid, 'Inserted')
+        po.remove(po.find('Inserted'))
+        po[1] = polib.POEntry(msgid='Replaced', msgstr='Adiós')
+        del po[-1]
+        po[2:3] = [polib.POEntry(msgid='Sliced')]
+        po.sort(key=lambda entry: entry.msgid)
+        po.reverse()
+        self.assertIndexed(po)
+        self.assertEqual(po.find('Appended'), None)
+        self.assertEqual(po.find('Sliced').msgstr, '')
+
+    def test_removed_entries_are_forgotten(self):
+        entry = self.po.find('Hello')
+        self.po.remove(entry)
+        entry.msgid = 'Bye'
+        self.assertEqual(self.po.find('Bye').msgstr, '')
+
+    def test_entries_dont_keep_files(self):
+        other = polib.POFile()
+        other.extend(self.po)
+        other.find('Hello')
+        ref = weakref.ref(other)
+        del other
+        gc.collect()
+        self.failUnless(ref() is None)
+        self.po.find('Hello').msgid = 'Hi'
+        self.assertEqual(self.po.find('Hi').msgstr, 'Hola')
+
+    def test_working_copy_does_not_index_shared_entries(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        working_copy = get_working_copy(None, fpath)
+        self.assertEqual(working_copy.find('Hello').msgstr, 'Hola')
+        working_copy.edit(working_copy.get_id('Hello')).msgstr = 'Buenas'
+        self.assertEqual(working_copy.find('Hello').msgstr, 'Buenas')
+        self.assertEqual(po.find('Hello').msgstr, 'Hola')
+        self.assertEqual(len(po.find('Bye')._owners), 1)
+
+
+class ValidationTest(CatalogTestCase):
+
+    def setUp(self):
+        super(ValidationTest, self).setUp()
+        self.po = polib.pofile(self.write_catalog())
+
+    def validate(self, **kwargs):
+        return validate_entries(self.po, [polib.POEntry(**kwargs)])
+
+    def test_valid_catalog(self):
+        self.assertEqual(validate_entries(self.po, self.po), [])
+
+    def test_python_format(self):
+        self.assertEqual(self.validate(msgid='%(name)s has %(count)d', msgstr='%(name)s tiene',
+                                       flags=['python-format']),
+                         [u'msgstr "%(name)s tiene": a format specification for argument '
+                          u"'count' doesn't exist in 'msgstr'"])
+        self.assertEqual(len(self.validate(msgid='%s of %d', msgstr='%d de %s', flags=['python-format'])), 2)
+        self.assertEqual(len(self.validate(msgid='%s', msgstr='%y', flags=['python-format'])), 1)
+        self.assertEqual(self.validate(msgid='%s of %d', msgstr='%s de %d', flags=['python-format']), [])
+        # only checked when flagged
+        self.assertEqual(self.validate(msgid='%s', msgstr='%y'), [])
+
+    def test_python_brace_format(self):
+        self.assertEqual(len(self.validate(msgid='{name} {0}', msgstr='{nombre} {0}',
+                                           flags=['python-brace-format'])), 2)
+        self.assertEqual(self.validate(msgid='{name} {0}', msgstr='{0} {name}',
+                                       flags=['python-brace-format']), [])
+
+    def test_newlines(self):
+        self.assertEqual(self.validate(msgid='Line\n', msgstr='Línea'),
+                         [u'msgstr "Línea": \'msgid\' and \'msgstr\' entries do not both end with \'\\n\''])
+        self.assertEqual(len(self.validate(msgid='\nLine', msgstr='Línea')), 1)
+
+    def test_plurals(self):
+        self.assertEqual(len(self.validate(msgid='file', msgid_plural='files',
+                                           msgstr_plural={0: 'a', 1: 'b', 2: 'c'})), 1)
+        # the singular form may leave the number out
+        self.assertEqual(self.validate(msgid='%d file', msgid_plural='%d files',
+                                       msgstr_plural={0: 'un fichero', 1: '%d ficheros'},
+                                       flags=['python-format']), [])
+
+    def test_skipped_entries(self):
+        self.assertEqual(self.validate(msgid='%s', msgstr='', flags=['python-format']), [])
+        self.assertEqual(self.validate(msgid='%s', msgstr='%d', flags=['python-format', 'fuzzy']), [])
+
+    @unittest.skipUnless(find_executable('msgfmt'), 'msgfmt is not installed')
+    def test_msgfmt(self):
+        for msgid, msgstr in (('%s of %d', '%s de %d'), ('%s of %d', '%d de %s'), ('%s', '%y'),
+                              ('%(a)s', '%(a)s'), ('%(a)s', '%(b)s')):
+            po = polib.POFile()
+            po.metadata = {'Content-Type': 'text/plain; charset=UTF-8'}
+            po.append(polib.POEntry(msgid=msgid, msgstr=msgstr, flags=['python-format']))
+            fpath = os.path.join(self.directory, 'check.po')
+            po.save(fpath)
+            process = subprocess.Popen(['msgfmt', '--check-format', '-o', '/dev/null', fpath],
+                                       stderr=subprocess.PIPE)
+            process.communicate()
+            self.assertEqual(bool(validate_entries(po, po)), bool(process.returncode), (msgid, msgstr))
+
+
+class IterPOFileTest(CatalogTestCase):
+
+    def test_entries(self):
+        fpath = self.write_catalog()
+        po = polib.pofile(fpath)
+        entries = polib.iter_pofile(fpath)
+        self.assertEqual(entries.metadata, po.metadata)
+        self.assertEqual(entries.encoding, 'UTF-8')
+        self.assertEqual([str(entry) for entry in entries], [str(entry) for entry in po])
+
+    def test_close(self):
+        entries = polib.iter_pofile(self.write_catalog())
+        self.assertEqual(entries.next().msgid, 'Hello')
+        entries.close()
+        self.assertRaises(StopIteration, entries.next)
+
+    def test_metadata_only(self):
+        entries = polib.iter_pofile(self.write_catalog(CATALOG.split('\n\n')[0] + '\n'))
+        self.assertEqual(entries.metadata['Language-Team'], 'es')
+        self.assertEqual(list(entries), [])
+
+
+class ParserParityTest(CatalogTestCase):
+
+    def get_fields(self, po):
+        return (po.header, po.metadata, po.metadata_is_fuzzy, po.encoding,
+                [(entry.msgid, entry.msgid_plural, entry.msgstr, entry.msgstr_plural, entry.comment,
+                  entry.tcomment, entry.occurrences, entry.flags, entry.obsolete) for entry in po])
+
+    def assertSameParse(self, fpath):
+        fast = polib.pofile(fpath)
+        fsm = polib.pofile(fpath, parser='fsm')
+        self.assertEqual(self.get_fields(fast), self.get_fields(fsm), fpath)
+        self.assertEqual(str(fast), str(fsm), fpath)
+
+    def test_catalogs(self):
+        self.assertSameParse(self.write_catalog())
+        self.assertSameParse(self.write_catalog(PARSER_CATALOG, 'parser.po'))
+        po = polib.pofile(self.write_catalog(PARSER_CATALOG, 'parser.po'))
+        self.assertEqual(po.find('Quotes "%s"\t').occurrences,
+                         [('views.py', '1'), ('views.py', '2'), ('models.py', '10')])
+        self.assertEqual(po.find('Multi line').msgstr, 'Varias líneas')
+        self.assertEqual(po.find('one').msgstr_plural, {'0': 'uno', '1': 'muchos'})
+        self.failUnless(po[-1].obsolete)
+
+    def test_bundled_catalogs(self):
+        locale = os.path.join(os.path.dirname(__file__), 'locale')
+        for lang in os.listdir(locale):
+            fpath = os.path.join(locale, lang, 'LC_MESSAGES', 'django.po')
+            if os.path.isfile(fpath):
+                self.assertSameParse(fpath)
+
+    def test_syntax_errors(self):
+        for contents in ('"orphan"\n', 'msgid "a"\nmsgid "b"\n', 'msgstr "a"\n'):
+            fpath = self.write_catalog(contents, 'broken.po')
+            errors = []
+            for parser in ('fast', 'fsm'):
+                try:
+                    polib.pofile(fpath, parser=parser)
+                except IOError, e:
+                    errors.append(str(e))
+            self.assertEqual(len(errors), 2, contents)
+            self.assertEqual(errors[0], errors[1])
+
+    def test_unknown_parser(self):
+        self.assertRaises(ValueError, polib.pofile, self.write_catalog(), parser='other')
+
+
+class EntrySlotsTest(CatalogTestCase):
+
+    def test_slots(self):
+        for entry in (polib.POEntry(msgid='Hello'), polib.MOEntry(msgid='Hello')):
+            self.failIf(hasattr(entry, '__dict__'))
+            self.assertRaises(AttributeError, setattr, entry, 'other', 1)
+
+    def test_lazy_containers(self):
+        entry = polib.POEntry(msgid='Hello')
+        self.assertEqual((entry._flags, entry._occurrences, entry._msgstr_plural), (None, None, None))
+        self.assertEqual(entry.flags, [])
+        self.assertEqual(entry.msgstr_plural, {})
+        flags = entry.flags
+        flags.append('fuzzy')
+        self.failUnless(entry.flags is flags)
+        entry.occurrences += [('views.py', '1')]
+        entry.msgstr_plural[0] = 'Hola'
+        self.assertEqual(entry.flags, ['fuzzy'])
+        self.assertEqual(entry.occurrences, [('views.py', '1')])
+        self.assertEqual(entry.msgstr_plural, {0: 'Hola'})
+        # a container read before another one was assigned does not replace it
+        entry = polib.POEntry(msgid='Bye')
+        stale = entry.flags
+        entry.flags = ['python-format']
+        stale.append('fuzzy')
+        self.assertEqual(entry.flags, ['python-format'])
+
+    def test_parsed_entries(self):
+        po = polib.pofile(self.write_catalog())
+        self.assertEqual(po.find('Bye')._flags, None)
+        self.assertEqual(po.find('Hello')._msgstr_plural, None)
+        self.failUnless(po.find('Hello').occurrences[0][0] is po.find('Bye').occurrences[0][0])
+
+    def test_pickle_and_copy(self):
+        po = polib.pofile(self.write_catalog())
+        po.find('Hello')
+        for entry in po:
+            for other in (pickle.loads(pickle.dumps(entry, 2)), pickle.loads(pickle.dumps(entry)),
+                          copy.copy(entry), copy.deepcopy(entry)):
+                self.assertEqual(str(other), str(entry))
+                # the files indexing the entry are left behind
+                self.failIf(other._owners)
+        po = pickle.loads(pickle.dumps(po, 2))
+        self.assertEqual(po.find('Hello').msgstr, 'Hola')
+
+
+class MOWriterTest(CatalogTestCase):
+
+    def get_translations(self, fpath):
+        fhandle = open(fpath, 'rb')
+        try:
+            return gettext.GNUTranslations(fhandle)._catalog
+        finally:
+            fhandle.close()
+
+    def assertSameTranslations(self, po, fpath):
+        catalog = self.get_translations(fpath)
+        self.assertEqual(catalog[u'Hello'], u'Hola')
+        self.assertEqual(catalog[u'Translation'], u'Traducción')
+        self.assertEqual(catalog[(u'one file', 0)], u'un fichero')
+        self.assertEqual(catalog[(u'one file', 1)], u'%(count)s ficheros')
+        self.assertEqual(catalog[u'Line\nbreak'], u'Salto\nde línea')
+        self.failIf(u'Bye' in catalog)
+        self.failIf(u'Yes' in catalog)
+        self.assertEqual(len(catalog), len(po.translated_entries()) + 2)
+
+    def test_compile(self):
+        po = polib.pofile(self.write_catalog())
+        self.assertSameTranslations(po, self.write_mofile(po))
+
+    @unittest.skipUnless(find_executable('msgfmt'), 'msgfmt is not installed')
+    def test_msgfmt(self):
+        po_path = self.write_catalog()
+        po = polib.pofile(po_path)
+        msgfmt_path = os.path.join(self.directory, 'msgfmt.mo')
+        subprocess.check_call(['msgfmt', '-o', msgfmt_path, po_path])
+        self.assertEqual(self.get_translations(self.write_mofile(po)), self.get_translations(msgfmt_path))
+        # and the other way round
+        mo = map_mofile(msgfmt_path)
+        try:
+            self.assertEqual(mo.gettext('Hello'), 'Hola')
+            self.assertEqual(mo.gettext('one file'), 'un fichero\0%(count)s ficheros')
+        finally:
+            mo.close()
+
+    def test_incremental_compile(self):
+        po = polib.pofile(self.write_catalog())
+        writer = MOWriter()
+        writer.compile(po)
+        entry = po.find('Hello')
+        entry.msgstr = 'Buenos días'
+        po.metadata['PO-Revision-Date'] = '2011-01-01 00:00+0000'
+        self.assertEqual(writer.compile(po, [entry]), MOWriter().compile(po))
+        # a message that appears
+        entry = po.find('Bye')
+        entry.msgstr = 'Adiós'
+        self.assertEqual(writer.compile(po, [entry]), MOWriter().compile(po))
+        self.assertEqual(self.get_translations(self.write_mofile(po))[u'Bye'], u'Adiós')
+
+    def test_metadata_only(self):
+        po = polib.pofile(self.write_catalog())
+        for entry in po:
+            entry.msgstr = ''
+            entry.msgstr_plural = {}
+        fpath = self.write_mofile(po)
+        self.assertEqual(self.get_translations(fpath).keys(), [u''])
+        mo = polib.mofile(fpath)
+        self.assertEqual(len(mo), 0)
+        self.assertEqual(mo.metadata['Content-Type'], 'text/plain; charset=UTF-8')
+
+
+class MappedMOFileTest(CatalogTestCase):
+
+    def setUp(self):
+        super(MappedMOFileTest, self).setUp()
+        self.po = polib.pofile(self.write_catalog())
+
+    def check_lookups(self, fpath):
+        mo = map_mofile(fpath)
+        try:
+            self.assertEqual(len(mo), len(self.po.translated_entries()))
+            self.assertEqual(mo.metadata['Language-Team'], 'es')
+            self.assertEqual(mo.encoding, 'UTF-8')
+            self.assertEqual(mo.gettext('Hello'), 'Hola')
+            self.assertEqual(mo.find('Translation').msgstr, 'Traducción')
+            self.assertEqual(mo.gettext('Line\nbreak'), 'Salto\nde línea')
+            # plurals, by msgid or by their whole key
+            self.assertEqual(mo.gettext('one file'), 'un fichero\0%(count)s ficheros')
+            self.assertEqual(mo.gettext('one file\0%(count)s files'), 'un fichero\0%(count)s ficheros')
+            self.assertEqual(mo.find('one file').msgid, 'one file\0%(count)s files')
+            # untranslated, fuzzy and unknown messages
+            self.assertEqual(mo.gettext('Bye'), None)
+            self.assertEqual(mo.gettext('Yes'), None)
+            self.assertEqual(mo.gettext('Unknown'), None)
+            self.assertEqual(mo.find('Unknown'), None)
+            # the metadata is not an entry
+            self.assertEqual(mo.find(''), None)
+            self.assertEqual([entry.msgid for entry in mo], [entry.msgid for entry in polib.mofile(fpath)])
+            self.assertRaises(TypeError, mo.append, polib.MOEntry(msgid='Other'))
+        finally:
+            mo.close()
+
+    def test_lookup(self):
+        self.check_lookups(self.write_mofile(self.po))
+
+    def test_lookup_without_hash_table(self):
+        # a hash table size of 0 in the header: binary search
+        contents = MOWriter().compile(self.po)
+        fpath = os.path.join(self.directory, 'nohash.mo')
+        polib.write_file(fpath, contents[:20] + struct.pack('I', 0) + contents[24:])
+        self.check_lookups(fpath)
+
+    def test_bundled_catalogs(self):
+        locale = os.path.join(os.path.dirname(__file__), 'locale')
+        for lang in os.listdir(locale):
+            fpath = os.path.join(locale, lang, 'LC_MESSAGES', 'django.mo')
+            if not os.path.isfile(fpath):
+                continue
+            mo = map_mofile(fpath)
+            try:
+                for entry in polib.mofile(fpath):
+                    self.assertEqual(mo.gettext(entry.msgid), entry.msgstr, (fpath, entry.msgid))
+            finally:
+                mo.close()
+
+
+class AtomicSaveTest(CatalogTestCase):
+
+    def list_files(self):
+        # but the lock files of the catalogs
+        return sorted([name for name in os.listdir(self.directory) if not name.endswith('.lock')])
+
+    def test_write_file(self):
+        fpath = os.path.join(self.directory, 'file.txt')
+        self.failUnless(polib.write_file(fpath, 'contents'))
+        os.chmod(fpath, 0640)
+        inode = os.stat(fpath).st_ino
+        self.failIf(polib.write_file(fpath, 'contents'))
+        self.assertEqual(os.stat(fpath).st_ino, inode)
+        self.failUnless(polib.write_file(fpath, 'other contents', fsync=True))
+        self.assertEqual(open(fpath).read(), 'other contents')
+        self.assertEqual(os.stat(fpath).st_mode & 07777, 0640)
+        self.assertEqual(os.listdir(self.directory), ['file.txt'])
+
+    def test_save_catalog(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        po.find('Bye').msgstr = 'Adiós'
+        save_catalog(po, [po.find('Bye')], fsync=True)
+        self.assertEqual(open(fpath).read(), str(po))
+        self.assertEqual(open(get_mo_path(fpath), 'rb').read(), MOWriter().compile(po))
+        # files that don't change are left alone
+        inodes = [os.stat(path).st_ino for path in (fpath, get_mo_path(fpath))]
+        save_catalog(get_pofile(fpath))
+        self.assertEqual([os.stat(path).st_ino for path in (fpath, get_mo_path(fpath))], inodes)
+        self.assertEqual(self.list_files(), ['django.mo', 'django.po'])
+
+    def test_failed_save(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        po.find('Bye').msgstr = 'Adiós'
+        prepare_file = polib.prepare_file
+
+        def failing_prepare_file(path, contents, fsync=False):
+            if path.endswith('.mo'):
+                raise IOError('No space left on device')
+            return prepare_file(path, contents, fsync)
+        polib.prepare_file = failing_prepare_file
+        try:
+            self.assertRaises(IOError, save_catalog, po)
+        finally:
+            polib.prepare_file = prepare_file
+        self.assertEqual(open(fpath).read(), CATALOG)
+        self.assertEqual(self.list_files(), ['django.po'])
+
+
+class JournalTest(CatalogTestCase):
+
+    settings = {'JOURNAL_HISTORY': True, 'CATALOG_CACHE_MAX_ENTRIES': 10}
+
+    def test_replay(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        self.failUnless(get_pofile(fpath) is po)
+        self.assertEqual(po.find('Bye').msgstr, u'Adiós')
+        # the file is left as it is
+        self.assertEqual(polib.pofile(fpath).find('Bye').msgstr, '')
+
+    def test_replay_after_eviction(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        # catalogs bigger than the cache evict the first one
+        for i in range(2):
+            get_pofile(self.write_catalog(name='other%d.po' % i))
+        self.failIf(get_pofile(fpath) is po)
+        self.assertEqual(get_pofile(fpath).find('Bye').msgstr, u'Adiós')
+        pocache.clear()
+        self.assertEqual(get_pofile(fpath).find('Bye').msgstr, u'Adiós')
+
+    def test_save_after_eviction(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        pocache.clear()
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        po.find('Hello').msgstr = 'Buenas'
+        save_catalog(po, [po.find('Hello')])
+        saved = polib.pofile(fpath)
+        self.assertEqual(saved.find('Hello').msgstr, 'Buenas')
+        self.assertEqual(saved.find('Bye').msgstr, 'Adiós')
+        self.failIf(os.path.exists(journal.get_journal_path(fpath)))
+        self.failUnless('Adi' in open(journal.get_history_path(fpath)).read())
+
+    def test_records_not_saved_are_kept(self):
+        fpath = self.write_catalog()
+        po = polib.pofile(fpath)
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        po.find('Hello').msgstr = 'Buenas'
+        po.save()
+        self.assertEqual(polib.pofile(fpath).find('Bye').msgstr, '')
+        po = get_pofile(fpath)
+        self.assertEqual(po.find('Hello').msgstr, 'Buenas')
+        self.assertEqual(po.find('Bye').msgstr, u'Adiós')
+
+
+class WriteBehindTest(CatalogTestCase):
+
+    settings = {'WRITE_BEHIND_DELAY': 60, 'WRITE_BEHIND_MAX_EDITS': 2}
+
+    def tearDown(self):
+        writebehind.flush()
+        super(WriteBehindTest, self).tearDown()
+
+    def queue_edit(self, fpath, msgid, msgstr):
+        entry = copy_entry(get_pofile(fpath).find(msgid))
+        apply_translation(entry, msgstr)
+        queue_edit(fpath, entry, u'tests')
+
+    def test_queue_and_flush(self):
+        fpath = self.write_catalog()
+        self.queue_edit(fpath, 'Bye', u'Adiós')
+        self.assertEqual(get_pofile(fpath).find('Bye').msgstr, u'Adiós')
+        self.assertEqual(polib.pofile(fpath).find('Bye').msgstr, '')
+        # the second edit reaches WRITE_BEHIND_MAX_EDITS
+        self.queue_edit(fpath, 'Yes', u'Sí')
+        saved = polib.pofile(fpath)
+        self.assertEqual(saved.find('Bye').msgstr, 'Adiós')
+        self.assertEqual(saved.find('Yes').flags, [])
+        self.assertEqual(saved.metadata['Last-Translator'], 'tests')
+        self.failIf(os.path.exists(journal.get_journal_path(fpath)))
+
+    def test_compaction_doesnt_block_other_catalogs(self):
+        first = self.write_catalog(name='first.po')
+        second = self.write_catalog(name='second.po')
+        self.queue_edit(first, 'Bye', u'Adiós')
+        lock = get_lock(first)
+        lock.acquire()
+        try:
+            # waits for the lock of first
+            compaction = threading.Thread(target=writebehind.flush, args=(first, ))
+            compaction.start()
+            time.sleep(0.1)
+            edit = threading.Thread(target=self.queue_edit, args=(second, 'Bye', u'Adiós'))
+            edit.start()
+            edit.join(5)
+            self.failIf(edit.isAlive())
+        finally:
+            lock.release()
+        compaction.join(5)
+        self.assertEqual(polib.pofile(first).find('Bye').msgstr, 'Adiós')
+
+
+class CatalogRegistryTest(CatalogTestCase):
+
+    settings = {'CATALOG_DISCOVERY_INTERVAL': 0}
+
+    def setUp(self):
+        super(CatalogRegistryTest, self).setUp()
+        self.locale = os.path.join(self.directory, 'locale')
+        self.old_settings['LOCALE_PATHS'] = settings.LOCALE_PATHS
+        settings.LOCALE_PATHS = (self.locale, )
+        self.es = self.add_catalog('es')
+        refresh_catalogs()
+
+    def tearDown(self):
+        refresh_catalogs()
+        super(CatalogRegistryTest, self).tearDown()
+
+    def add_catalog(self, lang, name='django.po'):
+        dirname = os.path.join(self.locale, lang, 'LC_MESSAGES')
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        return self.write_catalog(name=os.path.join(dirname, name))
+
+    def touch(self, path):
+        # a second later than it was, whatever the resolution of the file system
+        mtime = os.stat(path).st_mtime + 1
+        os.utime(path, (mtime, mtime))
+
+    def test_find(self):
+        self.assertEqual(find_pos('es')[0], self.es)
+        pt_br = self.add_catalog('pt_BR')
+        refresh_catalogs()
+        self.assertEqual(find_pos('pt-br')[0], pt_br)
+        self.assertEqual(find_pos('xx'), [])
+
+    def test_reuse(self):
+        registry = get_catalog_registry()
+        self.failIf(registry.is_stale())
+        self.failUnless(get_catalog_registry() is registry)
+        self.failIf(get_catalog_registry(include_transhette=True) is registry)
+
+    def test_new_language(self):
+        registry = get_catalog_registry()
+        fr = self.add_catalog('fr')
+        self.failUnless(registry.is_stale())
+        self.assertEqual(find_pos('fr')[0], fr)
+
+    def test_new_catalog(self):
+        registry = get_catalog_registry()
+        djangojs = self.add_catalog('es', 'djangojs.po')
+        self.touch(os.path.dirname(djangojs))
+        self.failUnless(registry.is_stale())
+        self.assertEqual(find_pos('es')[:2], [self.es, djangojs])
+
+    def test_removed_locale(self):
+        registry = get_catalog_registry()
+        shutil.rmtree(self.locale)
+        self.failUnless(registry.is_stale())
+        self.failIf(self.es in find_pos('es'))
+
+    def test_discovery_interval(self):
+        settings.CATALOG_DISCOVERY_INTERVAL = 3600
+        registry = get_catalog_registry()
+        self.add_catalog('fr')
+        self.failUnless(get_catalog_registry() is registry)
+        self.assertEqual(find_pos('fr'), [])
+
+
+class StatsTest(CatalogTestCase):
+
+    def test_stats(self):
+        fpath = self.write_catalog()
+        po = polib.pofile(fpath)
+        self.assertEqual(get_catalog_stats(fpath), {'entries': 6, 'translated': 4, 'fuzzy': 1, 'obsolete': 0,
+                                                    'percent': po.percent_translated()})
+        other = self.write_catalog(PARSER_CATALOG, 'parser.po')
+        stats = get_catalogs_stats([fpath, other])
+        self.assertEqual(stats[fpath]['translated'], 4)
+        self.assertEqual((stats[other]['obsolete'], stats[other]['percent']),
+                         (1, polib.pofile(other).percent_translated()))
+
+    def test_changes(self):
+        fpath = self.write_catalog()
+        self.assertEqual(get_catalog_stats(fpath)['translated'], 4)
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        self.assertEqual(get_catalog_stats(fpath)['translated'], 5)
+        po = get_pofile(fpath)
+        po.find('Hello').msgstr = ''
+        save_catalog(po, [po.find('Hello')])
+        self.assertEqual(get_catalog_stats(fpath)['translated'], 4)
+        # rewritten by someone else
+        self.write_catalog(CATALOG.replace('msgstr "Hola"', 'msgstr ""'))
+        self.assertEqual(get_catalog_stats(fpath)['translated'], 3)
+
+
+class SearchTest(CatalogTestCase):
+
+    def search(self, po, query, occurrences=False):
+        return [po[id].msgid for id in search_catalog(po, query, occurrences)]
+
+    def test_ranks(self):
+        fpath = self.write_catalog()
+        po = get_pofile(fpath)
+        index = get_index(fpath)
+        self.assertEqual(index.search('Hola '), {0: EXACT})
+        self.assertEqual(index.search('file'), {4: WORD})
+        self.assertEqual(index.search('fil'), {4: SUBSTRING})
+        # best ranked first
+        self.assertEqual(self.search(po, 's'), ['one file', 'Yes', 'Translation', 'Line\nbreak'])
+        self.assertEqual(self.search(po, u'LÍNEA'), ['Line\nbreak'])
+        self.assertEqual(self.search(po, ''), [])
+
+    def test_words_and_paths(self):
+        po = get_pofile(self.write_catalog())
+        self.assertEqual(self.search(po, '"file"'), ['one file'])
+        self.assertEqual(self.search(po, '"fil"'), [])
+        self.assertEqual(self.search(po, 'views'), [])
+        self.assertEqual(len(self.search(po, 'views', occurrences=True)), len(po))
+        self.assertEqual(len(self.search(po, 'path:VIEWS.py')), len(po))
+
+    def test_working_copy(self):
+        fpath = self.write_catalog()
+        working_copy = get_working_copy(None, fpath)
+        working_copy.edit(working_copy.get_id('Bye')).msgstr = 'Adiós'
+        working_copy.edit(working_copy.get_id('Hello')).msgstr = 'Buenas'
+        self.assertEqual(self.search(working_copy, 'adiós'), ['Bye'])
+        self.assertEqual(self.search(working_copy, 'hola'), [])
+        self.assertEqual(self.search(get_pofile(fpath), 'adiós'), [])
+
+    def test_updates(self):
+        fpath = self.write_catalog()
+        index = get_index(fpath)
+        po = get_pofile(fpath)
+        po.find('Hello').msgstr = 'Buenas'
+        save_catalog(po, [po.find('Hello')])
+        self.failUnless(get_index(fpath) is index)
+        self.assertEqual(self.search(po, 'buenas'), ['Hello'])
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        self.assertEqual(self.search(get_pofile(fpath), 'adiós'), ['Bye'])
+        # rewritten by someone else
+        self.write_catalog(CATALOG.replace('"Hola"', '"Saludos"'))
+        self.assertEqual(self.search(get_pofile(fpath), 'saludos'), ['Hello'])
+
+
+class LockingTest(CatalogTestCase):
+
+    def test_get_lock(self):
+        fpath = self.write_catalog()
+        self.failUnless(get_lock(fpath) is get_lock(os.path.relpath(fpath)))
+        self.failIf(get_lock(fpath) is get_lock(self.write_catalog(name='other.po')))
+
+    def test_threads(self):
+        lock = get_lock(self.write_catalog())
+        acquired = []
+
+        def acquire():
+            lock.acquire()
+            acquired.append(True)
+            lock.release()
+        lock.acquire()
+        try:
+            # reentrant
+            lock.acquire()
+            lock.release()
+            thread = threading.Thread(target=acquire)
+            thread.start()
+            thread.join(0.1)
+            self.assertEqual(acquired, [])
+        finally:
+            lock.release()
+        thread.join(5)
+        self.assertEqual(acquired, [True])
+
+    @unittest.skipUnless(fcntl, 'fcntl is not available')
+    def test_processes(self):
+        lock = get_lock(self.write_catalog())
+        try_lock = ('import os, sys, fcntl\n'
+                    'fd = os.open(sys.argv[1], os.O_RDWR)\n'
+                    'try:\n'
+                    '    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)\n'
+                    'except IOError:\n'
+                    '    sys.exit(1)\n')
+        lock.acquire()
+        try:
+            self.assertEqual(subprocess.call([sys.executable, '-c', try_lock, lock.lock_path]), 1)
+        finally:
+            lock.release()
+        self.assertEqual(subprocess.call([sys.executable, '-c', try_lock, lock.lock_path]), 0)
+
+
+class VersionCheckTest(CatalogTestCase):
+
+    def edit(self, fpath, msgid, msgstr):
+        working_copy = get_working_copy(None, fpath)
+        working_copy.edit(working_copy.get_id(msgid)).msgstr = msgstr
+        return working_copy
+
+    def test_other_entries_are_kept(self):
+        fpath = self.write_catalog()
+        first = self.edit(fpath, 'Hello', 'Buenas')
+        second = self.edit(fpath, 'Bye', 'Adiós')
+        self.assertEqual(save_working_copy(first).conflicts, [])
+        self.assertEqual(save_working_copy(second).conflicts, [])
+        saved = polib.pofile(fpath)
+        self.assertEqual((saved.find('Hello').msgstr, saved.find('Bye').msgstr), ('Buenas', 'Adiós'))
+
+    def test_conflicts(self):
+        fpath = self.write_catalog()
+        first = self.edit(fpath, 'Hello', 'Buenas')
+        second = self.edit(fpath, 'Hello', 'Saludos')
+        same = self.edit(fpath, 'Hello', 'Buenas')
+        save_working_copy(first)
+        self.assertEqual(save_working_copy(second).conflicts, ['Hello'])
+        self.assertEqual(save_working_copy(same).conflicts, [])
+        self.assertEqual(polib.pofile(fpath).find('Hello').msgstr, 'Buenas')
+        # gone in the meantime
+        removed = self.edit(fpath, 'Bye', 'Adiós')
+        self.write_catalog(CATALOG.replace('msgid "Bye"', 'msgid "Goodbye"'))
+        self.assertEqual(save_working_copy(removed).conflicts, ['Bye'])
+
+    def test_drafts(self):
+        class User(object):
+            pk = 1
+        user = User()
+        fpath = self.write_catalog()
+        save_draft(user, self.edit(fpath, 'Hello', 'Buenas'))
+        try:
+            save_working_copy(self.edit(fpath, 'Bye', 'Adiós'))
+            working_copy = get_working_copy(user, fpath)
+            self.assertEqual(working_copy.conflicts, [])
+            self.assertEqual((working_copy.find('Hello').msgstr, working_copy.find('Bye').msgstr),
+                             ('Buenas', 'Adiós'))
+            save_working_copy(self.edit(fpath, 'Hello', 'Saludos'))
+            self.assertEqual(get_working_copy(user, fpath).conflicts, ['Hello'])
+            # reported once
+            self.assertEqual(get_working_copy(user, fpath).conflicts, [])
+        finally:
+            delete_draft(user, fpath)
+
+
+class StatusIndexTest(CatalogTestCase):
+
+    def get_msgids(self, po, filter_):
+        return [po[id].msgid for id in get_filtered_ids(po, filter_)]
+
+    def test_filters(self):
+        po = get_pofile(self.write_catalog())
+        self.assertEqual(self.get_msgids(po, 'translated'),
+                         ['Hello', 'Translation', 'one file', 'Line\nbreak'])
+        self.assertEqual(self.get_msgids(po, 'untranslated'), ['Bye', 'Yes'])
+        self.assertEqual(self.get_msgids(po, 'fuzzy'), ['Yes'])
+        self.assertEqual(len(get_filtered_ids(po, 'both')), len(po))
+
+    def test_working_copy(self):
+        fpath = self.write_catalog()
+        working_copy = get_working_copy(None, fpath)
+        working_copy.edit(working_copy.get_id('Bye')).msgstr = 'Adiós'
+        # the edits show before they are saved
+        self.assertEqual(self.get_msgids(working_copy, 'untranslated'), ['Yes'])
+        self.assertEqual(self.get_msgids(get_pofile(fpath), 'untranslated'), ['Bye', 'Yes'])
+        save_working_copy(working_copy)
+        self.assertEqual(self.get_msgids(get_pofile(fpath), 'untranslated'), ['Yes'])
+
+    def test_journal_replayed_on_save(self):
+        fpath = self.write_catalog()
+        working_copy = get_working_copy(None, fpath)
+        get_filtered_ids(working_copy, 'both')
+        working_copy.edit(working_copy.get_id('Hello')).msgstr = 'Buenas'
+        # the save replays what the working copy misses
+        pocache.clear()
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        save_catalog(working_copy, [working_copy[id] for id in working_copy.edited_ids])
+        po = get_pofile(fpath)
+        self.assertEqual(po.find('Bye').msgstr, 'Adiós')
+        index = get_status_index(fpath)
+        self.assertEqual(index.signature, get_signature(fpath))
+        self.assertEqual(index.ids, StatusIndex(po, None).ids)
+
+
+class OwnershipTest(CatalogTestCase):
+
+    settings = {'CATALOG_DISCOVERY_INTERVAL': 0}
+
+    def setUp(self):
+        super(OwnershipTest, self).setUp()
+        self.old_settings['LOCALE_PATHS'] = settings.LOCALE_PATHS
+        settings.LOCALE_PATHS = (os.path.join(self.directory, 'first'), os.path.join(self.directory, 'second'))
+        os.makedirs(os.path.join(self.directory, 'first', 'es', 'LC_MESSAGES'))
+        os.makedirs(os.path.join(self.directory, 'second', 'es', 'LC_MESSAGES'))
+        self.first = self.write_catalog(CATALOG.replace('msgid "Bye"', 'msgid "First only"'),
+                                        os.path.join('first', 'es', 'LC_MESSAGES', 'django.po'))
+        self.second = self.write_catalog(name=os.path.join('second', 'es', 'LC_MESSAGES', 'django.po'))
+        refresh_catalogs()
+
+    def tearDown(self):
+        refresh_catalogs()
+        super(OwnershipTest, self).tearDown()
+
+    def test_owners(self):
+        index = get_ownership_index('es')
+        self.assertEqual(index.get_owner('Hello'), self.first)
+        self.assertEqual(index.get_owner('First only'), self.first)
+        self.assertEqual(index.get_owner('Bye'), self.second)
+        self.assertEqual(index.get_owner('Unknown'), None)
+        second = get_pofile(self.second)
+        self.assertEqual(get_owner(second, 'Bye', index), (True, second, None))
+        is_valid, catalog, entry = get_owner(second, 'Hello', index)
+        self.failIf(is_valid)
+        self.assertEqual(catalog.fpath, self.first)
+        self.failUnless(entry is catalog.find('Hello'))
+
+    def test_save(self):
+        index = get_ownership_index('es')
+        po = get_pofile(self.first)
+        po.remove(po.find('Hello'))
+        po.append(polib.POEntry(msgid='Bye', msgstr='Adiós'))
+        save_catalog(po)
+        self.failUnless(get_ownership_index('es') is index)
+        self.assertEqual(index.get_owner('Hello'), self.second)
+        self.assertEqual(index.get_owner('Bye'), self.first)
+
+    def test_changed_on_disk(self):
+        index = get_ownership_index('es')
+        self.write_catalog(CATALOG.replace('msgid "Bye"', 'msgid "Second only"'),
+                           os.path.join('second', 'es', 'LC_MESSAGES', 'django.po'))
+        index = get_ownership_index('es')
+        self.assertNotEqual(index.get_owner('Bye'), self.second)
+        self.assertEqual(index.get_owner('Second only'), self.second)
+
+
+class ConflictIndexTest(CatalogTestCase):
+
+    def test_conflicts(self):
+        po = get_pofile(self.write_catalog())
+        self.assertEqual(ConflictIndex(po, None).get_conflicts(), [])
+        po.find('Bye').msgstr = 'Hola'
+        # fuzzy entries don't conflict
+        po.find('Yes').msgstr = 'Hola'
+        self.assertEqual(ConflictIndex(po, None).get_conflicts(), [(u'Hola', ['Hello', 'Bye'])])
+
+    def test_update(self):
+        fpath = self.write_catalog()
+        index = get_conflict_index(fpath)
+        working_copy = get_working_copy(None, fpath)
+        working_copy.edit(working_copy.get_id('Bye')).msgstr = 'Hola'
+        save_working_copy(working_copy)
+        self.failUnless(get_conflict_index(fpath) is index)
+        self.assertEqual(index.get_conflicts(), [(u'Hola', ['Hello', 'Bye'])])
+        po = get_pofile(fpath)
+        po.find('Hello').msgstr = 'Buenas'
+        save_catalog(po, [po.find('Hello')])
+        self.assertEqual(get_conflict_index(fpath).get_conflicts(), [])
+
+    def test_journal_replayed_on_save(self):
+        fpath = self.write_catalog()
+        index = get_conflict_index(fpath)
+        working_copy = get_working_copy(None, fpath)
+        working_copy.edit(working_copy.get_id('Yes')).flags = []
+        pocache.clear()
+        self.journal_edit(fpath, 'Bye', u'Sí')
+        save_catalog(working_copy, [working_copy[id] for id in working_copy.edited_ids])
+        self.failUnless(get_conflict_index(fpath) is index)
+        self.assertEqual([(msgstr, sorted(msgids)) for msgstr, msgids in index.get_conflicts()],
+                         [(u'Sí', ['Bye', 'Yes'])])
+
+
+class TranslateTagTest(unittest.TestCase):
+
+    class User(object):
+        is_staff = True
+
+    class Request(object):
+        pass
+
+    def setUp(self):
+        translation.activate('es')
+
+    def tearDown(self):
+        translation.deactivate()
+
+    def render(self, msgid, **context):
+        template = Template('{% load transhette_tags %}{% transhette_trans msgid %}')
+        context['msgid'] = msgid
+        return template.render(Context(context))
+
+    def test_lookup(self):
+        class Catalog(object):
+            def __init__(self, messages, fallback=None):
+                self._catalog = messages
+                self._fallback = fallback
+        lookup = TranslatedLookup(Catalog({u'Hello': u'Hola'}, Catalog({u'Hello': u'Hi', u'Bye': u'Adiós'})))
+        self.assertEqual(lookup.get(u'Hello'), u'Hola')
+        self.assertEqual(lookup.get(u'Bye'), u'Adiós')
+        self.assertEqual(lookup.get(u'Yes'), None)
+
+    def test_render(self):
+        user = self.User()
+        request = self.Request()
+        self.assertEqual(self.render('Pick another file', user=user, request=request),
+                         u'<span rel="Pick another file" class="translatable">Selecciona otro archivo</span>')
+        self.assertEqual(self.render('No <translation>', user=user, request=request),
+                         u'<span rel="No &lt;translation&gt;" class="translatable untranslated">'
+                         u'No &lt;translation&gt;</span>')
+        # looked up once per request and language
+        lookups = request.transhette_lookups
+        self.render('Pick another file', user=user, request=request)
+        self.failUnless(request.transhette_lookups['es'] is lookups['es'])
+        # without a request
+        self.assertEqual(self.render('Pick another file', user=user),
+                         u'<span rel="Pick another file" class="translatable">Selecciona otro archivo</span>')
+
+    def test_not_staff(self):
+        user = self.User()
+        user.is_staff = False
+        self.assertEqual(self.render('Pick another file', user=user), u'Selecciona otro archivo')
+        self.assertEqual(self.render('Pick another file'), u'Selecciona otro archivo')
+
+
+class PermissionsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        del permissions._translators[:]
+        self.user = User.objects.create_user('translator', 'translator@example.com', 'secret')
+
+    def tearDown(self):
+        cache.clear()
+        del permissions._translators[:]
+
+    def can_translate(self):
+        # a new user object per request
+        return can_translate(User.objects.get(pk=self.user.pk))
+
+    def test_users(self):
+        self.failIf(can_translate(AnonymousUser()))
+        staff = User.objects.create_user('staff', 'staff@example.com', 'secret')
+        staff.is_staff = True
+        self.failUnless(can_translate(staff))
+        self.failIf(self.can_translate())
+
+    def test_membership(self):
+        self.failIf(self.can_translate())
+        group = Group.objects.create(name=TRANSLATORS_GROUP)
+        self.user.groups.add(group)
+        self.failUnless(self.can_translate())
+        user = User.objects.get(pk=self.user.pk)
+        self.assertNumQueries(0, can_translate, user)
+        group.user_set.remove(self.user)
+        self.failIf(self.can_translate())
+        group.user_set.add(self.user)
+        self.failUnless(self.can_translate())
+        self.user.groups.clear()
+        self.failIf(self.can_translate())
+
+    def test_group_changes(self):
+        group = Group.objects.create(name=TRANSLATORS_GROUP)
+        self.user.groups.add(group)
+        self.failUnless(self.can_translate())
+        group.name = 'former translators'
+        group.save()
+        self.failIf(self.can_translate())
+        group.name = TRANSLATORS_GROUP
+        group.save()
+        self.failUnless(self.can_translate())
+        group.delete()
+        self.failIf(self.can_translate())
+
+
+class ExportTest(CatalogTestCase):
+
+    def test_archive_names(self):
+        self.assertEqual(get_archive_name('/srv/project/shop/locale/es/LC_MESSAGES/django.po'),
+                         'shop/locale/es/LC_MESSAGES/django.po')
+        self.assertEqual(get_archive_name('/locale/es/LC_MESSAGES/django.po'), 'locale/es/LC_MESSAGES/django.po')
+        fpaths = ['/srv/a/shop/locale/es/LC_MESSAGES/django.po',
+                  '/srv/b/shop/locale/es/LC_MESSAGES/django.po',
+                  '/srv/a/blog/locale/es/LC_MESSAGES/django.po',
+                  '/srv/a/blog/locale/es/LC_MESSAGES/djangojs.po']
+        self.assertEqual(get_archive_names(fpaths),
+                         {fpaths[0]: 'a/shop/locale/es/LC_MESSAGES/django.po',
+                          fpaths[1]: 'b/shop/locale/es/LC_MESSAGES/django.po',
+                          fpaths[2]: 'blog/locale/es/LC_MESSAGES/django.po',
+                          fpaths[3]: 'blog/locale/es/LC_MESSAGES/djangojs.po'})
+
+    def test_zip(self):
+        members = [('one.txt', 'one'), ('two/two.txt', 'two' * 1000)]
+        archive = zipfile.ZipFile(StringIO(''.join(iter_zip(members))))
+        self.assertEqual(archive.testzip(), None)
+        self.assertEqual([(name, archive.read(name)) for name in archive.namelist()], members)
+
+    def test_catalogs(self):
+        fpath = self.write_catalog()
+        self.journal_edit(fpath, 'Bye', u'Adiós')
+        archive = zipfile.ZipFile(StringIO(''.join(iter_zip(iter_catalogs_members([fpath])))))
+        name = get_archive_name(fpath)
+        self.assertEqual(archive.namelist(), [name, name[:-3] + '.mo'])
+        po = polib.pofile(fpath)
+        journal.replay(po, journal.read(fpath, get_signature(fpath))[0])
+        self.assertEqual(archive.read(name), str(po))
+        self.assertEqual(archive.read(name[:-3] + '.mo'), MOWriter().compile(po))
+        # not kept in the cache
+        self.assertEqual(pocache._catalogs, {})
+
+
+class BulkUpdateTest(CatalogTestCase):
+
+    settings = {'CATALOG_DISCOVERY_INTERVAL': 0, 'BULK_UPDATE_PROCESSES': 2}
+
+    def setUp(self):
+        super(BulkUpdateTest, self).setUp()
+        self.old_settings['LOCALE_PATHS'] = settings.LOCALE_PATHS
+        settings.LOCALE_PATHS = (os.path.join(self.directory, 'locale'), )
+        os.makedirs(os.path.join(self.directory, 'locale', 'es', 'LC_MESSAGES'))
+        self.django = self.write_catalog(name=os.path.join('locale', 'es', 'LC_MESSAGES', 'django.po'))
+        self.djangojs = self.write_catalog(name=os.path.join('locale', 'es', 'LC_MESSAGES', 'djangojs.po'))
+        refresh_catalogs()
+
+    def tearDown(self):
+        refresh_catalogs()
+        super(BulkUpdateTest, self).tearDown()
+
+    def make_zip(self, members):
+        archive = StringIO()
+        zf = zipfile.ZipFile(archive, 'w')
+        for name, contents in members:
+            zf.writestr(name, contents)
+        zf.close()
+        archive.seek(0)
+        return archive
+
+    def test_extract(self):
+        members = [('app/locale/es/LC_MESSAGES/django.po', CATALOG), ('../evil.po', CATALOG),
+                   ('/etc/evil.po', CATALOG), ('README', 'readme')]
+        directory = tempfile.mkdtemp(dir=self.directory)
+        self.assertEqual(extract_catalogs(self.make_zip(members), directory), [members[0][0]])
+        self.assertEqual(open(os.path.join(directory, 'app', 'locale', 'es', 'LC_MESSAGES', 'django.po')).read(),
+                         CATALOG)
+        self.assertEqual(os.listdir(directory), ['app'])
+        # tarballs
+        archive = StringIO()
+        tf = tarfile.open(fileobj=archive, mode='w:gz')
+        info = tarfile.TarInfo('locale/es/LC_MESSAGES/django.po')
+        info.size = len(CATALOG)
+        tf.addfile(info, StringIO(CATALOG))
+        tf.close()
+        archive.seek(0)
+        self.assertEqual(extract_catalogs(archive, tempfile.mkdtemp(dir=self.directory)),
+                         ['locale/es/LC_MESSAGES/django.po'])
+        self.assertRaises(ValueError, extract_catalogs, StringIO('not an archive'), directory)
+
+    def test_resolve_destination(self):
+        source_path = self.write_catalog(name='source.po')
+        for fpath in (self.django, self.djangojs):
+            self.assertEqual(resolve_destination(get_archive_name(fpath), source_path), fpath)
+        self.assertEqual(resolve_destination('other/locale/fr/LC_MESSAGES/django.po', source_path), None)
+
+    def test_update(self):
+        self.journal_edit(self.django, 'Yes', u'Sí')
+        members = [(get_archive_name(self.django), SOURCE_CATALOG),
+                   (get_archive_name(self.djangojs), SOURCE_CATALOG),
+                   ('other/locale/fr/LC_MESSAGES/django.po', SOURCE_CATALOG)]
+        directory = plan_bulk_update(self.make_zip(members))
+        update = get_bulk_update(directory)
+        self.assertEqual(sorted([plan['fpath'] for plan in update['plans']]), [self.django, self.djangojs])
+        self.assertEqual(update['skipped'], ['other/locale/fr/LC_MESSAGES/django.po'])
+        # translated in the meantime
+        po = get_pofile(self.djangojs)
+        po.find('Translation').msgstr = 'Versión'
+        save_catalog(po)
+        apply_bulk_update(directory)
+        self.failIf(os.path.exists(directory))
+        for fpath in (self.django, self.djangojs):
+            po = polib.pofile(fpath)
+            self.assertEqual(po.find('Bye').msgstr, 'Adiós')
+            self.assertEqual(po.find('New message').msgstr, 'Mensaje nuevo')
+            self.assertEqual(get_pofile(fpath).find('New message').msgstr, 'Mensaje nuevo')
+        self.assertEqual(polib.pofile(self.django).find('Yes').msgstr, 'Sí')
+        self.assertEqual(polib.pofile(self.djangojs).find('Translation').msgstr, 'Versión')
+
+
+class MergePlanTest(CatalogTestCase):
+
+    def merge(self, merge, priority):
+        destination = self.write_catalog(name='destination.po')
+        merge(polib.pofile(destination), polib.pofile(self.write_catalog(SOURCE_CATALOG, 'source.po')), priority)
+        return open(destination).read()
+
+    def test_apply_parity(self):
+        for priority in (False, True):
+            self.assertEqual(self.merge(priority_merge, priority), self.merge(old_priority_merge, priority))
+
+    def test_preview_parity(self):
+        source = polib.pofile(self.write_catalog(SOURCE_CATALOG, 'source.po'))
+        for priority in (False, True):
+            destination = polib.pofile(self.write_catalog(name='destination.po'))
+            plan = MergePlan(source, destination, priority)
+            old_priority_merge(destination, source, priority)
+            merged = polib.pofile(destination.fpath)
+            original = polib.pofile(self.write_catalog())
+            self.assertEqual([entry.msgid for entry in plan.news],
+                             [entry.msgid for entry in merged if original.find(entry.msgid) is None])
+            self.assertEqual(sorted([change['entry'].msgid for change in plan.translation_changes()]),
+                             sorted([entry.msgid for entry in merged
+                                     if original.find(entry.msgid) is not None and
+                                     original.find(entry.msgid).msgstr != entry.msgstr]))
+            self.assertEqual(sorted([change['entry'].msgid for change in plan.changes]),
+                             sorted([entry.msgid for entry in merged
+                                     if original.find(entry.msgid) is not None and
+                                     str(original.find(entry.msgid)) != str(entry)]))
+
+    def test_apply_later(self):
+        source = polib.pofile(self.write_catalog(SOURCE_CATALOG, 'source.po'))
+        plan = MergePlan(source, polib.pofile(self.write_catalog(name='destination.po')))
+        destination = polib.pofile(self.write_catalog(name='destination.po'))
+        # translated in the meantime
+        destination.find('Bye').msgstr = 'Chao'
+        entries = plan.apply(destination)
+        self.assertEqual(destination.find('Bye').msgstr, 'Chao')
+        self.assertEqual(destination.find('Yes').flags, [])
+        self.assertEqual([entry.msgid for entry in entries], ['New message', 'Yes'])
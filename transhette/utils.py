@@ -1,6 +1,14 @@
+import os
+
 from django.conf import settings
 from transhette import settings as transhette_settings
 
 
 def get_setting(name, default=None):
     return getattr(settings, name, getattr(transhette_settings, name, default))
+
+
+def get_signature(fpath):
+    """ Returns the (mtime, size) pair used to tell whether a catalog changed on disk """
+    st = os.stat(fpath)
+    return (st.st_mtime, st.st_size)
@@ -0,0 +1,215 @@
+import re
+from string import Formatter
+
+PYTHON_FORMAT = 'python-format'
+PYTHON_BRACE_FORMAT = 'python-brace-format'
+
+rx_python_directive = re.compile(r'%(?:\((?P<name>[^)]*)\))?[-#0 +]*(?P<width>\*|\d+)?'
+                                 r'(?:\.(?P<precision>\*|\d+)?)?[hlL]?(?P<type>.?)', re.DOTALL)
+rx_nplurals = re.compile(r'nplurals\s*=\s*(\d+)')
+
+PYTHON_TYPES = {}
+for _types, _kind in (('diouxX', 'integer'), ('eEfFgG', 'float'), ('c', 'character'),
+                      ('s', 'string'), ('r', 'object')):
+    for _type in _types:
+        PYTHON_TYPES[_type] = _kind
+
+
+class FormatError(ValueError):
+    pass
+
+
+def validate_entries(po, entries):
+    """
+    In-process replacement for ``msgfmt --check-format``: checks python-format
+    and python-brace-format placeholders, the number of plural forms and
+    leading and trailing newlines of the given entries of po.
+
+    Errors have the layout the views used for msgfmt errors: the offending
+    line of the catalog followed by the reason.
+    """
+    nplurals = get_nplurals(po)
+    errors = []
+    for entry in entries:
+        if 'fuzzy' in entry.flags or entry.obsolete:
+            continue
+        for line, message in check_entry(entry, nplurals):
+            errors.append(u'%s: %s' % (_to_unicode(line, entry.encoding),
+                                       _to_unicode(message, entry.encoding)))
+    return errors
+
+
+def get_nplurals(po):
+    match = rx_nplurals.search(po.metadata.get('Plural-Forms', ''))
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def check_entry(entry, nplurals=None):
+    """ Returns (line, message) pairs for every problem found in entry """
+    problems = []
+    if entry.msgid_plural and entry.msgstr_plural:
+        if nplurals is not None and len(entry.msgstr_plural) != nplurals:
+            line = _get_line(entry, 'msgstr', sorted(entry.msgstr_plural.keys())[0])
+            problems.append((line, "header field 'Plural-Forms' has nplurals = %d, but message has %d plural forms"
+                                   % (nplurals, len(entry.msgstr_plural))))
+        translations = []
+        for index in sorted(entry.msgstr_plural.keys()):
+            if str(index) == '0':
+                msgid = entry.msgid
+            else:
+                msgid = entry.msgid_plural
+            translations.append(('msgstr[%s]' % index, index, msgid, entry.msgstr_plural[index], False))
+    else:
+        translations = [('msgstr', None, entry.msgid, entry.msgstr, True)]
+
+    for name, index, msgid, msgstr, equality in translations:
+        if not msgstr:
+            continue
+        messages = check_newlines(msgid, msgstr, name)
+        if PYTHON_FORMAT in entry.flags:
+            messages.extend(check_python_format(msgid, msgstr, name, equality))
+        if PYTHON_BRACE_FORMAT in entry.flags:
+            messages.extend(check_python_brace_format(msgid, msgstr, name, equality))
+        if messages:
+            line = _get_line(entry, 'msgstr', index)
+            problems.extend([(line, message) for message in messages])
+    return problems
+
+
+def check_newlines(msgid, msgstr, name='msgstr'):
+    messages = []
+    if msgid.startswith('\n') != msgstr.startswith('\n'):
+        messages.append("'msgid' and '%s' entries do not both begin with '\\n'" % name)
+    if msgid.endswith('\n') != msgstr.endswith('\n'):
+        messages.append("'msgid' and '%s' entries do not both end with '\\n'" % name)
+    return messages
+
+
+def check_python_format(msgid, msgstr, name='msgstr', equality=True):
+    """
+    Compares the python-format directives of msgid and msgstr. When equality
+    is False (plural forms) msgstr may omit arguments used in msgid.
+    """
+    try:
+        id_named, id_unnamed = parse_python_format(msgid)
+    except FormatError:
+        # msgfmt does not complain about translations of broken msgids either
+        return []
+    try:
+        str_named, str_unnamed = parse_python_format(msgstr)
+    except FormatError, e:
+        return ["'%s' is not a valid Python format string, unlike 'msgid'. Reason: %s" % (name, e)]
+
+    messages = []
+    if id_named and str_unnamed or id_unnamed and str_named:
+        messages.append("format specifications in 'msgid' expect a %s, those of '%s' expect a %s"
+                        % (id_named and 'mapping' or 'tuple', name, str_named and 'mapping' or 'tuple'))
+    elif id_named or str_named:
+        for arg in sorted(str_named.keys()):
+            if arg not in id_named:
+                messages.append("a format specification for argument '%s', as in '%s', doesn't exist in 'msgid'"
+                                % (arg, name))
+            elif str_named[arg] != id_named[arg]:
+                messages.append("format specifications in 'msgid' and '%s' for argument '%s' are not the same"
+                                % (name, arg))
+        if equality:
+            for arg in sorted(id_named.keys()):
+                if arg not in str_named:
+                    messages.append("a format specification for argument '%s' doesn't exist in '%s'"
+                                    % (arg, name))
+    elif id_unnamed or str_unnamed:
+        if len(id_unnamed) != len(str_unnamed) and (equality or len(str_unnamed) > len(id_unnamed)):
+            messages.append("number of format specifications in 'msgid' and '%s' does not match" % name)
+        else:
+            for i, (id_kind, str_kind) in enumerate(zip(id_unnamed, str_unnamed)):
+                if id_kind != str_kind:
+                    messages.append("format specifications in 'msgid' and '%s' for argument %d are not the same"
+                                    % (name, i + 1))
+    return messages
+
+
+def parse_python_format(text):
+    """
+    Returns the ({name: kind}, [kind, ...]) named and positional arguments used
+    by the %-directives of text, raising FormatError for invalid ones.
+    """
+    named = {}
+    unnamed = []
+    position = text.find('%')
+    while position != -1:
+        match = rx_python_directive.match(text, position)
+        directive_type = match.group('type')
+        if not directive_type:
+            raise FormatError("The string ends in the middle of a directive.")
+        if directive_type != '%':
+            if directive_type not in PYTHON_TYPES:
+                raise FormatError("In the directive number %d, the character '%s' is not a valid conversion specifier."
+                                  % (len(named) + len(unnamed) + 1, directive_type))
+            kind = PYTHON_TYPES[directive_type]
+            name = match.group('name')
+            if name is not None:
+                if name in named and named[name] != kind:
+                    raise FormatError("The directives for argument '%s' use different types." % name)
+                named[name] = kind
+            else:
+                for size in (match.group('width'), match.group('precision')):
+                    if size == '*':
+                        unnamed.append('integer')
+                unnamed.append(kind)
+            if named and unnamed:
+                raise FormatError("The string refers to arguments both through argument names and through unnamed argument specifications.")
+        position = text.find('%', match.end())
+    return named, unnamed
+
+
+def check_python_brace_format(msgid, msgstr, name='msgstr', equality=True):
+    try:
+        id_fields = parse_python_brace_format(msgid)
+    except FormatError:
+        return []
+    try:
+        str_fields = parse_python_brace_format(msgstr)
+    except FormatError, e:
+        return ["'%s' is not a valid Python brace format string, unlike 'msgid'. Reason: %s" % (name, e)]
+    messages = []
+    for field in sorted(str_fields - id_fields):
+        messages.append("a format specification for argument '%s', as in '%s', doesn't exist in 'msgid'"
+                        % (field, name))
+    if equality:
+        for field in sorted(id_fields - str_fields):
+            messages.append("a format specification for argument '%s' doesn't exist in '%s'" % (field, name))
+    return messages
+
+
+def parse_python_brace_format(text):
+    """ Returns the set of argument names (or positions) used by the {}-fields of text """
+    fields = set()
+    auto_number = 0
+    try:
+        for _literal, field_name, _spec, _conversion in Formatter().parse(text):
+            if field_name is None:
+                continue
+            arg = re.split(r'[.\[]', field_name, 1)[0]
+            if arg == '':
+                arg = str(auto_number)
+                auto_number += 1
+            fields.add(arg)
+    except ValueError, e:
+        raise FormatError(str(e))
+    return fields
+
+
+def _get_line(entry, fieldname, plural_index=None):
+    """ First line of the catalog for fieldname, as POEntry.__str__ writes it """
+    if plural_index is None:
+        return entry._str_field(fieldname, '', '', entry.msgstr)[0]
+    return entry._str_field(fieldname, '', '[%s]' % plural_index,
+                            entry.msgstr_plural[plural_index])[0]
+
+
+def _to_unicode(text, encoding):
+    if isinstance(text, str):
+        return text.decode(encoding, 'replace')
+    return text
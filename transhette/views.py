@@ -1,9 +1,6 @@
 import os
 import re
 import datetime
-import tempfile
-import zipfile
-import subprocess
 import unicodedata
 
 from django.conf import settings
@@ -16,107 +13,100 @@ from django.http import Http404, HttpResponseRedirect, HttpResponse
 from django.template import RequestContext
 from django.shortcuts import render_to_response
 from django.utils import simplejson
-from django.utils.encoding import smart_unicode
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext, get_language
-from django.views.decorators.cache import cache_page, never_cache
-from transhette.polib import pofile
-from transhette.forms import (UpdatePoForm, UpdateConfirmationPoForm,
+from django.utils.encoding import smart_unicode
+from django.utils.html import escape
+from django.views.decorators.cache import never_cache
+from transhette.pocache import get_pofile
+from transhette.drafts import (get_working_copy, save_working_copy, save_draft, delete_draft, copy_entry,
+                              get_entry_state, set_entry_state, get_entry_version, get_state_version)
+from transhette.forms import (UpdatePoForm, UpdateConfirmationPoForm, BulkUpdatePoForm,
                            _get_path_file, _get_lang_by_file)
-from transhette.poutil import find_pos, pagination_range, priority_merge, get_changes
+from transhette.poutil import find_pos, pagination_range, MergePlan
 from transhette.utils import get_setting
+from transhette.validation import validate_entries
+from transhette.stats import get_catalogs_stats
+from transhette.search import search_catalog
+from transhette.status import get_filtered_ids
+from transhette.ownership import get_owner, get_ownership_index
+from transhette.writebehind import apply_translation, queue_edit, flush
+from transhette.conflicts import get_translation_conflicts, get_reference_language, get_catalog_path
+from transhette.permissions import can_translate
+from transhette.export import iter_zip, iter_catalog_members, iter_catalogs_members, get_archive_name
+from transhette.bulk import (plan_bulk_update, get_bulk_update, apply_bulk_update, discard_bulk_update,
+                             apply_catalog_merge, store_merge_plan, get_merge_plan, discard_merge_plan)
 import transhette
 
 ADMIN_PREFIX = settings.STATIC_URL + 'admin/'
 
-def search_msg_id_in_other_pos(msg_list, lang, pofile_path):
-    pofile_paths = find_pos(lang, include_djangos=get_setting('INCLUDE_DJANGOS'), include_transhette=get_setting('INCLUDE_TRANSHETTE'))
-    pofiles = []
-    for path in pofile_paths:
-        pofiles.append(pofile(path))
-
+def search_msg_id_in_other_pos(msg_list, lang, pofile_path, index=None):
+    if index is None:
+        index = get_ownership_index(lang, include_djangos=get_setting('INCLUDE_DJANGOS'),
+                                    include_transhette=get_setting('INCLUDE_TRANSHETTE'))
     for msg in msg_list:
-        for p in pofiles:
-            valid_entry = None
-            valid_catalog = p
-            if p.fpath == pofile_path.fpath:
-                is_valid = True
-                break
-            msgid = msg['message'].msgid
-            entry = p.find(msgid)
-            if entry:
-                is_valid = False
-                valid_entry = entry
-                break
+        is_valid, valid_catalog, valid_entry = get_owner(pofile_path, msg['message'].msgid, index)
         msg.update({'is_valid': is_valid,
                     'valid_catalog': valid_catalog,
                     'valid_entry': valid_entry})
     return msg_list
 
 
-def validate_format(pofile):
-    errors = []
-    handle, temp_file = tempfile.mkstemp()
-    os.close(handle)
-    pofile.save(temp_file)
-
-    cmd = ['msgfmt', '--check-format', temp_file, '--output-file', '-']
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    _out, err = process.communicate()
-    if process.returncode != 0:
-        input_lines = open(temp_file, 'r').readlines()
-        error_lines = err.strip().split('\n')
-        # discard last line since it only says the number of fatal errors
-        error_lines = error_lines[:-1]
-
-        def format_error_line(line):
-            parts = line.split(':')
-            if len(parts) == 3:
-                line_number = int(parts[1])
-                text = input_lines[line_number - 1]
-                return text + ': ' + parts[2]
-            else:
-                return 'Unknown error: ' + line
-
-        errors = [format_error_line(line) for line in error_lines if line]
-
-    os.unlink(temp_file)
-    return errors
-
-
-def reload_catalog_in_session(request, file_path=None):
-    """ Reload transhette catalog in session """
-    if file_path is None:
-        file_path = request.session['transhette_i18n_fn']
+class MessageList(object):
+    """
+    Sequence of the rows of the translation view for the entries ids of po. The
+    rows (native message and validity against the other catalogs included)
+    are only built for the slices that are read, the page shown by Paginator.
+    """
 
-    po = pofile(file_path)
-    for i in range(len(po)):
-        po[i].id = i
+    def __init__(self, po, ids, lang, native_po=None):
+        self.po = po
+        self.ids = ids
+        self.lang = lang
+        self.native_po = native_po
+        # OwnershipIndex of lang, looked up once for every row read
+        self.ownership_index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.get_rows(self.ids[key])
+        return self.get_rows([self.ids[key]])[0]
+
+    def get_rows(self, ids):
+        rows = []
+        for id in ids:
+            row = dict(message=self.po[id], version=get_entry_version(self.po[id]))
+            if self.native_po is not None:
+                row['native_message'] = self.native_po.find(row['message'].msgid)
+            rows.append(row)
+        if self.ownership_index is None:
+            self.ownership_index = get_ownership_index(self.lang, include_djangos=get_setting('INCLUDE_DJANGOS'),
+                                                       include_transhette=get_setting('INCLUDE_TRANSHETTE'))
+        return search_msg_id_in_other_pos(rows, self.lang, self.po, self.ownership_index)
+
+
+def report_conflicts(request, msgids):
+    """ Tells the translator about the translations of msgids that were not saved """
+    for msgid in msgids:
+        messages.warning(request, ugettext(u"\"%s\" was changed by someone else meanwhile, your translation was not saved")
+                                  % escape(smart_unicode(msgid)))
+
+
+def validate_format(pofile, entries=None):
+    """ Checks the format of entries (every entry by default) of pofile """
+    if entries is None:
+        entries = pofile
+    return validate_entries(pofile, entries)
+
+
+def reload_catalog_in_session(request, file_path):
+    """ Selects the catalog to translate, discarding its unsaved edits.
+        Only the path is kept in session, catalogs are read through the catalog cache """
     request.session['transhette_i18n_fn'] = file_path
-    request.session['transhette_i18n_pofile'] = po
-    request.session['transhette_i18n_mtime'] = os.stat(file_path)[-2]
-
-
-def reload_if_catalog_updated(request, polling=False):
-    """ Compares modification time of catalog file with session last modification time, and reload if necessary
-        This will avoid main concurrence problems """
-    file_path = request.session['transhette_i18n_fn']
-    try:
-        file_mtime = os.stat(file_path)[-2]
-    except:
-        file_mtime = 0
-    session_mtime = request.session.get('transhette_i18n_mtime')
-    if polling:
-        while session_mtime and file_mtime < session_mtime:
-            try:
-                file_mtime = os.stat(file_path)[-2]
-            except:
-                file_mtime = 0
-            reload_catalog_in_session(request)
-            session_mtime = request.session.get('transhette_i18n_mtime')
-    else:
-        if not session_mtime or file_mtime > session_mtime:
-            reload_catalog_in_session(request)
+    delete_draft(request.user, file_path)
 
 
 def set_new_translation(request):
@@ -133,26 +123,19 @@ def set_new_translation(request):
 
     lang = get_language()
     pos = find_pos(lang, include_djangos=True, include_transhette=True)
-    if pos:
-        for file_po in pos:
-            candidate = pofile(file_po)
-            poentry = candidate.find(msgid)
-            if poentry:
-                selected_pofile = candidate
-                poentry.msgstr = msgstr
-                po_filename = file_po
-                break
-        format_errors = validate_format(selected_pofile)
-        if not format_errors:
-            try:
-                selected_pofile.metadata['Last-Translator'] = unicodedata.normalize('NFKD', u"%s %s <%s>" %(request.user.first_name, request.user.last_name, request.user.email)).encode('ascii', 'ignore')
-                selected_pofile.metadata['X-Translated-Using'] = str("django-transhette %s" % transhette.get_version(False))
-                selected_pofile.metadata['PO-Revision-Date'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M%z')
-            except UnicodeDecodeError:
-                pass
-            selected_pofile.save()
-            selected_pofile.save_as_mofile(po_filename.replace('.po', '.mo'))
-            message='OK'
+    for file_po in pos:
+        poentry = get_pofile(file_po).find(msgid)
+        if poentry:
+            # the cached catalog is shared: the edit is made on a copy, and
+            # saved like the ajax ones once it is valid
+            edited_entry = copy_entry(poentry)
+            apply_translation(edited_entry, msgstr)
+            if not validate_format(get_pofile(file_po), [edited_entry]):
+                queue_edit(file_po, edited_entry,
+                           u"%s %s <%s>" % (request.user.first_name, request.user.last_name, request.user.email))
+                flush(file_po)
+                message='OK'
+            break
 
     return render_to_response('transhette/inline_demo_result.html',
                               {'message': message},
@@ -239,12 +222,15 @@ def home(request):
 
     version = transhette.get_version(True)
     if 'transhette_i18n_fn' in request.session:
-        # if another translator has updated catalog... we will reload this
-        reload_if_catalog_updated(request)
-
         transhette_i18n_fn = request.session.get('transhette_i18n_fn')
-        transhette_i18n_pofile = request.session.get('transhette_i18n_pofile')
-        transhette_i18n_native_pofile = request.session.get('transhette_i18n_native_pofile')
+        # catalog as saved on disk plus the unsaved edits of this translator
+        transhette_i18n_pofile = get_working_copy(request.user, transhette_i18n_fn)
+        report_conflicts(request, transhette_i18n_pofile.conflicts)
+        transhette_i18n_native_fn = request.session.get('transhette_i18n_native_fn')
+        if transhette_i18n_native_fn:
+            transhette_i18n_native_pofile = get_pofile(transhette_i18n_native_fn)
+        else:
+            transhette_i18n_native_pofile = None
         transhette_i18n_lang_code = request.session.get('transhette_i18n_lang_code')
         transhette_i18n_lang_bidi = (transhette_i18n_lang_code in settings.LANGUAGES_BIDI)
         transhette_i18n_write = request.session.get('transhette_i18n_write', True)
@@ -256,7 +242,7 @@ def home(request):
             lang_frag = '/%s/'
             for i in xrange(len(pos)):
                 if transhette_i18n_pofile.fpath.replace( lang_frag % transhette_i18n_lang_code,
-                                                        lang_frag % language[0]) == pofile(pos[i]).fpath:
+                                                        lang_frag % language[0]) == pos[i]:
                     position = i
             if position is not None:
                 languages.append((language[0], _(language[1]), position))
@@ -286,25 +272,40 @@ def home(request):
         if '_next' in request.POST:
             rx=re.compile(r'^m_([0-9]+)')
             rx_plural=re.compile(r'^m_([0-9]+)_([0-9]+)')
-            file_change = False
+            posted = {}
             for k in request.POST.keys():
                 if rx_plural.match(k):
                     id=int(rx_plural.match(k).groups()[0])
                     idx=int(rx_plural.match(k).groups()[1])
-                    transhette_i18n_pofile[id].msgstr_plural[str(idx)] = fix_nls(transhette_i18n_pofile[id].msgid_plural[idx], request.POST.get(k))
-                    file_change = True
+                    entry = transhette_i18n_pofile[id]
+                    state = posted.setdefault(id, get_entry_state(entry))
+                    state['msgstr_plural'][str(idx)] = fix_nls(entry.msgid_plural[idx], request.POST.get(k))
                 elif rx.match(k):
                     id=int(rx.match(k).groups()[0])
-                    transhette_i18n_pofile[id].msgstr = fix_nls(transhette_i18n_pofile[id].msgid, request.POST.get(k))
-                    file_change = True
-                if file_change and 'fuzzy' in transhette_i18n_pofile[id].flags:
-                    transhette_i18n_pofile[id].flags.remove('fuzzy')
-
-            format_errors = validate_format(transhette_i18n_pofile)
+                    entry = transhette_i18n_pofile[id]
+                    state = posted.setdefault(id, get_entry_state(entry))
+                    state['msgstr'] = fix_nls(entry.msgid, request.POST.get(k))
+            file_change = False
+            conflicts = []
+            for id, state in posted.items():
+                shown_version = request.POST.get('v_%d' % id)
+                current_version = get_entry_version(transhette_i18n_pofile[id])
+                if shown_version and shown_version != current_version:
+                    # changed by someone else since the page was shown: keep
+                    # that change unless the translator changed it too
+                    if get_state_version(state) not in (shown_version, current_version):
+                        conflicts.append(transhette_i18n_pofile[id].msgid)
+                    continue
+                entry = transhette_i18n_pofile.edit(id)
+                set_entry_state(entry, state)
+                if 'fuzzy' in entry.flags:
+                    entry.flags.remove('fuzzy')
+                file_change = True
+
+            format_errors = validate_format(transhette_i18n_pofile,
+                                            [transhette_i18n_pofile[id] for id in transhette_i18n_pofile.edited_ids])
 
             if file_change and transhette_i18n_write and not format_errors:
-                reload_if_catalog_updated(request, polling=True)
-
                 try:
                     transhette_i18n_pofile.metadata['Last-Translator'] = unicodedata.normalize('NFKD', u"%s %s <%s>" %(request.user.first_name, request.user.last_name, request.user.email)).encode('ascii', 'ignore')
                     transhette_i18n_pofile.metadata['X-Translated-Using'] = str("django-transhette %s" % transhette.get_version(False))
@@ -312,9 +313,9 @@ def home(request):
                 except UnicodeDecodeError:
                     pass
                 try:
-                    mo_path = transhette_i18n_fn.replace('.po', '.mo')
-                    transhette_i18n_pofile.save()
-                    transhette_i18n_pofile.save_as_mofile(mo_path)
+                    transhette_i18n_pofile = save_working_copy(transhette_i18n_pofile)
+                    conflicts.extend(transhette_i18n_pofile.conflicts)
+                    delete_draft(request.user, transhette_i18n_fn)
 
                     # Try auto-reloading via the WSGI daemon mode reload mechanism
                     if get_setting('WSGI_AUTO_RELOAD') and\
@@ -329,11 +330,13 @@ def home(request):
 
                 except:
                     request.session['transhette_i18n_write'] = False
+                    save_draft(request.user, transhette_i18n_pofile)
 
-                request.session['transhette_i18n_pofile'] = transhette_i18n_pofile
-                request.session['transhette_i18n_native_pofile'] = transhette_i18n_native_pofile
-
+                report_conflicts(request, conflicts)
                 return HttpResponseRedirect(reverse('transhette-home') + query_arg)
+            else:
+                report_conflicts(request, conflicts)
+                save_draft(request.user, transhette_i18n_pofile)
 
 
         transhette_i18n_lang_name = _(request.session.get('transhette_i18n_lang_name'))
@@ -344,49 +347,24 @@ def home(request):
 
         if 'query' in request.REQUEST and request.REQUEST.get('query', '').strip():
             query = request.REQUEST.get('query').strip()
-            try:
-                rx = re.compile(re.escape(query), re.IGNORECASE)
-            except re.error:
-                rx = None
-
-            matched_entries = []
-            if rx:
-                for e in transhette_i18n_pofile:
-                    entry_text = smart_unicode(e.msgstr) + smart_unicode(e.msgid)
-                    if get_setting('SEARCH_INTO_OCCURRENCES'):
-                        entry_text += u''.join([o[0] for o in e.occurrences])
-                    if rx.search(entry_text):
-                        matched_entries.append(e)
-                if transhette_i18n_native_pofile:
-                    for e in transhette_i18n_native_pofile:
-                        entry_text = smart_unicode(e.msgstr) + smart_unicode(e.msgid)
-                        if get_setting('SEARCH_INTO_OCCURRENCES'):
-                            entry_text += u''.join([o[0] for o in e.occurrences])
-                        if rx.search(entry_text):
-                            lang_entry = transhette_i18n_pofile.find(e.msgid)
-                            if lang_entry and not lang_entry in matched_entries:
-                                matched_entries.append(lang_entry)
-            pofile_to_paginate = matched_entries
+            occurrences = get_setting('SEARCH_INTO_OCCURRENCES')
+            ids = search_catalog(transhette_i18n_pofile, query, occurrences)
+            if transhette_i18n_native_pofile:
+                matched_ids = set(ids)
+                for position in search_catalog(transhette_i18n_native_pofile, query, occurrences):
+                    id = transhette_i18n_pofile.get_id(transhette_i18n_native_pofile[position].msgid)
+                    if id is not None and id not in matched_ids:
+                        matched_ids.add(id)
+                        ids.append(id)
         else:
-            if transhette_i18n_filter == 'both':
-                pofile_to_paginate = transhette_i18n_pofile
-
-            elif transhette_i18n_filter == 'untranslated':
-                pofile_to_paginate = transhette_i18n_pofile.untranslated_entries()
-
-            elif transhette_i18n_filter == 'translated':
-                pofile_to_paginate = transhette_i18n_pofile.translated_entries()
-
-            elif transhette_i18n_filter == 'fuzzy':
-                pofile_to_paginate = transhette_i18n_pofile.fuzzy_entries()
+            ids = get_filtered_ids(transhette_i18n_pofile, transhette_i18n_filter)
 
         if get_setting('SHOW_NATIVE_LANGUAGE') and transhette_i18n_native_pofile:
-            to_paginate = [dict(message=message, native_message=transhette_i18n_native_pofile.find(message.msgid)) \
-                            for message in pofile_to_paginate]
+            messages_to_paginate = MessageList(transhette_i18n_pofile, ids, transhette_i18n_lang_code,
+                                               transhette_i18n_native_pofile)
         else:
-            to_paginate = [dict(message=message) for message in pofile_to_paginate]
-
-        paginator = Paginator(to_paginate, get_setting('MESSAGES_PER_PAGE'))
+            messages_to_paginate = MessageList(transhette_i18n_pofile, ids, transhette_i18n_lang_code)
+        paginator = Paginator(messages_to_paginate, get_setting('MESSAGES_PER_PAGE'))
 
         if 'page' in request.GET and int(request.GET.get('page')) <= paginator.num_pages and int(request.GET.get('page')) > 0:
             page = int(request.GET.get('page'))
@@ -399,7 +377,6 @@ def home(request):
             default_column_name = False
 
         message_list = paginator.page(page).object_list
-        message_list = search_msg_id_in_other_pos(message_list, transhette_i18n_lang_code, transhette_i18n_pofile)
         needs_pagination = paginator.num_pages > 1
         if needs_pagination:
             if paginator.num_pages >= 10:
@@ -432,42 +409,34 @@ home = user_passes_test(lambda user: can_translate(user), settings.LOGIN_URL)(ho
 home = never_cache(home)
 
 
+def zip_response(members, filename):
+    """
+    Response that sends the zip archive of members (see export.iter_zip()) as
+    it is built. Django buffers it anyway when USE_ETAGS is set.
+    """
+    response = HttpResponse(iter_zip(members))
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    response['Content-Type'] = 'application/x-zip'
+    return response
+
+
 def download_file(request):
     # original filename
     transhette_i18n_fn=request.session.get('transhette_i18n_fn', None)
-    # in-session modified catalog
-    transhette_i18n_pofile = request.session.get('transhette_i18n_pofile', None)
     # language code
     transhette_i18n_lang_code = request.session.get('transhette_i18n_lang_code', None)
 
-    if not transhette_i18n_lang_code or not transhette_i18n_pofile or not transhette_i18n_fn:
+    if not transhette_i18n_lang_code or not transhette_i18n_fn:
         return HttpResponseRedirect(reverse('transhette-home'))
     try:
+        # catalog including the unsaved edits
+        transhette_i18n_pofile = get_working_copy(request.user, transhette_i18n_fn)
         if len(transhette_i18n_fn.split(os.sep)) >= 5:
             offered_fn = '_'.join(transhette_i18n_fn.split(os.sep)[-5:])
         else:
             offered_fn = transhette_i18n_fn.split(os.sep)[-1]
-        # filenames
-        tmpdir=tempfile.gettempdir()
-        zip_fn = str(os.path.join(tmpdir, '%s.%s.zip' % (offered_fn, transhette_i18n_lang_code)))
-        po_fn = str(os.path.join(tmpdir, transhette_i18n_fn.split(os.sep)[-1]))
-        mo_fn = str(po_fn.replace('.po', '.mo')) # not so smart, huh
-        transhette_i18n_pofile.save(po_fn)
-        transhette_i18n_pofile.save_as_mofile(mo_fn)
-        zf = zipfile.ZipFile(zip_fn, 'w')
-        zf.write(po_fn, str(po_fn.split(os.sep)[-1]))
-        zf.write(mo_fn, str(mo_fn.split(os.sep)[-1]))
-        zf.close()
-
-        response = HttpResponse(open(zip_fn, 'rb').read())
-        response['Content-Disposition'] = 'attachment; filename=%s.%s.zip' %(offered_fn, transhette_i18n_lang_code)
-        response['Content-Type'] = 'application/x-zip'
-
-        os.unlink(zip_fn)
-        os.unlink(po_fn)
-        os.unlink(mo_fn)
-
-        return response
+        members = iter_catalog_members(transhette_i18n_pofile, get_archive_name(transhette_i18n_fn, 1))
+        return zip_response(members, '%s.%s.zip' % (offered_fn, transhette_i18n_lang_code))
     except Exception:
         import traceback;traceback.print_exc()
         return HttpResponseRedirect(reverse('transhette-home'))
@@ -476,6 +445,27 @@ download_file=user_passes_test(lambda user: can_translate(user), '/admin/')(down
 download_file=never_cache(download_file)
 
 
+def download_catalogs(request, langid=None):
+    """
+    Downloads every catalog of langid, or of every language, in a zip
+    archive that keeps their paths (e.g. app/locale/es/LC_MESSAGES/django.po)
+    """
+    if langid is None:
+        languages = [l[0] for l in settings.LANGUAGES]
+    elif langid in [l[0] for l in settings.LANGUAGES]:
+        languages = [langid]
+    else:
+        raise Http404
+    do_django = 'django' in request.GET or get_setting('INCLUDE_DJANGOS')
+    do_transhette = 'transhette' in request.GET or get_setting('INCLUDE_TRANSHETTE')
+    fpaths = []
+    for language in languages:
+        fpaths.extend(find_pos(language, include_djangos=do_django, include_transhette=do_transhette))
+    return zip_response(iter_catalogs_members(fpaths), 'catalogs.%s.zip' % (langid or 'all'))
+download_catalogs=user_passes_test(lambda user: can_translate(user), '/admin/')(download_catalogs)
+download_catalogs=never_cache(download_catalogs)
+
+
 def list_languages(request):
     """
     Lists the languages for the current project, the gettext catalog files
@@ -488,10 +478,11 @@ def list_languages(request):
     for language in settings.LANGUAGES:
         pos = find_pos(language[0], include_djangos=do_django, include_transhette=do_transhette)
         has_pos = has_pos or len(pos)
+        stats = get_catalogs_stats(pos)
         languages.append(
             (language[0],
             _(language[1]),
-            [(os.path.realpath(l), pofile(l)) for l in pos],
+            [(os.path.realpath(l), stats[l]) for l in pos],
             )
         )
     ADMIN_MEDIA_PREFIX = ADMIN_PREFIX
@@ -538,11 +529,9 @@ def lang_sel(request, langid, idx):
             file_locale_path[-3] = native_lang
             native_file_ = os.path.sep.join(file_locale_path)
             if os.path.isfile(native_file_):
-                native_po = pofile(native_file_)
-                for i in range(len(native_po)):
-                    native_po[i].id = i
-
-                request.session['transhette_i18n_native_pofile'] = native_po
+                request.session['transhette_i18n_native_fn'] = native_file_
+            else:
+                request.session.pop('transhette_i18n_native_fn', None)
 
         try:
             os.utime(file_, None)
@@ -554,20 +543,6 @@ lang_sel=user_passes_test(lambda user: can_translate(user), '/admin/')(lang_sel)
 lang_sel=never_cache(lang_sel)
 
 
-def can_translate(user):
-    if not user.is_authenticated():
-        return False
-    elif user.is_superuser or user.is_staff:
-        return True
-    else:
-        try:
-            from django.contrib.auth.models import Group
-            translators = Group.objects.get(name='translators')
-            return translators in user.groups.all()
-        except Group.DoesNotExist:
-            return False
-
-
 def update_catalogue(request, no_confirmation=False):
     return update(request, catalogue=True, no_confirmation=no_confirmation)
 
@@ -579,24 +554,24 @@ def update(request, catalogue=False, no_confirmation=False):
         data = request.POST
         files = request.FILES
 
-    pofile = None
+    po_path = None
     if catalogue:
-        pofile = request.session.get('transhette_i18n_pofile')
+        po_path = request.session['transhette_i18n_fn']
 
-    form = UpdatePoForm(pofile=pofile, data=data, files=files)
+    form = UpdatePoForm(po_path=po_path, data=data, files=files)
 
     if form.is_valid():
-        po_tmp, po_dest_file, priority = form.save_temporal_file()
+        po_tmp, po_dest_path, priority = form.save_temporal_file()
         if no_confirmation:
-            merge(po_tmp, po_dest_file, priority)
+            merge(po_tmp, po_dest_path, priority)
             redirect_to = reverse('transhette.views.home')
         else:
             request.session['transhette_update_confirmation'] = {
                 'po_tmp': po_tmp.fpath,
-                'po_dest_file': po_dest_file.fpath,
+                'po_dest_file': po_dest_path,
                 'priority': priority,
                 'filename': form.cleaned_data['file'].name,
-                'lang': _get_lang_by_file(po_dest_file.fpath),
+                'lang': _get_lang_by_file(po_dest_path),
             }
 
             redirect_to = reverse('transhette.views.update_confirmation')
@@ -616,25 +591,33 @@ def update_confirmation(request):
     up_conf = request.session.get('transhette_update_confirmation')
     priority = up_conf['priority']
     filename = up_conf['filename']
-    pofile_tmp = pofile(up_conf['po_tmp'])
-    pofile_dest_file = pofile(up_conf['po_dest_file'])
 
-    if form.is_valid():
-        priority = up_conf['priority']
-        merge(pofile_tmp, pofile_dest_file, priority)
+    merge_plan = None
+    if 'plan' in up_conf:
+        merge_plan = get_merge_plan(up_conf['plan'])
+    if form.is_valid() and merge_plan is not None:
+        del request.session['transhette_update_confirmation']
+        discard_merge_plan(up_conf['plan'])
+        if 'cancel' not in request.POST:
+            # the changes that were confirmed
+            apply_catalog_merge(merge_plan, up_conf['po_dest_file'])
         redirect_to = reverse('transhette.views.home')
         return HttpResponseRedirect(redirect_to)
     else:
         lang = up_conf['lang']
         list_lang = find_pos(lang, include_djangos=False, include_transhette=False)
         lang_index = list_lang.index(up_conf['po_dest_file'])
+        pofile_tmp = get_pofile(up_conf['po_tmp'], cache=False)
         posible_path = _get_path_file(pofile_tmp, filename)
-        news_entries, changes_entries = get_changes(pofile_tmp,
-                                                   pofile_dest_file, priority)
+        plan = MergePlan(pofile_tmp, get_pofile(up_conf['po_dest_file']), priority)
+        # the plan is kept on disk, only its path goes in the session
+        if 'plan' in up_conf:
+            discard_merge_plan(up_conf['plan'])
+        up_conf['plan'] = store_merge_plan(plan)
+        request.session.modified = True
     return render_to_response('transhette/update_confirmation.html',
                             {'form': form,
-                             'news_entries': news_entries,
-                             'changes_entries': changes_entries,
+                             'plan': plan,
                              'po_dest_file': up_conf['po_dest_file'],
                              'priority': priority,
                              'posible_path': posible_path,
@@ -644,66 +627,79 @@ def update_confirmation(request):
                             context_instance=RequestContext(request))
 
 
-def merge(po_tmp, po_dest_file, priority):
-    po_tmp = pofile(po_tmp.fpath)
-    priority_merge(po_dest_file, po_tmp, priority)
+def merge(po_tmp, po_dest_path, priority):
+    """ Merges po_tmp into the catalog po_dest_path, see bulk.apply_catalog_merge() """
+    apply_catalog_merge(MergePlan(po_tmp, get_pofile(po_dest_path), priority), po_dest_path)
+
+
+def bulk_update(request):
+    """
+    Uploads a zip file or a tarball of catalogs to merge into the project
+    catalogs, after confirming the changes of all of them at once
+    """
+    data = None
+    files = None
+    if request.method == 'POST':
+        data = request.POST
+        files = request.FILES
+    form = BulkUpdatePoForm(data=data, files=files)
+    if form.is_valid():
+        previous = request.session.pop('transhette_bulk_update', None)
+        if previous is not None:
+            discard_bulk_update(previous)
+        # the catalogs that download_catalogs() includes
+        do_django = 'django' in request.GET or get_setting('INCLUDE_DJANGOS')
+        do_transhette = 'transhette' in request.GET or get_setting('INCLUDE_TRANSHETTE')
+        request.session['transhette_bulk_update'] = plan_bulk_update(form.cleaned_data['file'],
+                                                                     form.cleaned_data['priority'],
+                                                                     form.cleaned_data['language'],
+                                                                     do_django, do_transhette)
+        return HttpResponseRedirect(reverse('transhette-bulk-confirmation'))
+    return render_to_response('transhette/update_file.html',
+                              {'form': form,
+                              'ADMIN_MEDIA_PREFIX': ADMIN_PREFIX},
+                              context_instance=RequestContext(request))
+bulk_update=user_passes_test(lambda user: can_translate(user), '/admin/')(bulk_update)
+bulk_update=never_cache(bulk_update)
+
+
+def bulk_update_confirmation(request):
+    directory = request.session.get('transhette_bulk_update')
+    if directory is None or not os.path.isdir(directory):
+        return HttpResponseRedirect(reverse('transhette-bulk-update'))
+    data = None
+    if request.method == 'POST':
+        data = request.POST
+    form = UpdateConfirmationPoForm(data=data)
+    if form.is_valid():
+        del request.session['transhette_bulk_update']
+        if 'cancel' in request.POST:
+            discard_bulk_update(directory)
+        else:
+            apply_bulk_update(directory)
+        return HttpResponseRedirect(reverse('transhette-pick-file'))
+    update = get_bulk_update(directory)
+    plans = [plan for plan in update['plans'] if plan['merge'].news or plan['merge'].changes]
+    return render_to_response('transhette/update_bulk_confirmation.html',
+                              {'form': form,
+                               'plans': plans,
+                               'unchanged': len(update['plans']) - len(plans),
+                               'skipped': update['skipped'],
+                               'ADMIN_MEDIA_PREFIX': ADMIN_PREFIX},
+                              context_instance=RequestContext(request))
+bulk_update_confirmation=user_passes_test(lambda user: can_translate(user), '/admin/')(bulk_update_confirmation)
+bulk_update_confirmation=never_cache(bulk_update_confirmation)
 
 
-@cache_page(60 * 60 * 24)
 def translation_conflicts(request):
     """ Returns a conflict msgid list. Same msgstr translations from different msgids """
-    locale_path = os.path.join(settings.BASEDIR, 'locale')
-    po_dict = {}
-    # fill pofile_dict
-    for lang, _lang_name in settings.LANGUAGES:
-        po = pofile(os.path.join(locale_path, lang, 'LC_MESSAGES', 'django.po'))
-        po_dict[lang] = po
-        # reference po file catalog. used to find conflicts
-        main_po = po_dict['es']
-        msgstr_list = [entry.msgstr for entry in main_po]
-        msgid_list = [entry.msgid for entry in main_po]
-
-    conflicts = []
-    for msgstr in msgstr_list:
-        indexes = []
-        index = -1
-        try:
-            while True:
-                index = msgstr_list.index(msgstr, index+1)
-                entry = main_po.find(msgid_list[index])
-                if entry.translated() and not entry.msgid_plural:
-                    indexes.append(index)
-        except ValueError:
-            pass
-        if len(indexes) == 0:
-            continue # not present. usually msgstr was a database value
-        elif len(indexes) > 1:
-            # conflict happends. two or more msgid are translated into same msgstr
-            conflict = {}
-            conflict['msgstr'] = msgstr
-            conflict['conflict_list'] = []
-            for i in indexes:
-                msgid = msgid_list[i]
-                main_entry = main_po.find(msgid)
-                item = {
-                    'msgid': msgid,
-                    'entries': [],
-                    'occurrences': [],
-                }
-                for lang, po in po_dict.items():
-                    entry = po.find(msgid)
-                    if entry.translated():
-                        item['entries'].append(
-                            {'lang': lang, 'entry': entry},
-                        )
-                for occurrence in main_entry.occurrences:
-                    item['occurrences'].append(
-                        {'file': occurrence[0], 'line': occurrence[1]},
-                    )
-                conflict['conflict_list'].append(item)
-            conflicts.append(conflict)
+    lang = request.GET.get('lang') or get_reference_language()
+    if lang not in [code for code, _name in settings.LANGUAGES] or not os.path.isfile(get_catalog_path(lang)):
+        raise Http404
     return render_to_response('transhette/translation_conflicts.html',
-                              {'conflicts': conflicts,
+                              {'conflicts': get_translation_conflicts(lang),
+                               'lang': lang,
+                               'LANGUAGES': settings.LANGUAGES,
                                'ADMIN_MEDIA_PREFIX': ADMIN_PREFIX},
                               context_instance=RequestContext(request))
 
@@ -752,7 +748,7 @@ def ajax(request):
                 translation[key.replace('translation_', '')]=value
     msgid = request.GET.get('msgid', None)
     try:
-        po_file = pofile(catalog)
+        po_file = get_pofile(catalog)
         entry = po_file.find(msgid)
     except:
         po_file = None
@@ -761,31 +757,25 @@ def ajax(request):
        or not po_file or not entry:
         raise Http404
 
-    saved = False
+    queued = False
     if isinstance(translation, dict):
-        for key, item in translation.items():
-            entry.msgstr_plural[key] = fix_nls(entry.msgid_plural, item)
+        fixed_translation = dict([(key, fix_nls(entry.msgid_plural, item)) for key, item in translation.items()])
     else:
-        entry.msgstr = fix_nls(entry.msgid, translation)
-    if 'fuzzy' in entry.flags:
-        entry.flags.remove('fuzzy')
+        fixed_translation = fix_nls(entry.msgid, translation)
+    # the edit is journaled, the catalog is saved later with the next ones
+    edited_entry = copy_entry(entry)
+    apply_translation(edited_entry, fixed_translation)
     transhette_i18n_write = request.session.get('transhette_i18n_write', True)
-    format_errors = validate_format(po_file)
+    format_errors = validate_format(po_file, [edited_entry])
     if transhette_i18n_write and not format_errors:
         try:
-            po_file.metadata['Last-Translator'] = unicodedata.normalize('NFKD', u"%s %s <%s>" %(request.user.first_name, request.user.last_name, request.user.email)).encode('ascii', 'ignore')
-            po_file.metadata['X-Translated-Using'] = str("django-transhette %s" % transhette.get_version(False))
-            po_file.metadata['PO-Revision-Date'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M%z')
-        except UnicodeDecodeError:
-            pass
-        try:
-            po_file.save()
-            po_file.save_as_mofile(po_file.fpath.replace('.po', '.mo'))
-            saved = True
-        except:
+            queue_edit(catalog, edited_entry,
+                       u"%s %s <%s>" % (request.user.first_name, request.user.last_name, request.user.email))
+            queued = True
+        except (IOError, OSError):
             pass
 
-    json_dict = simplejson.dumps({'saved': saved,
+    json_dict = simplejson.dumps({'queued': queued,
                                   'translation': translation})
     return HttpResponse(json_dict, mimetype='text/javascript')
 
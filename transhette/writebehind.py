@@ -0,0 +1,137 @@
+import os
+import atexit
+import datetime
+import threading
+
+from django.utils.encoding import smart_str
+
+from transhette import polib, journal
+from transhette.pocache import get_signature, invalidate
+from transhette.moutil import save_catalog
+from transhette.locking import get_lock
+from transhette.utils import get_setting
+import transhette
+
+
+def apply_translation(entry, translation):
+    """ Sets translation (a msgstr, or a {index: msgstr} dict for plural entries) to entry """
+    if isinstance(translation, dict):
+        for key, msgstr in translation.items():
+            entry.msgstr_plural[key] = msgstr
+    else:
+        entry.msgstr = translation
+    if 'fuzzy' in entry.flags:
+        entry.flags.remove('fuzzy')
+
+
+class PendingCatalog(object):
+    """ Compaction scheduled for a catalog with a journal written by this process """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.edits = 0
+        self.timer = None
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+
+def compact(fpath):
+    """
+    Writes the records of the edit journal of fpath to the catalog (and its
+    .mo) with a single save, and retires the journal. They are applied to a
+    copy of the catalog, the cached one is shared with the requests being
+    served and is parsed again from the saved file.
+    """
+    lock = get_lock(fpath)
+    lock.acquire()
+    try:
+        signature = get_signature(fpath)
+        records, offset = journal.read(fpath, signature)
+        if not records:
+            journal.retire(fpath, signature)
+            return
+        po = polib.pofile(fpath)
+        po.journal_offset = offset
+        entries = journal.replay(po, records)
+        po.metadata['Last-Translator'] = smart_str(records[-1]['user'], 'ascii', errors='ignore')
+        po.metadata['X-Translated-Using'] = str("django-transhette %s" % transhette.get_version(False))
+        po.metadata['PO-Revision-Date'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M%z')
+        try:
+            save_catalog(po, entries)
+        finally:
+            invalidate(fpath)
+        if get_signature(fpath) == signature:
+            # nothing changed in the file, so the journal is still the current one
+            journal.retire(fpath)
+    finally:
+        lock.release()
+
+
+_lock = threading.RLock()
+# absolute path -> PendingCatalog
+_pending = {}
+
+
+def queue_edit(fpath, entry, user):
+    """
+    Journals the translation and flags of entry, an edited copy of an entry
+    of the catalog fpath, and schedules the compaction of the journal:
+    WRITE_BEHIND_DELAY seconds after the first edit, or as soon as there are
+    WRITE_BEHIND_MAX_EDITS of them.
+    """
+    fpath = os.path.abspath(fpath)
+    lock = get_lock(fpath)
+    lock.acquire()
+    try:
+        journal.append(fpath, [journal.make_record(entry, user)], get_signature(fpath),
+                       get_setting('CATALOG_FSYNC'))
+    finally:
+        lock.release()
+    # _lock only guards _pending, catalogs are compacted holding their own lock
+    _lock.acquire()
+    try:
+        pending = _pending.get(fpath)
+        if pending is None:
+            pending = _pending[fpath] = PendingCatalog(fpath)
+        pending.edits += 1
+        due = pending.edits >= get_setting('WRITE_BEHIND_MAX_EDITS')
+        if due:
+            del _pending[fpath]
+            pending.cancel()
+        elif pending.timer is None:
+            pending.timer = threading.Timer(get_setting('WRITE_BEHIND_DELAY'), flush, [fpath])
+            pending.timer.setDaemon(True)
+            pending.timer.start()
+    finally:
+        _lock.release()
+    if due:
+        compact(fpath)
+
+
+def flush(fpath=None):
+    """
+    Compacts the journal of the catalog fpath, whoever wrote it, or the
+    journals of every catalog edited by this process.
+    """
+    _lock.acquire()
+    try:
+        if fpath is None:
+            fpaths = _pending.keys()
+        else:
+            fpaths = [os.path.abspath(fpath)]
+        flushed = []
+        for fpath in fpaths:
+            pending = _pending.pop(fpath, None)
+            if pending is not None:
+                pending.cancel()
+            flushed.append((fpath, pending))
+    finally:
+        _lock.release()
+    for fpath, pending in flushed:
+        if pending is not None or journal.get_size(fpath):
+            compact(fpath)
+
+atexit.register(flush)